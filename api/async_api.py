@@ -0,0 +1,141 @@
+import asyncio
+import collections
+import time
+
+import async_timeout
+from aiohttp import web
+from marshmallow import ValidationError
+
+from api.helpers import record_request
+from api.modules import attestations
+from config import settings
+from logic.async_attestation_service import AsyncVerificationService
+from logic.service_utils import ServiceError
+
+AsyncResource = collections.namedtuple('AsyncResource', [
+    'method', 'handler', 'request_schema', 'response_schema',
+    'with_remote_address'
+])
+
+
+def remote_address(request):
+    """
+    Address of the client, as werkzeug's ProxyFix reports it for the WSGI app.
+    """
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    if forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+    return request.remote
+
+
+async def handle_async_request(data, handler, request_schema, response_schema,
+                               **context):
+    """
+    Coroutine counterpart of api.helpers.handle_request, returning an aiohttp
+    response with the same body and status code.
+
+    The handler is given REQUEST_DEADLINE seconds, after which its provider
+    calls are cancelled.
+    """
+    try:
+        req = request_schema().load(data)
+        with async_timeout.timeout(settings.REQUEST_DEADLINE or None):
+            resp = await handler(**req, **context)
+        return web.json_response(response_schema().dump(resp.data))
+    except ValidationError as validation_err:
+        return web.json_response({
+            'errors': validation_err.normalized_messages()
+        }, status=400)
+    except ServiceError as service_err:
+        return web.json_response({
+            'errors': [str(service_err)]
+        }, status=service_err.status_code)
+    except asyncio.TimeoutError:
+        return web.json_response({
+            'errors': ['Request deadline exceeded.']
+        }, status=503)
+
+
+async def _request_data(request):
+    if request.method == 'GET':
+        return request.query
+    try:
+        return await request.json()
+    except ValueError:
+        # Loading None fails validation, like a missing body on the WSGI app
+        return None
+
+
+def _view(path, resource):
+    async def view(request):
+        start = time.perf_counter()
+        status = 500
+        context = {}
+        if resource.with_remote_address:
+            context['remote_ip_address'] = remote_address(request)
+        try:
+            response = await handle_async_request(
+                await _request_data(request), resource.handler,
+                resource.request_schema, resource.response_schema, **context)
+            status = response.status
+            return response
+        finally:
+            record_request(path, status, time.perf_counter() - start)
+    return view
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """
+    Same CORS policy flask_cors applies to /api/* on the WSGI app: any origin,
+    with credentials.
+    """
+    origin = request.headers.get('Origin')
+    if request.method == 'OPTIONS' and origin:
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = request.headers.get(
+            'Access-Control-Request-Method', 'GET, POST')
+        allow_headers = request.headers.get('Access-Control-Request-Headers')
+        if allow_headers:
+            response.headers['Access-Control-Allow-Headers'] = allow_headers
+    else:
+        response = await handler(request)
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+resources = {
+    'phone/generate-code': AsyncResource(
+        'POST', AsyncVerificationService.send_phone_verification,
+        attestations.PhoneVerificationCodeRequest,
+        attestations.PhoneVerificationCodeResponse, False),
+    'phone/verify': AsyncResource(
+        'POST', AsyncVerificationService.verify_phone,
+        attestations.VerifyPhoneRequest,
+        attestations.VerifyPhoneResponse, True),
+    'facebook/auth-url': AsyncResource(
+        'GET', AsyncVerificationService.facebook_auth_url,
+        attestations.FacebookAuthUrlRequest,
+        attestations.FacebookAuthUrlResponse, False),
+    'facebook/verify': AsyncResource(
+        'POST', AsyncVerificationService.verify_facebook,
+        attestations.VerifyFacebookRequest,
+        attestations.VerifyFacebookResponse, True),
+    'airbnb/generate-code': AsyncResource(
+        'GET', AsyncVerificationService.generate_airbnb_verification_code,
+        attestations.AirbnbRequest,
+        attestations.AirbnbVerificationCodeResponse, False),
+    'airbnb/verify': AsyncResource(
+        'POST', AsyncVerificationService.verify_airbnb,
+        attestations.VerifyAirbnbRequest,
+        attestations.VerifyAirbnbResponse, True)
+}
+
+
+def init_routes(app):
+    for path, resource in resources.items():
+        path = '/api/attestations/' + path
+        app.router.add_route(resource.method, path, _view(path, resource))
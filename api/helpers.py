@@ -1,8 +1,13 @@
-from flask import jsonify, request
+import json
+import time
+from collections import deque
+
+from flask import Response, jsonify, request, stream_with_context
 from marshmallow import Schema, ValidationError
 
 from config import settings
 from logic.service_utils import ServiceError
+from util import metrics
 
 
 class StandardRequest(Schema):
@@ -29,6 +34,28 @@ def safe_handler(call):
 
 
 def handle_request(data, handler, request_schema, response_schema):
+    start = time.perf_counter()
+    status = 500
+    try:
+        result = _handle_request(data, handler, request_schema,
+                                 response_schema)
+        status = result[1] if isinstance(result, tuple) else result.status_code
+        return result
+    finally:
+        record_request(request.url_rule.rule, status,
+                       time.perf_counter() - start)
+
+
+def record_request(endpoint, status, seconds):
+    """
+    Records the latency of a request to the API path endpoint in the
+    http.request histogram, and its status in the http.responses counters.
+    """
+    metrics.histogram('http.request', endpoint=endpoint).observe(seconds)
+    metrics.counter('http.responses', endpoint=endpoint, status=status).inc()
+
+
+def _handle_request(data, handler, request_schema, response_schema):
     try:
         req = request_schema().load(data)
         resp = handler(**req)
@@ -49,6 +76,76 @@ def handle_request(data, handler, request_schema, response_schema):
         return response
 
 
+def handle_stream_request(lines, handler, request_schema, response_schema):
+    """
+    Newline delimited JSON counterpart of handle_request.
+
+    Each input line is loaded with request_schema and the valid records are
+    passed lazily to handler, which yields one result per record in order.
+    Results are streamed back as newline delimited JSON, each carrying the
+    number of the input line it answers. A line that fails validation gets an
+    error line of its own instead of failing the whole request.
+
+    Requests are recorded like those of handle_request, with their latency
+    running until the last line is streamed.
+    """
+    start = time.perf_counter()
+    endpoint = request.url_rule.rule
+    pending = deque()
+    errors = deque()
+
+    def records():
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = request_schema().loads(line)
+            except ValidationError as validation_err:
+                errors.append({
+                    'line': number,
+                    'errors': validation_err.normalized_messages()
+                })
+                continue
+            except ValueError:
+                errors.append({'line': number, 'errors': ['Invalid JSON.']})
+                continue
+            pending.append(number)
+            yield record
+
+    try:
+        results = handler(records())
+    except ValidationError as validation_err:
+        response = jsonify({
+            'errors': validation_err.normalized_messages()
+        })
+        response.status_code = 400
+        record_request(endpoint, 400, time.perf_counter() - start)
+        return response
+    except Exception:
+        record_request(endpoint, 500, time.perf_counter() - start)
+        raise
+
+    def generate():
+        # The 200 is already sent, but a stream that breaks off is counted
+        # as failed
+        status = 500
+        try:
+            for result in results:
+                while errors:
+                    yield json.dumps(errors.popleft()) + '\n'
+                body = response_schema().dump(result)
+                body['line'] = pending.popleft()
+                yield json.dumps(body) + '\n'
+            while errors:
+                yield json.dumps(errors.popleft()) + '\n'
+            status = 200
+        finally:
+            record_request(endpoint, status, time.perf_counter() - start)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
 def internal_api(method):
     """
     Decorator for internal API routes.
@@ -1,6 +1,8 @@
 from flask import request
 from flask_restful import Resource
-from marshmallow import fields
+from marshmallow import fields, validate
+from database.models import AttestationTypes
+from logic.attestation_query_service import AttestationQueryService
 from logic.attestation_service import VerificationService
 from api.helpers import StandardRequest, StandardResponse, handle_request
 
@@ -92,6 +94,10 @@ class AirbnbRequest(StandardRequest):
     airbnbUserId = fields.Str(required=True)
 
 
+class VerifyAirbnbRequest(AirbnbRequest):
+    wait = fields.Integer(missing=0, validate=validate.Range(min=0))
+
+
 class AirbnbVerificationCodeResponse(StandardResponse):
     code = fields.Str()
 
@@ -102,6 +108,35 @@ class VerifyAirbnbResponse(StandardResponse):
     data = fields.Str()
 
 
+class ListAttestationsRequest(StandardRequest):
+    eth_address = fields.Str(required=True, data_key='identity')
+    method = fields.Str(missing=None, validate=validate.OneOf(
+        [method.name.lower() for method in AttestationTypes]))
+    cursor = fields.Str(missing=None)
+    limit = fields.Integer(missing=20, validate=validate.Range(min=1, max=100))
+
+
+class AttestationSummary(StandardResponse):
+    method = fields.Str()
+    claim_type = fields.Integer(data_key='claim-type')
+    signature = fields.Str()
+    created_at = fields.DateTime(data_key='created-at')
+
+
+class ListAttestationsResponse(StandardResponse):
+    attestations = fields.Nested(AttestationSummary, many=True)
+    next_cursor = fields.Str(data_key='next-cursor')
+
+
+class Attestations(Resource):
+    def get(self):
+        return handle_request(
+            data=request.values,
+            handler=AttestationQueryService.list_attestations,
+            request_schema=ListAttestationsRequest,
+            response_schema=ListAttestationsResponse)
+
+
 class PhoneVerificationCode(Resource):
     def post(self):
         return handle_request(
@@ -188,11 +223,12 @@ class VerifyAirbnb(Resource):
         return handle_request(
             data=request.json,
             handler=VerificationService.verify_airbnb,
-            request_schema=AirbnbRequest,
+            request_schema=VerifyAirbnbRequest,
             response_schema=VerifyAirbnbResponse)
 
 
 resources = {
+    '': Attestations,
     'phone/generate-code': PhoneVerificationCode,
     'phone/verify': VerifyPhone,
     'email/generate-code': EmailVerificationCode,
@@ -0,0 +1,85 @@
+from flask import request
+from flask_restful import Resource
+from marshmallow import fields, validate
+from logic.signing_service import SigningService
+from api.helpers import (
+    StandardRequest,
+    StandardResponse,
+    handle_request,
+    handle_stream_request,
+    internal_api
+)
+
+# Maximum number of attestations in a single verify request. The endpoint is
+# public, and each signer recovery can take milliseconds of CPU
+MAX_VERIFY_BATCH_SIZE = 100
+
+
+class SignClaimRequest(StandardRequest):
+    eth_address = fields.Str(required=True, data_key='identity')
+    claim_type = fields.Integer(required=True, data_key='claim-type',
+                                validate=validate.Range(min=0, max=2**256 - 1))
+    data = fields.Str(required=True)
+
+
+class SignClaimResponse(StandardResponse):
+    eth_address = fields.Str(data_key='identity')
+    claim_type = fields.Integer(data_key='claim-type')
+    data = fields.Str()
+    signature = fields.Str()
+    errors = fields.List(fields.Str())
+
+
+class VerifySignatureRequest(StandardRequest):
+    eth_address = fields.Str(required=True, data_key='identity')
+    claim_type = fields.Integer(required=True, data_key='claim-type',
+                                validate=validate.Range(min=0, max=2**256 - 1))
+    data = fields.Str(required=True)
+    signature = fields.Str(required=True)
+
+
+class VerifySignaturesRequest(StandardRequest):
+    issuer = fields.Str(missing=None)
+    attestations = fields.Nested(
+        VerifySignatureRequest, many=True, required=True,
+        validate=validate.Length(min=1, max=MAX_VERIFY_BATCH_SIZE))
+
+
+class VerifySignatureResult(StandardResponse):
+    valid = fields.Boolean()
+    signer = fields.Str()
+    errors = fields.List(fields.Str())
+
+
+class VerifySignaturesResponse(StandardResponse):
+    issuer = fields.Str()
+    results = fields.Nested(VerifySignatureResult, many=True)
+
+
+@internal_api
+def sign_claims(claims):
+    return SigningService.sign_claims(claims)
+
+
+class SignClaims(Resource):
+    def post(self):
+        return handle_stream_request(
+            lines=request.stream,
+            handler=sign_claims,
+            request_schema=SignClaimRequest,
+            response_schema=SignClaimResponse)
+
+
+class VerifySignatures(Resource):
+    def post(self):
+        return handle_request(
+            data=request.json,
+            handler=SigningService.verify_signatures,
+            request_schema=VerifySignaturesRequest,
+            response_schema=VerifySignaturesResponse)
+
+
+resources = {
+    'sign': SignClaims,
+    'verify': VerifySignatures
+}
@@ -4,9 +4,11 @@ import sys
 import flask_migrate
 
 from config import settings
-from database import db
+from database import REPLICA, db
 from flask_session import Session
 from api import start_restful_api
+from logic.attestation_service import provider_urls
+from util import deadline, http_client, tasks
 
 
 class AppConfig(object):
@@ -15,9 +17,18 @@ class AppConfig(object):
     CSRF_ENABLED = True
 
     SQLALCHEMY_DATABASE_URI = settings.DATABASE_URL
+    SQLALCHEMY_BINDS = {
+        REPLICA: settings.DATABASE_REPLICA_URL
+    } if settings.DATABASE_REPLICA_URL else None
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
 
+    SQLALCHEMY_POOL_SIZE = settings.DATABASE_POOL_SIZE
+    SQLALCHEMY_MAX_OVERFLOW = settings.DATABASE_MAX_OVERFLOW
+    SQLALCHEMY_POOL_RECYCLE = settings.DATABASE_POOL_RECYCLE
+    SQLALCHEMY_POOL_PRE_PING = settings.DATABASE_POOL_PRE_PING
+    SQLALCHEMY_PGBOUNCER = settings.DATABASE_PGBOUNCER
+
 
 def init_api(app):
     start_restful_api(app)
@@ -28,6 +39,8 @@ def init_app(app):
     sess.init_app(app)
     db.init_app(app)
     flask_migrate.Migrate(app, db, directory='database/migrations')
+    tasks.init_app(app)
+    deadline.init_app(app)
 
 
 # App initialization only appropriate for dev/production but not tests.
@@ -36,6 +49,9 @@ def init_prod_app(app):
     init_app(app)
     init_api(app)
 
+    if settings.HTTP_WARM_UP:
+        http_client.warm_up(provider_urls)
+
     # Setup logging.
     if not settings.DEBUG:
         # This logs to stdout which is appropriate for Heroku,
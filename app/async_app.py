@@ -0,0 +1,31 @@
+from aiohttp import web
+
+from api.async_api import cors_middleware, init_routes
+from logic import async_attestation_service
+from util import async_http_client, metrics
+
+
+async def _close(app):
+    await async_http_client.close()
+    async_attestation_service.shutdown()
+
+
+async def _metrics(request):
+    if not metrics.scrape_allowed(request.headers.get('Authorization')):
+        raise web.HTTPUnauthorized()
+    return web.Response(
+        body=metrics.exposition().encode('utf-8'),
+        headers={'Content-Type': metrics.EXPOSITION_CONTENT_TYPE})
+
+
+def create_app():
+    """
+    aiohttp application serving the session-less verification endpoints.
+    Database access goes through the Flask app, which must be configured
+    first.
+    """
+    app = web.Application(middlewares=[cors_middleware])
+    init_routes(app)
+    app.router.add_get('/metrics', _metrics)
+    app.on_cleanup.append(_close)
+    return app
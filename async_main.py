@@ -0,0 +1,25 @@
+from aiohttp import web
+
+from app import app
+from app import app_config
+from app.async_app import create_app
+from config import settings
+from util import patches, signing_pool
+
+# Silence pyflakes
+assert patches
+
+# Fork the signing workers before any request thread is started
+signing_pool.start_pool()
+app_config.init_prod_app(app)
+
+if __name__ == '__main__':
+    host = None
+    port = None
+    if settings.BIND_HOST:
+        if ':' in settings.BIND_HOST:
+            host, port_str = settings.BIND_HOST.split(':')
+            port = int(port_str)
+        else:
+            host = settings.HOST
+    web.run_app(create_app(), host=host, port=port)
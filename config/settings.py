@@ -57,6 +57,24 @@ FLASK_SECRET_KEY = get_env_default('FLASK_SECRET_KEY')
 
 DATABASE_URL = get_env_default('DATABASE_URL')
 TEST_DATABASE_URL = get_env_default('TEST_DATABASE_URL')
+# Read-only queries are sent to this database when set
+DATABASE_REPLICA_URL = get_env_default('DATABASE_REPLICA_URL')
+
+# Request threads of the waitress web process, passed to it by the Procfile
+WAITRESS_THREADS = int(get_env_default('WAITRESS_THREADS') or 4)
+# Database connections each process keeps open, one per request thread by
+# default, and how many more background threads such as the write-behind
+# writer may open beyond that. The async app's database work runs on
+# ASYNC_EXECUTOR_THREADS threads, which DATABASE_POOL_SIZE should match.
+DATABASE_POOL_SIZE = int(get_env_default('DATABASE_POOL_SIZE') or WAITRESS_THREADS)
+DATABASE_MAX_OVERFLOW = int(get_env_default('DATABASE_MAX_OVERFLOW') or 2)
+# Seconds after which a pooled connection is replaced, and whether one is
+# checked before use
+DATABASE_POOL_RECYCLE = int(get_env_default('DATABASE_POOL_RECYCLE') or 1800)
+DATABASE_POOL_PRE_PING = parse_bool(get_env_default('DATABASE_POOL_PRE_PING') or 'true')
+# Set when DATABASE_URL is a PgBouncer in transaction pooling mode, which
+# then does the pooling
+DATABASE_PGBOUNCER = parse_bool(get_env_default('DATABASE_PGBOUNCER'))
 
 TEMPLATE_ROOT = os.path.join(PROJECTPATH, 'templates')
 STATIC_ROOT = os.path.join(PROJECTPATH, 'static')
@@ -67,13 +85,40 @@ FACEBOOK_CLIENT_SECRET = get_env_default('FACEBOOK_CLIENT_SECRET')
 SENDGRID_FROM_EMAIL = get_env_default('SENDGRID_FROM_EMAIL')
 
 SENDGRID_API_KEY = get_env_default('SENDGRID_API_KEY')
+# 'sendgrid', or 'local' to keep emails in memory instead of sending them
+EMAIL_TRANSPORT = get_env_default('EMAIL_TRANSPORT') or 'sendgrid'
+# Seconds verification emails wait to be sent together in one SendGrid call,
+# 0 sends each one on the request thread
+EMAIL_BATCH_DELAY = float(get_env_default('EMAIL_BATCH_DELAY') or 0)
+# Most verification emails sent in one SendGrid call, up to 1000
+EMAIL_BATCH_SIZE = int(get_env_default('EMAIL_BATCH_SIZE') or 100)
 
 TWILIO_VERIFY_API_KEY = get_env_default('TWILIO_VERIFY_API_KEY')
+# Seconds a sent phone verification code is not sent again to the same
+# number by the same method, 0 only shares concurrent sends
+PHONE_VERIFICATION_DEDUP_WINDOW = int(
+    get_env_default('PHONE_VERIFICATION_DEDUP_WINDOW') or 0)
 
 TWITTER_CONSUMER_KEY = get_env_default('TWITTER_CONSUMER_KEY')
 TWITTER_CONSUMER_SECRET = get_env_default('TWITTER_CONSUMER_SECRET')
+# Request tokens fetched ahead of twitter/auth-url calls, 0 fetches on demand
+TWITTER_REQUEST_TOKEN_POOL_SIZE = int(
+    get_env_default('TWITTER_REQUEST_TOKEN_POOL_SIZE') or 0)
+# Seconds a pre-fetched request token is handed out for before it is dropped
+TWITTER_REQUEST_TOKEN_MAX_AGE = int(
+    get_env_default('TWITTER_REQUEST_TOKEN_MAX_AGE') or 300)
 
 ATTESTATION_SIGNING_KEY = get_env_default('ATTESTATION_SIGNING_KEY')
+# Worker processes of tools/bulk_sign.py, defaults to the number of CPUs
+SIGNING_WORKERS = int(get_env_default('SIGNING_WORKERS') or 0)
+# Worker processes the verify endpoints sign in, 0 signs on the request thread
+SIGNING_POOL_SIZE = int(get_env_default('SIGNING_POOL_SIZE') or 0)
+# Signatures kept in memory so repeat verifications skip signing, 0 disables
+SIGNATURE_CACHE_SIZE = int(get_env_default('SIGNATURE_CACHE_SIZE') or 10000)
+# Reuse the signature of a matching stored attestation on a cache miss,
+# when it was signed by the current ATTESTATION_SIGNING_KEY. Only safe while
+# the claim data of each method has never changed.
+SIGNATURE_DB_FALLBACK = parse_bool(get_env_default('SIGNATURE_DB_FALLBACK'))
 
 APNS_CERT_FILE = get_env_default('APNS_CERT_FILE')
 APNS_CERT_PASSWORD = get_env_default('APNS_CERT_PASSWORD')
@@ -84,8 +129,91 @@ FCM_TITLE = get_env_default('FCM_TITLE')
 
 BIND_HOST = get_env_default("BIND_HOST")
 
+# Keep-alive connections kept per identity provider host
+HTTP_POOL_SIZE = int(get_env_default('HTTP_POOL_SIZE') or 10)
+# Seconds to wait for a provider connection and for each read from it
+HTTP_CONNECT_TIMEOUT = float(get_env_default('HTTP_CONNECT_TIMEOUT') or 3.05)
+HTTP_READ_TIMEOUT = float(get_env_default('HTTP_READ_TIMEOUT') or 10)
+# Open a connection to each provider at startup
+HTTP_WARM_UP = parse_bool(get_env_default('HTTP_WARM_UP'))
+# Calls to a provider fail fast for CIRCUIT_BREAKER_OPEN_SECONDS once this
+# share of its last CIRCUIT_BREAKER_WINDOW calls failed or took longer than
+# CIRCUIT_BREAKER_SLOW_CALL seconds, counting from CIRCUIT_BREAKER_MIN_CALLS
+CIRCUIT_BREAKER_FAILURE_RATE = float(
+    get_env_default('CIRCUIT_BREAKER_FAILURE_RATE') or 0.5)
+CIRCUIT_BREAKER_WINDOW = int(get_env_default('CIRCUIT_BREAKER_WINDOW') or 20)
+CIRCUIT_BREAKER_MIN_CALLS = int(get_env_default('CIRCUIT_BREAKER_MIN_CALLS') or 10)
+CIRCUIT_BREAKER_SLOW_CALL = float(get_env_default('CIRCUIT_BREAKER_SLOW_CALL') or 5)
+CIRCUIT_BREAKER_OPEN_SECONDS = float(
+    get_env_default('CIRCUIT_BREAKER_OPEN_SECONDS') or 30)
+# Seconds an API request may spend waiting on providers, 0 for no limit.
+# Also bounds how long airbnb/verify waits for the code.
+REQUEST_DEADLINE = float(get_env_default('REQUEST_DEADLINE') or 20)
+
+# Connections the async app keeps open to providers, across all hosts
+ASYNC_HTTP_POOL_SIZE = int(get_env_default('ASYNC_HTTP_POOL_SIZE') or 1000)
+# Threads the async app signs and writes attestations on
+ASYNC_EXECUTOR_THREADS = int(get_env_default('ASYNC_EXECUTOR_THREADS') or 10)
+
 CONTRACT_DIR = get_env_default('CONTRACT_DIR') or 'contracts'
 
 RESOURCES_DIR = get_env_default('RESOURCES_DIR') or 'resources'
 
+# Seconds an Airbnb profile check is reused for before the page is fetched
+# again, conditionally when it was served with an ETag or Last-Modified.
+# 0 fetches the page on every check.
+AIRBNB_PROFILE_CACHE_TTL = float(get_env_default('AIRBNB_PROFILE_CACHE_TTL') or 0)
+AIRBNB_PROFILE_CACHE_SIZE = int(get_env_default('AIRBNB_PROFILE_CACHE_SIZE') or 10000)
+# Longest airbnb/verify may keep checking for the code when asked to wait.
+# On the waitress web process a waiting request holds one of the
+# WAITRESS_THREADS, so raise those along with it, or send airbnb/verify to
+# web-async, where waiting costs no thread. The wait also stops in time
+# for a last check within REQUEST_DEADLINE.
+AIRBNB_VERIFY_MAX_WAIT = int(get_env_default('AIRBNB_VERIFY_MAX_WAIT') or 0)
+
+# Run slow side effects (email and SMS sends, attestation writes) on the
+# Celery worker instead of the request thread
+BACKGROUND_TASKS = parse_bool(get_env_default('BACKGROUND_TASKS'))
+CELERY_BROKER_URL = get_env_default('CELERY_BROKER_URL') or get_env_default('REDIS_URL')
+# Seconds between IPFS pin reconciliations scheduled by beat
+IPFS_PIN_INTERVAL = int(get_env_default('IPFS_PIN_INTERVAL') or 3600)
+
+# Seconds attestation rows wait to be inserted together once written to the
+# local spool, 0 stores each one with its own commit
+ATTESTATION_WRITE_DELAY = float(get_env_default('ATTESTATION_WRITE_DELAY') or 0)
+# Rows waiting that start an insert early
+ATTESTATION_WRITE_BATCH_SIZE = int(get_env_default('ATTESTATION_WRITE_BATCH_SIZE') or 500)
+# Most rows waiting to be inserted, and seconds a verification waits for room
+# beyond that before failing
+ATTESTATION_WRITE_QUEUE_SIZE = int(get_env_default('ATTESTATION_WRITE_QUEUE_SIZE') or 10000)
+ATTESTATION_WRITE_TIMEOUT = float(get_env_default('ATTESTATION_WRITE_TIMEOUT') or 5)
+# Directory rows are kept in until inserted, on a disk that outlives the
+# process
+ATTESTATION_SPOOL_DIR = get_env_default('ATTESTATION_SPOOL_DIR') or abspath('spool')
+
+# Identities whose attestation list pages are cached, and seconds a page is
+# kept when no attestation is stored for its identity in this process. The
+# cache is off when the worker stores attestations, BACKGROUND_TASKS being
+# set without ATTESTATION_WRITE_DELAY, as its invalidations would never
+# reach the web process.
+ATTESTATION_CACHE_SIZE = int(get_env_default('ATTESTATION_CACHE_SIZE') or 1000)
+ATTESTATION_CACHE_TTL = float(get_env_default('ATTESTATION_CACHE_TTL') or 60)
+
+# Attestation list pages cached per identity, least recently used out first
+ATTESTATION_CACHE_PAGES = int(get_env_default('ATTESTATION_CACHE_PAGES') or 8)
+
+# Seconds the replica may lag behind the primary. With DATABASE_REPLICA_URL
+# set, list pages read this soon after their identity's attestations change
+# are only cached until then.
+ATTESTATION_CACHE_REPLICA_LAG = float(
+    get_env_default('ATTESTATION_CACHE_REPLICA_LAG') or 5)
+
+# Months of attestation partitions kept created ahead of time, and months of
+# attestations kept before their partitions are dropped, 0 keeping them all
+ATTESTATION_PARTITIONS_AHEAD = int(get_env_default('ATTESTATION_PARTITIONS_AHEAD') or 3)
+ATTESTATION_RETENTION_MONTHS = int(get_env_default('ATTESTATION_RETENTION_MONTHS') or 0)
+
 INTERNAL_API_TOKEN = get_env_default('INTERNAL_API_TOKEN')
+
+# Bearer token /metrics requires, when set
+METRICS_TOKEN = get_env_default('METRICS_TOKEN')
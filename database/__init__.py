@@ -1,3 +1,73 @@
+"""
+The Flask-SQLAlchemy extension, with connection pool options and routing of
+reads to a replica beyond what Flask-SQLAlchemy's config supports.
+
+Besides its SQLALCHEMY_* keys, the app config can set:
+
+    SQLALCHEMY_POOL_PRE_PING: check pooled connections before use, so one
+        the server or a load balancer closed is replaced rather than failing
+        a request
+    SQLALCHEMY_PGBOUNCER: the database URL is a PgBouncer in transaction
+        pooling mode. Connections aren't pooled in the process, as an idle
+        one would hold a server connection PgBouncer could hand out.
+
+With a 'replica' bind in SQLALCHEMY_BINDS, SELECTs of a transaction that
+hasn't written go to the replica. Everything else, and every query of the
+transaction after its first write or flush, goes to the primary.
+"""
 import flask_sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.expression import Select
+
+REPLICA = 'replica'
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    # Set once the transaction has used the primary
+    _on_primary = False
+
+    def get_bind(self, mapper=None, clause=None):
+        binds = self.app.config['SQLALCHEMY_BINDS'] or {}
+        if REPLICA in binds and not self._on_primary and \
+                not self._flushing and isinstance(clause, Select) and \
+                clause._for_update_arg is None:
+            state = flask_sqlalchemy.get_state(self.app)
+            return state.db.get_engine(self.app, bind=REPLICA)
+        self._on_primary = True
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._on_primary = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._on_primary = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._on_primary = False
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_pool_defaults(self, app, options):
+        if app.config.get('SQLALCHEMY_PGBOUNCER'):
+            options['poolclass'] = NullPool
+            return
+        super().apply_pool_defaults(app, options)
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            options['pool_pre_ping'] = True
+
 
-db = flask_sqlalchemy.SQLAlchemy(session_options=dict(autoflush=False))
+db = SQLAlchemy(session_options=dict(autoflush=False))
@@ -0,0 +1,32 @@
+"""index attestations by identity
+
+Revision ID: b1f3c6e2d4a7
+Revises: 8731cde0bd1e
+Create Date: 2018-11-02 11:20:41.118093
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b1f3c6e2d4a7'
+down_revision = '8731cde0bd1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY doesn't lock out attestation writes while
+    # the index builds, but can't run in the migration's transaction. If the
+    # build fails it leaves an INVALID index, to be dropped before retrying.
+    op.execute('COMMIT')
+    op.execute(
+        'CREATE INDEX CONCURRENTLY ix_attestation_eth_address_created_at '
+        'ON attestation (lower(eth_address), created_at, id)'
+    )
+
+
+def downgrade():
+    op.execute('COMMIT')
+    op.execute(
+        'DROP INDEX CONCURRENTLY IF EXISTS ix_attestation_eth_address_created_at'
+    )
@@ -0,0 +1,219 @@
+"""partition attestations by month
+
+Revision ID: c4e8a1f0b9d2
+Revises: b1f3c6e2d4a7
+Create Date: 2018-11-05 15:42:07.530214
+
+"""
+from datetime import datetime
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f0b9d2'
+down_revision = 'b1f3c6e2d4a7'
+branch_labels = None
+depends_on = None
+
+# Creates the attestation_YYYY_MM partitions of this month and the next
+# months_ahead months that don't exist yet, returning how many it created.
+# Months held by attestation_legacy, the table from before partitioning, are
+# skipped. Attestations of the month already in attestation_default, because
+# its partition wasn't created in time, are moved to the new partition: the
+# default partition is detached meanwhile, as a partition can't be created
+# while the default holds rows of its range.
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION attestation_create_partitions(months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    month timestamp := date_trunc('month', now() AT TIME ZONE 'utc');
+    partition text;
+    created integer := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        partition := 'attestation_' || to_char(month, 'YYYY_MM');
+        IF to_regclass(partition) IS NULL THEN
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM attestation_default
+                    WHERE created_at >= month
+                    AND created_at < month + interval '1 month'
+                ) THEN
+                    ALTER TABLE attestation
+                        DETACH PARTITION attestation_default;
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF attestation '
+                        'FOR VALUES FROM (%L) TO (%L)',
+                        partition, month, month + interval '1 month');
+                    EXECUTE format(
+                        'WITH moved AS ('
+                        '    DELETE FROM attestation_default '
+                        '    WHERE created_at >= %L AND created_at < %L '
+                        '    RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        month, month + interval '1 month', partition);
+                    ALTER TABLE attestation
+                        ATTACH PARTITION attestation_default DEFAULT;
+                ELSE
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF attestation '
+                        'FOR VALUES FROM (%L) TO (%L)',
+                        partition, month, month + interval '1 month');
+                END IF;
+                created := created + 1;
+            EXCEPTION WHEN invalid_object_definition THEN
+                -- Overlaps attestation_legacy
+                NULL;
+            END;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Drops the partitions holding only attestations created before the month
+# retention_months before this one, returning how many it dropped. The
+# default partition is kept.
+DROP_PARTITIONS_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION attestation_drop_partitions(retention_months integer)
+RETURNS integer AS $$
+DECLARE
+    cutoff timestamp := date_trunc('month', now() AT TIME ZONE 'utc')
+        - make_interval(months => retention_months);
+    part record;
+    upper_bound text;
+    dropped integer := 0;
+BEGIN
+    FOR part IN
+        SELECT child.oid::regclass AS name,
+               pg_get_expr(child.relpartbound, child.oid) AS bound
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'attestation'::regclass
+    LOOP
+        upper_bound := substring(part.bound FROM 'TO \(''([^'']+)''\)');
+        IF upper_bound IS NOT NULL AND upper_bound::timestamp <= cutoff THEN
+            EXECUTE format('DROP TABLE %s', part.name);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+PARTITIONED_TABLE = """
+CREATE TABLE attestation (
+    id integer NOT NULL DEFAULT nextval('attestation_id_seq'::regclass),
+    method attestationtypes,
+    eth_address varchar,
+    value varchar,
+    signature varchar,
+    remote_ip_address inet,
+    created_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+# Months of partitions created ahead by the migration, until the
+# maintain_attestation_partitions task takes over
+PARTITIONS_AHEAD = 3
+
+
+def _first_partitioned_month():
+    """The first of the month after next, UTC. Attestations created before
+    it stay in the existing table, which becomes attestation_legacy."""
+    now = datetime.utcnow()
+    months = now.year * 12 + now.month + 1
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def upgrade():
+    # Before 12, SET NOT NULL below scans the table under the swap's
+    # exclusive lock rather than relying on attestation_legacy_created_at
+    if op.get_bind().dialect.server_version_info < (12,):
+        raise RuntimeError(
+            'Partitioning attestations needs PostgreSQL 12 or later.')
+    boundary = _first_partitioned_month().isoformat(' ')
+
+    # The existing table is attached as the partition of everything before
+    # boundary rather than copied. Attaching needs a unique index matching
+    # the new primary key and proof that every row is before boundary;
+    # both are built outside the migration's transaction so that they
+    # don't lock out attestation writes while they scan the table.
+    op.execute('COMMIT')
+    op.execute(
+        "UPDATE attestation SET created_at = '1970-01-01' "
+        "WHERE created_at IS NULL"
+    )
+    op.execute(
+        'CREATE UNIQUE INDEX CONCURRENTLY attestation_legacy_id_created_at '
+        'ON attestation (id, created_at)'
+    )
+    op.execute(
+        'ALTER TABLE attestation ADD CONSTRAINT attestation_legacy_created_at '
+        "CHECK (created_at IS NOT NULL AND created_at < '{}') "
+        'NOT VALID'.format(boundary)
+    )
+    op.execute(
+        'ALTER TABLE attestation VALIDATE CONSTRAINT '
+        'attestation_legacy_created_at'
+    )
+
+    # The swap itself only takes brief locks, and is atomic
+    op.execute('BEGIN')
+    op.execute('ALTER TABLE attestation RENAME TO attestation_legacy')
+    # A partition can't have a primary key of its own. The unique index on
+    # (id, created_at) becomes its part of the new primary key.
+    op.execute(
+        'ALTER TABLE attestation_legacy DROP CONSTRAINT attestation_pkey')
+    op.execute(
+        'ALTER INDEX ix_attestation_eth_address_created_at '
+        'RENAME TO attestation_legacy_eth_address_created_at'
+    )
+    # Proven by attestation_legacy_created_at rather than a scan, which
+    # needs PostgreSQL 12
+    op.execute(
+        'ALTER TABLE attestation_legacy ALTER COLUMN created_at SET NOT NULL')
+
+    op.execute(PARTITIONED_TABLE)
+    op.execute('ALTER SEQUENCE attestation_id_seq OWNED BY attestation.id')
+    op.execute(
+        'CREATE INDEX ix_attestation_eth_address_created_at '
+        'ON attestation (lower(eth_address), created_at, id)'
+    )
+    op.execute(
+        'ALTER TABLE attestation ATTACH PARTITION attestation_legacy '
+        "FOR VALUES FROM (MINVALUE) TO ('{}')".format(boundary)
+    )
+    # Catches attestations of months whose partition wasn't created in time
+    op.execute('CREATE TABLE attestation_default PARTITION OF attestation '
+               'DEFAULT')
+
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+    op.execute(DROP_PARTITIONS_FUNCTION)
+    op.execute('SELECT attestation_create_partitions({})'.format(
+        PARTITIONS_AHEAD))
+
+
+def downgrade():
+    op.execute('DROP FUNCTION IF EXISTS attestation_create_partitions(integer)')
+    op.execute('DROP FUNCTION IF EXISTS attestation_drop_partitions(integer)')
+
+    op.execute('ALTER TABLE attestation RENAME TO attestation_partitioned')
+    op.execute(
+        'CREATE TABLE attestation '
+        '(LIKE attestation_partitioned INCLUDING DEFAULTS)'
+    )
+    op.execute('INSERT INTO attestation SELECT * FROM attestation_partitioned')
+    op.execute('ALTER SEQUENCE attestation_id_seq OWNED BY attestation.id')
+    op.execute('DROP TABLE attestation_partitioned')
+
+    op.execute('ALTER TABLE attestation ADD PRIMARY KEY (id)')
+    op.execute('ALTER TABLE attestation ALTER COLUMN created_at DROP NOT NULL')
+    op.execute(
+        'CREATE INDEX ix_attestation_eth_address_created_at '
+        'ON attestation (lower(eth_address), created_at, id)'
+    )
@@ -0,0 +1,188 @@
+"""store attestations as bytes
+
+Revision ID: d7a2e5b8c1f3
+Revises: c4e8a1f0b9d2
+Create Date: 2018-11-07 10:14:52.864391
+
+The upgrade doesn't rewrite the table under a lock. It adds bytea and
+smallint columns next to the existing ones, and a trigger fills them for
+rows written meanwhile. It then backfills the existing rows
+BACKFILL_BATCH_SIZE at a time, each batch committed on its own, and builds
+the index on the new columns concurrently, partition by partition. Only the
+final swap locks the table exclusively: dropping the old columns and index
+and renaming the new ones only touches the catalog, so writes wait for it
+for well under a second.
+
+From the swap until the web and worker processes run the release with the
+matching models, their attestation writes fail. Writes that go through the
+write-behind writer are set aside in its .dead file.
+
+Legacy rows whose eth_address or signature isn't 0x prefixed hex of the
+expected length can't be converted. They are logged before the first batch,
+and their value is stored as NULL rather than failing the backfill halfway.
+
+The downgrade rewrites the table under an exclusive lock, which blocks
+attestation reads and writes for as long as the rewrite takes.
+"""
+import logging
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2e5b8c1f3'
+down_revision = 'c4e8a1f0b9d2'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+METHODS = ('PHONE', 'EMAIL', 'AIRBNB', 'FACEBOOK', 'TWITTER')
+
+# Ids of the rows backfilled per statement, and so per transaction
+BACKFILL_BATCH_SIZE = 10000
+
+# The old and new columns, and the index of the list endpoint on the new
+COLUMNS = ('method', 'eth_address', 'signature')
+NEW_INDEX = 'ix_attestation_eth_address_bytes'
+
+# Values that convert, others become NULL
+VALID = {
+    'eth_address': '^0x[0-9a-fA-F]{40}$',
+    'signature': '^0x[0-9a-fA-F]{130}$',
+}
+# Ids of malformed rows logged at most
+MALFORMED_LOGGED = 100
+
+
+def _method_case(column, values, names):
+    return 'CASE {} {} END'.format(column, ' '.join(
+        "WHEN {} THEN {}".format(value, name)
+        for value, name in zip(values, names)))
+
+
+def _converted(prefix=''):
+    """The new column values of a row, from its old columns."""
+    return {
+        'method': _method_case(
+            prefix + 'method::text',
+            ("'{}'".format(name) for name in METHODS),
+            range(1, len(METHODS) + 1)),
+        'eth_address': _decoded(prefix + 'eth_address', VALID['eth_address']),
+        'signature': _decoded(prefix + 'signature', VALID['signature']),
+    }
+
+
+def _decoded(column, valid):
+    return ("CASE WHEN {0} ~ '{1}' THEN decode(substr({0}, 3), 'hex') "
+            "END".format(column, valid))
+
+
+def _report_malformed():
+    where = ' OR '.join("{} !~ '{}'".format(column, valid)
+                        for column, valid in VALID.items())
+    count = op.get_bind().execute(
+        'SELECT count(*) FROM attestation WHERE ' + where).scalar()
+    if count:
+        ids = [row[0] for row in op.get_bind().execute(
+            'SELECT id FROM attestation WHERE {} ORDER BY id LIMIT {}'.format(
+                where, MALFORMED_LOGGED))]
+        logger.warning(
+            '%d attestations have a malformed eth_address or signature, '
+            'which will be stored as NULL. Ids: %s%s', count,
+            ', '.join(map(str, ids)), ', ...' if count > len(ids) else '')
+
+
+def _partitions():
+    return [row[0] for row in op.get_bind().execute(
+        "SELECT inhrelid::regclass::text FROM pg_inherits "
+        "WHERE inhparent = 'attestation'::regclass")]
+
+
+def upgrade():
+    _report_malformed()
+
+    # Every statement from here on commits on its own
+    op.execute('COMMIT')
+    op.execute('ALTER TABLE attestation {}'.format(', '.join(
+        'ADD COLUMN {}_bytes {}'.format(
+            column, 'smallint' if column == 'method' else 'bytea')
+        for column in COLUMNS)))
+
+    # Before row triggers can't be created on a partitioned table until
+    # PostgreSQL 13, so each partition gets one. No partition is created
+    # while the migration runs: the maintenance task keeps
+    # ATTESTATION_PARTITIONS_AHEAD months ready.
+    op.execute(
+        'CREATE FUNCTION attestation_fill_bytes() RETURNS trigger AS $$ '
+        'BEGIN {} RETURN NEW; END; $$ LANGUAGE plpgsql'.format(' '.join(
+            'NEW.{}_bytes := {};'.format(column, value)
+            for column, value in _converted('NEW.').items())))
+    partitions = _partitions()
+    for partition in partitions:
+        # Waits for the partition's writes in progress, so every row the
+        # backfill doesn't see is written through the trigger
+        op.execute(
+            'CREATE TRIGGER attestation_fill_bytes '
+            'BEFORE INSERT OR UPDATE OF {} ON {} '
+            'FOR EACH ROW EXECUTE PROCEDURE attestation_fill_bytes()'.format(
+                ', '.join(COLUMNS), partition))
+
+    first, last = op.get_bind().execute(
+        'SELECT min(id), max(id) FROM attestation').first()
+    for start in range(first or 0, (last or 0) + 1, BACKFILL_BATCH_SIZE):
+        op.execute(
+            'UPDATE attestation SET {} WHERE id >= {} AND id < {}'.format(
+                ', '.join('{}_bytes = {}'.format(column, value)
+                          for column, value in _converted().items()),
+                start, start + BACKFILL_BATCH_SIZE))
+
+    # CREATE INDEX CONCURRENTLY doesn't work on a partitioned table, but
+    # does on each partition. The index of the partitioned table becomes
+    # valid once the index of every partition is attached to it.
+    op.execute('CREATE INDEX {} ON ONLY attestation '
+               '(eth_address_bytes, created_at, id)'.format(NEW_INDEX))
+    for partition in partitions:
+        index = '{}_eth_address_bytes_idx'.format(partition)
+        op.execute('CREATE INDEX CONCURRENTLY {} ON {} '
+                   '(eth_address_bytes, created_at, id)'.format(
+                       index, partition))
+        op.execute('ALTER INDEX {} ATTACH PARTITION {}'.format(
+            NEW_INDEX, index))
+
+    # The swap only touches the catalog, and is atomic
+    op.execute('BEGIN')
+    for partition in partitions:
+        op.execute('DROP TRIGGER attestation_fill_bytes ON {}'.format(
+            partition))
+    op.execute('DROP FUNCTION attestation_fill_bytes()')
+    op.execute('DROP INDEX ix_attestation_eth_address_created_at')
+    op.execute('ALTER TABLE attestation {}'.format(', '.join(
+        'DROP COLUMN {}'.format(column) for column in COLUMNS)))
+    for column in COLUMNS:
+        op.execute('ALTER TABLE attestation RENAME COLUMN {}_bytes TO {}'.format(
+            column, column))
+    op.execute('ALTER INDEX {} RENAME TO '
+               'ix_attestation_eth_address_created_at'.format(NEW_INDEX))
+    op.execute('DROP TYPE attestationtypes')
+
+
+def downgrade():
+    # Addresses come back lowercased, their checksum casing isn't stored
+    op.execute('DROP INDEX ix_attestation_eth_address_created_at')
+    op.execute('CREATE TYPE attestationtypes AS ENUM ({})'.format(
+        ', '.join("'{}'".format(name) for name in METHODS)))
+    op.execute(
+        'ALTER TABLE attestation '
+        'ALTER COLUMN method TYPE attestationtypes '
+        'USING ({})::attestationtypes, '
+        "ALTER COLUMN eth_address TYPE varchar "
+        "USING '0x' || encode(eth_address, 'hex'), "
+        "ALTER COLUMN signature TYPE varchar "
+        "USING '0x' || encode(signature, 'hex')".format(
+            _method_case('method', range(1, len(METHODS) + 1),
+                         ("'{}'".format(name) for name in METHODS)))
+    )
+    op.execute(
+        'CREATE INDEX ix_attestation_eth_address_created_at '
+        'ON attestation (lower(eth_address), created_at, id)'
+    )
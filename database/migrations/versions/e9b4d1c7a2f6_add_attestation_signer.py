@@ -0,0 +1,25 @@
+"""add attestation signer
+
+Revision ID: e9b4d1c7a2f6
+Revises: d7a2e5b8c1f3
+Create Date: 2018-11-12 11:03:41.205718
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e9b4d1c7a2f6'
+down_revision = 'd7a2e5b8c1f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Address of the key that signed the attestation. Nullable without a
+    # default, so adding it only touches the catalog. Rows from before it
+    # stay NULL, and their signatures are never reused.
+    op.execute('ALTER TABLE attestation ADD COLUMN signer bytea')
+
+
+def downgrade():
+    op.execute('ALTER TABLE attestation DROP COLUMN signer')
@@ -1,4 +1,5 @@
 from database import db
+from database.types import Address, HexBytes, SmallEnum
 from datetime import datetime
 from enum import Enum
 from sqlalchemy.dialects import postgresql
@@ -13,10 +14,24 @@ class AttestationTypes(Enum):
 
 
 class Attestation(db.Model):
+    # Migration c4e8a1f0b9d2 partitions the table by month of created_at,
+    # with a primary key of (id, created_at). ids are still drawn from one
+    # sequence, so the model keeps id alone as its primary key.
     id = db.Column(db.Integer, primary_key=True)
-    method = db.Column(db.Enum(AttestationTypes))
-    eth_address = db.Column(db.String)
+    # Stored as smallint and bytea by migration d7a2e5b8c1f3, read and
+    # written as AttestationTypes members and hex strings
+    method = db.Column(SmallEnum(AttestationTypes))
+    eth_address = db.Column(Address)
     value = db.Column(db.String)
-    signature = db.Column(db.String)
+    signature = db.Column(HexBytes)
+    # Address of the key that made signature, NULL for rows from before
+    # migration e9b4d1c7a2f6
+    signer = db.Column(Address)
     remote_ip_address = db.Column(postgresql.INET)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Attestations of an identity, newest first, for the list endpoint
+        db.Index('ix_attestation_eth_address_created_at',
+                 eth_address, created_at, id),
+    )
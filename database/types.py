@@ -0,0 +1,68 @@
+"""
+Column types storing attestation values compactly, while the models and
+queries keep using the values the API does: 0x prefixed hex strings and
+AttestationTypes members.
+"""
+import functools
+
+from eth_utils import decode_hex, encode_hex, to_checksum_address
+from sqlalchemy import SmallInteger
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+# Checksumming hashes the address, and the same identities recur in exports
+# and attestation lists
+_checksum_address = functools.lru_cache(maxsize=65536)(to_checksum_address)
+
+
+class HexBytes(TypeDecorator):
+    """0x prefixed hex strings, stored as bytea."""
+
+    impl = postgresql.BYTEA
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return decode_hex(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return encode_hex(bytes(value))
+
+
+class Address(HexBytes):
+    """Ethereum addresses, stored as their 20 bytes and read back
+    checksummed. Any case is accepted when writing or comparing."""
+
+    def process_bind_param(self, value, dialect):
+        value = super().process_bind_param(value, dialect)
+        if value is not None and len(value) != 20:
+            raise ValueError('Not a 20 byte address.')
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return _checksum_address(bytes(value))
+
+
+class SmallEnum(TypeDecorator):
+    """Members of an Enum with small int values, stored as smallint rather
+    than a Postgres enum."""
+
+    impl = SmallInteger
+
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.enum_class(value).value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.enum_class(value)
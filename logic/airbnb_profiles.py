@@ -0,0 +1,232 @@
+"""Checks Airbnb profile pages for verification codes.
+
+Users tend to retry airbnb/verify while they wait for a profile edit to go
+live, so checks are shared where possible:
+
+- Concurrent checks for the same user make a single request. A check for
+  another code than the one that request looks for makes its own.
+- With AIRBNB_PROFILE_CACHE_TTL set, the result for a code is reused for
+  that many seconds. After that the page is fetched again with the ETag and
+  Last-Modified it was served with, and a 304 keeps the earlier result.
+- wait_for_code keeps checking with exponential backoff, so a verification
+  can complete as soon as the code appears instead of the client polling.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from config import settings
+from logic.service_utils import AirbnbVerificationError
+from util import deadline, http_client, metrics
+from util.circuit_breaker import CircuitOpenError
+from util.deadline import DeadlineExceeded
+from util.singleflight import SingleFlight
+from util.streams import response_contains
+
+airbnb_profile_url = 'https://www.airbnb.com/users/show/'
+# TODO: determine if this user agent is acceptable.
+# We need to set an user agent otherwise Airbnb returns 403
+airbnb_profile_headers = {
+    'User-Agent': 'Origin Protocol client-0.1.0',
+    'Accept-Encoding': 'gzip'
+}
+# Bytes of the Airbnb profile page read at a time while looking for the code
+AIRBNB_CHUNK_SIZE = 16 * 1024
+
+
+class ProfileCheck(object):
+    """Codes looked for in one version of a user's profile page. Only
+    changed by ProfileCache, under its lock."""
+
+    def __init__(self, etag, last_modified, fetched_at):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.found = {}
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def same_version(self, etag, last_modified):
+        return bool(self.etag or self.last_modified) and \
+            self.etag == etag and self.last_modified == last_modified
+
+
+class ProfileCache(object):
+    """Thread safe, bounded LRU of ProfileChecks keyed by Airbnb user id.
+
+    Shared by the WSGI and asyncio verify flows.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, airbnbUserId, code, ttl):
+        """Return (check, fresh): the ProfileCheck of airbnbUserId when it
+        has a result for code, or None, and whether that result is less than
+        ttl seconds old."""
+        with self._lock:
+            check = self._entries.get(airbnbUserId)
+            if check is None or code not in check.found:
+                return None, False
+            self._entries.move_to_end(airbnbUserId)
+            return check, time.monotonic() - check.fetched_at < ttl
+
+    def not_modified(self, check):
+        """Keep check for another ttl, its version of the page being
+        current."""
+        with self._lock:
+            check.fetched_at = time.monotonic()
+
+    def record(self, airbnbUserId, etag, last_modified, code, found):
+        """Store whether code is on the version of the profile page served
+        with etag and last_modified."""
+        with self._lock:
+            check = self._entries.get(airbnbUserId)
+            if check is None or not check.same_version(etag, last_modified):
+                check = ProfileCheck(etag, last_modified, time.monotonic())
+                self._entries[airbnbUserId] = check
+            check.fetched_at = time.monotonic()
+            check.found[code] = found
+            self._entries.move_to_end(airbnbUserId)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+profile_cache = ProfileCache(settings.AIRBNB_PROFILE_CACHE_SIZE)
+_flights = SingleFlight('airbnb.profile')
+
+
+def profile_has_code(airbnbUserId, code):
+    """Check whether code is on the Airbnb profile of airbnbUserId.
+
+    Args:
+        airbnbUserId (str): user's id on Airbnb website
+        code (str): verification code, matched ignoring case and whitespace
+
+    Returns:
+        bool
+
+    Raises:
+        AirbnbVerificationError: The profile does not exist or could not be
+            fetched
+    """
+    checked, found = _flights.do(airbnbUserId, _check_profile, airbnbUserId,
+                                 code)
+    if checked != code:
+        # Joined a check for another code
+        checked, found = _check_profile(airbnbUserId, code)
+    return found
+
+
+def cached_check(airbnbUserId, code):
+    """Return (check, found): the cached ProfileCheck of airbnbUserId to
+    revalidate with a conditional request, or None, and whether code is on
+    the profile when the cached result is still fresh, else None."""
+    ttl = settings.AIRBNB_PROFILE_CACHE_TTL
+    if not ttl:
+        return None, None
+    check, fresh = profile_cache.lookup(airbnbUserId, code, ttl)
+    if fresh:
+        metrics.counter('airbnb.profile_cache.hit').inc()
+        return check, check.found[code]
+    return check, None
+
+
+def record_check(airbnbUserId, headers, code, found):
+    """Cache whether code is on the profile, served with headers."""
+    if settings.AIRBNB_PROFILE_CACHE_TTL:
+        profile_cache.record(airbnbUserId, headers.get('ETag'),
+                             headers.get('Last-Modified'), code, found)
+
+
+def _check_profile(airbnbUserId, code):
+    """Return (code, found), to tell the callers of a shared check which
+    code it looked for."""
+    check, found = cached_check(airbnbUserId, code)
+    if found is not None:
+        return code, found
+    headers = airbnb_profile_headers
+    if check is not None:
+        headers = dict(headers, **check.conditional_headers())
+
+    try:
+        with metrics.timed('airbnb.profile'):
+            response = http_client.get(
+                airbnb_profile_url + airbnbUserId, headers=headers, stream=True)
+            if response.status_code == 304 and check is not None:
+                response.close()
+                metrics.counter('airbnb.profile_cache.not_modified').inc()
+                profile_cache.not_modified(check)
+                return code, check.found[code]
+            response.raise_for_status()
+            # Stop downloading the page as soon as the code shows up
+            matcher = response_contains(
+                response, code.encode('utf-8'), AIRBNB_CHUNK_SIZE,
+                normalize=True)
+    except requests.exceptions.HTTPError:
+        response.close()
+        if response.status_code == 404:
+            raise AirbnbVerificationError(
+                'Airbnb user id: ' + airbnbUserId + ' not found.')
+        else:
+            raise AirbnbVerificationError(
+                "Can not fetch user's Airbnb profile.")
+    except (requests.exceptions.RequestException, CircuitOpenError,
+            DeadlineExceeded):
+        raise AirbnbVerificationError(
+            "Can not fetch user's Airbnb profile.")
+    metrics.counter('airbnb.profile_bytes').inc(matcher.bytes_read)
+
+    record_check(airbnbUserId, response.headers, code, matcher.found)
+    return code, matcher.found
+
+
+def backoff_delays(initial=1, maximum=16):
+    """Yield exponentially growing delays in seconds, capped at maximum."""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * 2, maximum)
+
+
+def wait_for_code(airbnbUserId, code, timeout):
+    """Check the profile for code, and keep checking with exponential backoff
+    for up to timeout seconds until it appears.
+
+    Returns:
+        bool: Whether the code was found in time
+
+    Raises:
+        AirbnbVerificationError: The profile does not exist or could not be
+            fetched
+    """
+    # Stop waiting early enough in the request budget for a last check that
+    # takes the provider timeouts in full, rather than waiting until the
+    # budget runs out
+    budget = deadline.remaining()
+    if budget is not None:
+        timeout = min(timeout, budget - settings.HTTP_CONNECT_TIMEOUT -
+                      settings.HTTP_READ_TIMEOUT)
+    give_up_at = time.monotonic() + timeout
+    for delay in backoff_delays():
+        if profile_has_code(airbnbUserId, code):
+            return True
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            return False
+        metrics.counter('airbnb.profile_poll').inc()
+        time.sleep(min(delay, remaining))
@@ -0,0 +1,300 @@
+"""asyncio counterpart of VerificationService.
+
+Provider calls are awaited on the event loop instead of pinning a thread for
+the whole round trip, so one process can hold thousands of verifications in
+flight. Signing and database writes still block, so they are handed to a
+small thread pool.
+
+Only the flows that keep no server side session are implemented here
+(phone, Facebook and Airbnb). Email and Twitter verification store state in
+the Flask session between requests and stay on the WSGI app.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from app import app
+from config import settings
+from logic.airbnb_profiles import (
+    AIRBNB_CHUNK_SIZE,
+    airbnb_profile_headers,
+    airbnb_profile_url,
+    backoff_delays,
+    cached_check,
+    profile_cache,
+    record_check,
+)
+from logic.attestation_service import (
+    VerificationService,
+    VerificationServiceResponse,
+    authy_url,
+    facebook_access_token,
+    facebook_access_token_params,
+    facebook_graph_url,
+    facebook_profile_params,
+    get_airbnb_verification_code,
+    phone_verification_check_error,
+    phone_verification_key,
+    phone_verification_start_error,
+    provider_errors,
+    record_airbnb_attestation,
+    record_facebook_attestation,
+    record_phone_attestation,
+    validate_airbnb_user_id,
+)
+from logic.service_utils import (
+    AirbnbVerificationError,
+    FacebookVerificationError,
+    PhoneVerificationError,
+)
+from util import async_http_client, metrics
+from util.circuit_breaker import CircuitOpenError
+from util.singleflight import AsyncSingleFlight
+from util.streams import StreamMatcher
+
+logger = logging.getLogger(__name__)
+
+# Errors of provider calls that did not get a response
+UNREACHABLE = (aiohttp.ClientError, asyncio.TimeoutError)
+
+_executor = None
+_executor_lock = threading.Lock()
+_phone_flights = AsyncSingleFlight('phone.start',
+                                   settings.PHONE_VERIFICATION_DEDUP_WINDOW)
+_profile_flights = AsyncSingleFlight('airbnb.profile')
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_EXECUTOR_THREADS)
+    return _executor
+
+
+def shutdown():
+    """Wait for pending signing and database work and stop the threads."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+async def run_in_app_context(func, *args):
+    """Run a blocking function on the executor threads inside a Flask
+    application context, so it can use the database without blocking the
+    event loop.
+    """
+    def call():
+        with app.app_context():
+            return func(*args)
+
+    return await asyncio.get_event_loop().run_in_executor(
+        _get_executor(), call)
+
+
+class AsyncVerificationService:
+
+    async def send_phone_verification(country_calling_code, phone, method,
+                                      locale):
+        """Request a phone number verification using the Twilio Verify API.
+
+        Args:
+            country_calling_code (str): Dialling prefix for the country.
+            phone (str): Phone number in national format.
+            method (str): Method of verification, 'sms' or 'call'.
+            locale (str): Language of the verification.
+
+        Returns:
+            VerificationServiceResponse
+
+        Raises:
+            ValidationError: Verification request failed due to invalid arguments
+            PhoneVerificationError: Verification request failed for a reason not
+                related to the arguments
+        """
+        params = {
+            'country_code': country_calling_code,
+            'phone_number': phone,
+            'via': method,
+            'code_length': 6
+        }
+        if locale:
+            params['locale'] = locale
+
+        await _phone_flights.do(
+            phone_verification_key(country_calling_code, phone, method),
+            _start_phone_verification, params)
+
+        return VerificationServiceResponse()
+
+    async def verify_phone(country_calling_code, phone, code, eth_address,
+                           remote_ip_address=None):
+        """Check a phone verification code against the Twilio Verify API for a
+        phone number.
+
+        Args:
+            country_calling_code (str): Dialling prefix for the country.
+            phone (str): Phone number in national format.
+            code (int): Verification code for the country_calling_code and phone
+                combination
+            eth_address (str): Address of ERC725 identity token for claim
+            remote_ip_address (str): Address of the client, stored with the
+                attestation
+
+        Returns:
+            VerificationServiceResponse
+
+        Raises:
+            ValidationError: Verification request failed due to invalid arguments
+            PhoneVerificationError: Verification request failed for a reason not
+                related to the arguments
+        """
+        params = {
+            'country_code': country_calling_code,
+            'phone_number': phone,
+            'verification_code': code
+        }
+
+        headers = {
+            'X-Authy-API-Key': settings.TWILIO_VERIFY_API_KEY
+        }
+
+        with provider_errors(PhoneVerificationError, UNREACHABLE):
+            async with async_http_client.get(
+                    authy_url + 'check', params=params,
+                    headers=headers) as response:
+                body = await response.json(content_type=None)
+                if response.status >= 400:
+                    logger.error('Authy verification check failed: %s', body)
+                    raise phone_verification_check_error(body['error_code'])
+
+        if body['success'] is True:
+            return await run_in_app_context(
+                record_phone_attestation, country_calling_code, phone,
+                eth_address, remote_ip_address)
+
+        raise PhoneVerificationError(
+            'Could not verify code. Please try again shortly.'
+        )
+
+    async def facebook_auth_url():
+        return VerificationService.facebook_auth_url()
+
+    async def verify_facebook(code, eth_address, remote_ip_address=None):
+        with metrics.timed('facebook.access_token'), \
+                provider_errors(FacebookVerificationError, UNREACHABLE):
+            async with async_http_client.get(
+                    "{}/v2.12/oauth/access_token".format(facebook_graph_url),
+                    params=facebook_access_token_params(code)) as response:
+                access_token = facebook_access_token(
+                    await response.json(content_type=None))
+
+        with metrics.timed('facebook.profile'), \
+                provider_errors(FacebookVerificationError, UNREACHABLE):
+            async with async_http_client.get(
+                    "{}/me".format(facebook_graph_url),
+                    params=facebook_profile_params(access_token)) as response:
+                name = (await response.json(content_type=None))['name']
+
+        with metrics.timed('facebook.attestation'):
+            return await run_in_app_context(
+                record_facebook_attestation, name, eth_address,
+                remote_ip_address)
+
+    async def generate_airbnb_verification_code(eth_address, airbnbUserId):
+        return VerificationService.generate_airbnb_verification_code(
+            eth_address, airbnbUserId)
+
+    async def verify_airbnb(eth_address, airbnbUserId, wait=0,
+                            remote_ip_address=None):
+        validate_airbnb_user_id(airbnbUserId)
+
+        code = get_airbnb_verification_code(eth_address, airbnbUserId)
+
+        # Waiting costs no thread here, only a sleeping coroutine
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + min(wait, settings.AIRBNB_VERIFY_MAX_WAIT)
+        for delay in backoff_delays():
+            if await _profile_has_code(airbnbUserId, code):
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise AirbnbVerificationError(
+                    "Origin verification code: " + code +
+                    " has not been found in user's Airbnb profile."
+                )
+            metrics.counter('airbnb.profile_poll').inc()
+            await asyncio.sleep(min(delay, remaining))
+
+        return await run_in_app_context(
+            record_airbnb_attestation, airbnbUserId, eth_address,
+            remote_ip_address)
+
+
+async def _start_phone_verification(params):
+    headers = {
+        'X-Authy-API-Key': settings.TWILIO_VERIFY_API_KEY
+    }
+
+    with provider_errors(PhoneVerificationError, UNREACHABLE):
+        async with async_http_client.post(
+                authy_url + 'start', params=params,
+                headers=headers) as response:
+            if response.status >= 400:
+                body = await response.json(content_type=None)
+                logger.error('Authy verification start failed: %s', body)
+                raise phone_verification_start_error(body['error_code'])
+
+
+async def _profile_has_code(airbnbUserId, code):
+    # Shares checks and cached results with logic.airbnb_profiles
+    checked, found = await _profile_flights.do(
+        airbnbUserId, _check_profile, airbnbUserId, code)
+    if checked != code:
+        # Joined a check for another code
+        checked, found = await _check_profile(airbnbUserId, code)
+    return found
+
+
+async def _check_profile(airbnbUserId, code):
+    check, found = cached_check(airbnbUserId, code)
+    if found is not None:
+        return code, found
+    headers = airbnb_profile_headers
+    if check is not None:
+        headers = dict(headers, **check.conditional_headers())
+
+    matcher = StreamMatcher(code.encode('utf-8'), normalize=True)
+    try:
+        with metrics.timed('airbnb.profile'):
+            async with async_http_client.get(
+                    airbnb_profile_url + airbnbUserId,
+                    headers=headers) as response:
+                if response.status == 304 and check is not None:
+                    metrics.counter('airbnb.profile_cache.not_modified').inc()
+                    profile_cache.not_modified(check)
+                    return code, check.found[code]
+                if response.status == 404:
+                    raise AirbnbVerificationError(
+                        'Airbnb user id: ' + airbnbUserId + ' not found.')
+                elif response.status >= 400:
+                    raise AirbnbVerificationError(
+                        "Can not fetch user's Airbnb profile.")
+                async for chunk in response.content.iter_chunked(
+                        AIRBNB_CHUNK_SIZE):
+                    if matcher.feed(chunk):
+                        break
+    except (CircuitOpenError,) + UNREACHABLE:
+        raise AirbnbVerificationError(
+            "Can not fetch user's Airbnb profile.")
+    metrics.counter('airbnb.profile_bytes').inc(matcher.bytes_read)
+
+    record_check(airbnbUserId, response.headers, code, matcher.found)
+    return code, matcher.found
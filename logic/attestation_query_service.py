@@ -0,0 +1,222 @@
+import base64
+import binascii
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from eth_utils import is_hex_address
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import tuple_
+
+from config import settings
+from database.models import Attestation, AttestationTypes
+from util import metrics
+
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class AttestationQueryServiceResponse():
+    def __init__(self, data={}):
+        self.data = data
+
+
+class AttestationListCache(object):
+    """Thread safe, bounded LRU of attestation list pages, grouped by
+    identity so that storing an attestation drops every page of its
+    identity. Each identity keeps its most recently used pages only, as
+    the queries come from the client.
+
+    Pages are also dropped after ATTESTATION_CACHE_TTL seconds, which bounds
+    how stale they get when attestations are written by another process,
+    such as the Celery worker. Pages read within replica_lag seconds of a
+    change are only kept until that window ends, as the replica they were
+    read from may not have had the change yet.
+    """
+
+    def __init__(self, size, ttl, pages, replica_lag=0):
+        self.size = size
+        self.ttl = ttl
+        self.pages = pages
+        self.replica_lag = replica_lag
+        # Lowercased identity -> (generation, expiry, OrderedDict of
+        # query -> page, monotonic time of the last change or None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, eth_address, query):
+        """Return (page, generation): the cached page for query, or None,
+        and the generation to pass to put() for a page read now."""
+        with self._lock:
+            entry = self._entries.get(eth_address)
+            if entry is None:
+                return None, 0
+            generation, expires_at, pages, changed_at = entry
+            if expires_at <= time.monotonic():
+                self._entries[eth_address] = (
+                    generation, 0, OrderedDict(), changed_at)
+                return None, generation
+            self._entries.move_to_end(eth_address)
+            page = pages.get(query)
+            if page is not None:
+                pages.move_to_end(query)
+            return page, generation
+
+    def put(self, eth_address, query, page, generation):
+        """Cache page unless the identity's attestations have changed since
+        the generation get() returned."""
+        if not self.size:
+            return
+        with self._lock:
+            current, expires_at, pages, changed_at = self._entries.get(
+                eth_address, (0, 0, OrderedDict(), None))
+            if current != generation:
+                return
+            if not pages:
+                now = time.monotonic()
+                expires_at = now + self.ttl
+                if changed_at is not None and \
+                        now < changed_at + self.replica_lag:
+                    expires_at = min(expires_at,
+                                     changed_at + self.replica_lag)
+            pages[query] = page
+            pages.move_to_end(query)
+            while len(pages) > self.pages:
+                pages.popitem(last=False)
+            self._entries[eth_address] = (
+                current, expires_at, pages, changed_at)
+            self._entries.move_to_end(eth_address)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, eth_address):
+        with self._lock:
+            generation = self._entries.get(eth_address, (0,))[0]
+            self._entries[eth_address] = (
+                generation + 1, 0, OrderedDict(), time.monotonic())
+            self._entries.move_to_end(eth_address)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Attestations stored by the worker are never invalidated here
+attestation_cache = AttestationListCache(settings.ATTESTATION_CACHE_SIZE
+                                         if not settings.BACKGROUND_TASKS or
+                                         settings.ATTESTATION_WRITE_DELAY
+                                         else 0,
+                                         settings.ATTESTATION_CACHE_TTL,
+                                         settings.ATTESTATION_CACHE_PAGES,
+                                         settings.ATTESTATION_CACHE_REPLICA_LAG
+                                         if settings.DATABASE_REPLICA_URL
+                                         else 0)
+
+
+def attestations_changed(eth_address):
+    """Drop the cached attestation pages of an identity, to be called when
+    an attestation is stored for it."""
+    attestation_cache.invalidate(eth_address.lower())
+
+
+class AttestationQueryService:
+
+    def list_attestations(eth_address, method=None, cursor=None, limit=20):
+        """List the attestations of an identity, newest first.
+
+        Only what a relying party needs to check an attestation is returned;
+        the attested value and the client's IP address are not.
+
+        Args:
+            eth_address (str): Address of the identity, matched ignoring case
+            method (str): Only list attestations of this method, the
+                lowercased name of an AttestationTypes member
+            cursor (str): next_cursor of the previous page, to continue
+                after it
+            limit (int): Most attestations to return
+
+        Returns:
+            AttestationQueryServiceResponse: attestations, and next_cursor
+                when there are more
+
+        Raises:
+            ValidationError: The cursor is not one this service returned
+        """
+        eth_address = eth_address.lower()
+        if not is_hex_address(eth_address):
+            # Nothing is stored for it
+            return AttestationQueryServiceResponse(
+                {'attestations': [], 'next_cursor': None})
+        query = (method, cursor, limit)
+        page, generation = attestation_cache.get(eth_address, query)
+        if page is None:
+            metrics.counter('attestations.list_cache.miss').inc()
+            page = _fetch_page(eth_address, method, cursor, limit)
+            attestation_cache.put(eth_address, query, page, generation)
+        else:
+            metrics.counter('attestations.list_cache.hit').inc()
+        return AttestationQueryServiceResponse(page)
+
+
+def _fetch_page(eth_address, method, cursor, limit):
+    query = Attestation.query.with_entities(
+        Attestation.id,
+        Attestation.method,
+        Attestation.signature,
+        Attestation.created_at
+    ).filter(Attestation.eth_address == eth_address)
+    if method:
+        query = query.filter(
+            Attestation.method == AttestationTypes[method.upper()])
+    if cursor:
+        query = query.filter(tuple_(Attestation.created_at, Attestation.id) <
+                             tuple_(*decode_cursor(cursor)))
+    # Served by ix_attestation_eth_address_created_at, read backwards
+    rows = query.order_by(Attestation.created_at.desc(),
+                          Attestation.id.desc()).limit(limit + 1).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'attestations': [{
+            'method': row.method.name.lower(),
+            'claim_type': _claim_types()[row.method.name.lower()],
+            'signature': row.signature,
+            'created_at': row.created_at
+        } for row in rows],
+        'next_cursor': encode_cursor(rows[-1]) if more else None
+    }
+
+
+def _claim_types():
+    # logic.attestation_service defines the claim types, and imports the
+    # cache from here
+    from logic.attestation_service import CLAIM_TYPES
+    return CLAIM_TYPES
+
+
+def encode_cursor(row):
+    """Opaque cursor for the page after row."""
+    position = [row.created_at.strftime(CURSOR_TIME_FORMAT), row.id]
+    return base64.urlsafe_b64encode(
+        json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) a cursor continues after.
+
+    Raises:
+        ValidationError: The cursor is malformed
+    """
+    try:
+        created_at, attestation_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        created_at = datetime.datetime.strptime(created_at, CURSOR_TIME_FORMAT)
+        if not isinstance(attestation_id, int):
+            raise ValueError(attestation_id)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValidationError('Invalid cursor.', 'cursor')
+    return created_at, attestation_id
@@ -1,13 +1,16 @@
+import atexit
 import datetime
+import functools
 import logging
 import requests
-import sendgrid
 import re
+import threading
+import time
 from random import randint
 import urllib
+from contextlib import contextmanager
 
 from marshmallow.exceptions import ValidationError
-from urllib.request import Request, urlopen, HTTPError, URLError
 from sendgrid.helpers.mail import Email, Content, Mail
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -15,18 +18,31 @@ from config import settings
 from database import db
 from database.models import Attestation
 from database.models import AttestationTypes
+from eth_utils import is_hex_address, keccak
+from flask import current_app
 from flask import request
 from flask import session
+from logic import airbnb_profiles
+from logic.airbnb_profiles import airbnb_profile_url
+from logic.attestation_query_service import attestations_changed
 from logic.service_utils import (
     AirbnbVerificationError,
     EmailVerificationError,
     FacebookVerificationError,
     PhoneVerificationError,
+    ServiceError,
     TwitterVerificationError,
 )
 from requests_oauthlib import OAuth1
-from util import attestations, urls
-from web3 import Web3
+from sqlalchemy.exc import OperationalError
+from util import email_queue, http_client, metrics, mnemonic, signing_pool, tasks, urls
+from util import attestations as attestation_utils
+from util.attestation_writer import AttestationWriter, WriterFull
+from util.circuit_breaker import CircuitOpenError
+from util.deadline import DeadlineExceeded
+from util.email_queue import Delivery, EmailQueue
+from util.singleflight import SingleFlight
+from util.token_pool import TokenPool
 
 signing_key = settings.ATTESTATION_SIGNING_KEY
 
@@ -34,6 +50,29 @@ twitter_request_token_url = 'https://api.twitter.com/oauth/request_token'
 twitter_authenticate_url = 'https://api.twitter.com/oauth/authenticate'
 twitter_access_token_url = 'https://api.twitter.com/oauth/access_token'
 
+authy_url = 'https://api.authy.com/protected/json/phones/verification/'
+facebook_graph_url = 'https://graph.facebook.com'
+EMAIL_SUBJECT = 'Your Origin Verification Code'
+EMAIL_MESSAGE = ('Your Origin verification code is {}.'
+                 ' It will expire in 30 minutes.')
+# Substitution tag for the code in batched verification emails
+EMAIL_CODE_TAG = '-code-'
+# Errors of provider calls that did not get a response
+PROVIDER_UNREACHABLE = (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout)
+# Verification codes kept per (eth_address, airbnbUserId)
+AIRBNB_CODE_CACHE_SIZE = 4096
+# Attestations per INSERT statement of a write-behind flush
+ROWS_PER_INSERT = 1000
+
+# Hosts to open keep-alive connections to at startup when HTTP_WARM_UP is set
+provider_urls = [
+    authy_url,
+    facebook_graph_url,
+    twitter_request_token_url,
+    airbnb_profile_url
+]
+
 CLAIM_TYPES = {
     'phone': 10,
     'email': 11,
@@ -44,6 +83,9 @@ CLAIM_TYPES = {
 
 logger = logging.getLogger(__name__)
 
+_phone_flights = SingleFlight('phone.start',
+                              settings.PHONE_VERIFICATION_DEDUP_WINDOW)
+
 
 class VerificationServiceResponse():
     def __init__(self, data={}):
@@ -81,30 +123,12 @@ class VerificationService:
             # the country of the telephone number
             params['locale'] = locale
 
-        headers = {
-            'X-Authy-API-Key': settings.TWILIO_VERIFY_API_KEY
-        }
-
-        url = 'https://api.authy.com/protected/json/phones/verification/start'
-        response = requests.post(url, params=params, headers=headers)
-
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as exc:
-            logger.exception(exc)
-            if response.json()['error_code'] == "60033":
-                raise ValidationError('Phone number is invalid.',
-                                      field_names=['phone'])
-            elif response.json()['error_code'] == "60082":
-                raise ValidationError('Cannot send SMS to landline.',
-                                      field_names=['phone'])
-            else:
-                # Remaining error codes are due to Twilio account issues or
-                # configuration of API key.
-                # See https://www.twilio.com/docs/verify/return-and-error-codes
-                raise PhoneVerificationError(
-                    'Could not send verification code. Please try again shortly.'
-                )
+        # Repeated taps and client retries share one Twilio call. It is made
+        # on the request thread, as its error is the response to an invalid
+        # or landline number.
+        _phone_flights.do(
+            phone_verification_key(country_calling_code, phone, method),
+            start_phone_verification, params)
 
         return VerificationServiceResponse()
 
@@ -137,52 +161,22 @@ class VerificationService:
             'X-Authy-API-Key': settings.TWILIO_VERIFY_API_KEY
         }
 
-        url = 'https://api.authy.com/protected/json/phones/verification/check'
-        response = requests.get(url, params=params, headers=headers)
+        url = authy_url + 'check'
+        with provider_errors(PhoneVerificationError):
+            response = http_client.get(url, params=params, headers=headers)
 
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as exc:
             logger.exception(exc)
-            if response.json()['error_code'] == '60023':
-                # This error code could also mean that no phone verification was ever
-                # created for that country calling code and phone number
-                raise ValidationError('Verification code has expired.',
-                                      field_names=['code'])
-            elif response.json()['error_code'] == '60022':
-                raise ValidationError('Verification code is incorrect.',
-                                      field_names=['code'])
-            else:
-                raise PhoneVerificationError(
-                    'Could not verify code. Please try again shortly.'
-                )
+            raise phone_verification_check_error(response.json()['error_code'])
 
         # This may be unnecessary because the response has a 200 status code
         # but it a good precaution to handle any inconsistency between the
         # success field and the status code
         if response.json()['success'] is True:
-            # TODO: determine what the text should be
-            data = 'phone verified'
-            # TODO: determine claim type integer code for phone verification
-            signature = attestations.generate_signature(
-                signing_key, eth_address, CLAIM_TYPES['phone'], data
-            )
-
-            attestation = Attestation(
-                method=AttestationTypes.PHONE,
-                eth_address=eth_address,
-                value="{} {}".format(country_calling_code, phone),
-                signature=signature,
-                remote_ip_address=request.remote_addr
-            )
-            db.session.add(attestation)
-            db.session.commit()
-
-            return VerificationServiceResponse({
-                'signature': signature,
-                'claim_type': CLAIM_TYPES['phone'],
-                'data': data
-            })
+            return record_phone_attestation(
+                country_calling_code, phone, eth_address, request.remote_addr)
 
         raise PhoneVerificationError(
             'Could not verify code. Please try again shortly.'
@@ -193,6 +187,9 @@ class VerificationService:
         The verification code and the expiry are stored in a server side session
         to compare against user input.
 
+        With EMAIL_BATCH_DELAY set the email is queued and sent together with
+        others, and a failed send is reported by verify_email instead.
+
         Args:
             email (str): Email address to send the verification to
 
@@ -210,15 +207,19 @@ class VerificationService:
             'expiry': datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
         }
 
+        queue = verification_email_queue()
+        if queue is not None:
+            delivery = queue.submit(
+                email, {EMAIL_CODE_TAG: verification_code})
+            session['email_attestation']['delivery'] = delivery.id
+            return VerificationServiceResponse()
+
         # Build the email containing the verification code
         from_email = Email(settings.SENDGRID_FROM_EMAIL)
         to_email = Email(email)
-        subject = 'Your Origin Verification Code'
-        message = 'Your Origin verification code is {}.'.format(
-            verification_code)
-        message += ' It will expire in 30 minutes.'
-        content = Content('text/plain', message)
-        mail = Mail(from_email, subject, to_email, content)
+        content = Content('text/plain',
+                          EMAIL_MESSAGE.format(verification_code))
+        mail = Mail(from_email, EMAIL_SUBJECT, to_email, content)
 
         try:
             _send_email_using_sendgrid(mail)
@@ -256,6 +257,14 @@ class VerificationService:
                 'No verification code was found for that email.'
             )
 
+        # A batched email may have failed after the code was handed out
+        queue = verification_email_queue()
+        if queue is not None and queue.status(
+                verification_obj.get('delivery')) == Delivery.FAILED:
+            raise EmailVerificationError(
+                'Could not send verification code. Please try again shortly.'
+            )
+
         if verification_obj['expiry'] < datetime.datetime.utcnow():
             raise ValidationError('Verification code has expired.', 'code')
 
@@ -267,25 +276,10 @@ class VerificationService:
         # TODO: determine what the text should be
         data = 'email verified'
         # TODO: determine claim type integer code for email verification
-        signature = attestations.generate_signature(
-            signing_key, eth_address, CLAIM_TYPES['email'], data
-        )
-
-        attestation = Attestation(
-            method=AttestationTypes.EMAIL,
-            eth_address=eth_address,
-            value=email,
-            signature=signature,
-            remote_ip_address=request.remote_addr
+        return _record_attestation(
+            AttestationTypes.EMAIL, eth_address, email,
+            CLAIM_TYPES['email'], data, request.remote_addr
         )
-        db.session.add(attestation)
-        db.session.commit()
-
-        return VerificationServiceResponse({
-            'signature': signature,
-            'claim_type': CLAIM_TYPES['email'],
-            'data': data
-        })
 
     def facebook_auth_url():
         client_id = settings.FACEBOOK_CLIENT_ID
@@ -295,76 +289,51 @@ class VerificationService:
         return VerificationServiceResponse({'url': url})
 
     def verify_facebook(code, eth_address):
-        base_url = "https://graph.facebook.com"
-
-        response = requests.get(
-            "{}/v2.12/oauth/access_token".format(base_url),
-            params={
-                "client_id": settings.FACEBOOK_CLIENT_ID,
-                "client_secret": settings.FACEBOOK_CLIENT_SECRET,
-                "redirect_uri": urls.absurl("/redirects/facebook/"),
-                "code": code
-            }
-        )
+        """Exchange a Facebook login code for an access token and attest to
+        the name on the profile it grants access to.
 
-        if "access_token" not in response.json() or "error" in response.json():
-            if "error" in response.json():
-                logger.error(response.json()["error"])
-            raise FacebookVerificationError("The code you provided is invalid.")
+        The profile fetch needs the token, so the two Graph calls can't be
+        overlapped; both reuse a pooled connection to graph.facebook.com and
+        the time spent in each is recorded in the facebook.* timers.
 
-        access_token = response.json()["access_token"]
-
-        response = requests.get(
-            "{}/me".format(base_url),
-            params={"access_token": access_token}
-        )
-
-        # TODO: determine what the text should be
-        data = 'facebook verified'
-        # TODO: determine claim type integer code for phone verification
-        signature = attestations.generate_signature(
-            signing_key, eth_address, CLAIM_TYPES['facebook'], data
-        )
+        Raises:
+            FacebookVerificationError: The code was not exchanged for a token
+        """
+        with metrics.timed('facebook.access_token'), \
+                provider_errors(FacebookVerificationError):
+            response = http_client.get(
+                "{}/v2.12/oauth/access_token".format(facebook_graph_url),
+                params=facebook_access_token_params(code)
+            )
+            access_token = facebook_access_token(response.json())
 
-        attestation = Attestation(
-            method=AttestationTypes.FACEBOOK,
-            eth_address=eth_address,
-            value=response.json()['name'],
-            signature=signature,
-            remote_ip_address=request.remote_addr
-        )
-        db.session.add(attestation)
-        db.session.commit()
+        with metrics.timed('facebook.profile'), \
+                provider_errors(FacebookVerificationError):
+            response = http_client.get(
+                "{}/me".format(facebook_graph_url),
+                params=facebook_profile_params(access_token)
+            )
+            name = response.json()['name']
 
-        return VerificationServiceResponse({
-            'signature': signature,
-            'claim_type': CLAIM_TYPES['facebook'],
-            'data': data
-        })
+        with metrics.timed('facebook.attestation'):
+            return record_facebook_attestation(
+                name, eth_address, request.remote_addr)
 
     def twitter_auth_url():
-        callback_uri = urls.absurl("/redirects/twitter/")
+        """Start a Twitter verification, storing a request token in the
+        session and returning the URL the user authorizes it at.
 
-        oauth = OAuth1(
-            settings.TWITTER_CONSUMER_KEY,
-            settings.TWITTER_CONSUMER_SECRET,
-            callback_uri=callback_uri
-        )
+        The token is taken from the pre-fetched pool when one is configured
+        and has a token ready, otherwise it is requested from Twitter.
 
-        response = requests.post(url=twitter_request_token_url, auth=oauth)
-
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as exc:
-            logger.exception(exc)
-            raise TwitterVerificationError('Invalid response from Twitter.')
-
-        as_bytes = urllib.parse.parse_qs(response.content)
-        token_bytes = as_bytes[b'oauth_token'][0]
-        token_secret_bytes = as_bytes[b'oauth_token_secret'][0]
-        request_token = {}
-        request_token['oauth_token'] = token_bytes.decode('utf-8')
-        request_token['oauth_token_secret'] = token_secret_bytes.decode('utf-8')
+        Raises:
+            TwitterVerificationError: Twitter did not issue a request token
+        """
+        pool = twitter_request_token_pool()
+        request_token = pool.get() if pool is not None else None
+        if request_token is None:
+            with metrics.timed('twitter.request_token'):
+                request_token = fetch_twitter_request_token()
         session['request_token'] = request_token
 
         url = '{}?oauth_token={}'.format(
@@ -388,7 +357,9 @@ class VerificationService:
             verifier=oauth_verifier
         )
 
-        response = requests.post(url=twitter_access_token_url, auth=oauth)
+        with provider_errors(TwitterVerificationError):
+            response = http_client.post(url=twitter_access_token_url,
+                                        auth=oauth)
 
         try:
             response.raise_for_status()
@@ -401,28 +372,13 @@ class VerificationService:
         # TODO: determine what the text should be
         data = 'twitter verified'
         # TODO: determine claim type integer code for phone verification
-        signature = attestations.generate_signature(
-            signing_key, eth_address, CLAIM_TYPES['twitter'], data
-        )
-
         query_string = urllib.parse.parse_qs(response.content)
         screen_name = query_string[b'screen_name'][0].decode('utf-8')
 
-        attestation = Attestation(
-            method=AttestationTypes.TWITTER,
-            eth_address=eth_address,
-            value=screen_name,
-            signature=signature,
-            remote_ip_address=request.remote_addr
+        return _record_attestation(
+            AttestationTypes.TWITTER, eth_address, screen_name,
+            CLAIM_TYPES['twitter'], data, request.remote_addr
         )
-        db.session.add(attestation)
-        db.session.commit()
-
-        return VerificationServiceResponse({
-            'signature': signature,
-            'claim_type': CLAIM_TYPES['twitter'],
-            'data': data
-        })
 
     def generate_airbnb_verification_code(eth_address, airbnbUserId):
         validate_airbnb_user_id(airbnbUserId)
@@ -431,72 +387,396 @@ class VerificationService:
             'code': get_airbnb_verification_code(eth_address, airbnbUserId)
         })
 
-    def verify_airbnb(eth_address, airbnbUserId):
+    def verify_airbnb(eth_address, airbnbUserId, wait=0):
+        """Check the user's Airbnb profile for their verification code.
+
+        Args:
+            eth_address (str): Address of ERC725 identity token for claim
+            airbnbUserId (str): User's id on Airbnb website
+            wait (int): Seconds to keep checking for the code before giving
+                up, capped at AIRBNB_VERIFY_MAX_WAIT
+
+        Returns:
+            VerificationServiceResponse
+
+        Raises:
+            ValidationError: Verification request failed due to invalid arguments
+            AirbnbVerificationError: The profile could not be fetched or does
+                not contain the code
+        """
         validate_airbnb_user_id(airbnbUserId)
 
         code = get_airbnb_verification_code(eth_address, airbnbUserId)
 
-        try:
-            # TODO: determine if this user agent is acceptable.
-            # We need to set an user agent otherwise Airbnb returns 403
-            response = urlopen(Request(
-                url='https://www.airbnb.com/users/show/' + airbnbUserId,
-                headers={'User-Agent': 'Origin Protocol client-0.1.0'}
-            ))
-        except HTTPError as e:
-            if e.code == 404:
-                raise AirbnbVerificationError(
-                    'Airbnb user id: ' + airbnbUserId + ' not found.')
-            else:
-                raise AirbnbVerificationError(
-                    "Can not fetch user's Airbnb profile.")
-        except URLError as e:
-            raise AirbnbVerificationError(
-                "Can not fetch user's Airbnb profile.")
-
-        if code not in response.read().decode('utf-8'):
+        found = airbnb_profiles.wait_for_code(
+            airbnbUserId, code, min(wait, settings.AIRBNB_VERIFY_MAX_WAIT))
+        if not found:
             raise AirbnbVerificationError(
                 "Origin verification code: " + code +
                 " has not been found in user's Airbnb profile."
             )
 
-        # TODO: determine the schema for claim data
-        data = 'airbnbUserId:' + airbnbUserId
-        signature = attestations.generate_signature(
-            signing_key, eth_address, CLAIM_TYPES['airbnb'], data
-        )
+        return record_airbnb_attestation(
+            airbnbUserId, eth_address, request.remote_addr)
+
+
+def phone_verification_key(country_calling_code, phone, method):
+    """Key that identifies repeats of a verification request, ignoring how
+    the phone number is punctuated."""
+    return (country_calling_code, re.sub(r'\D', '', phone), method)
+
+
+def start_phone_verification(params):
+    """Ask the Twilio Verify API to send a verification code.
+
+    Args:
+        params (dict): Parameters of the verification start call
+
+    Raises:
+        ValidationError: Verification request failed due to invalid arguments
+        PhoneVerificationError: Verification request failed for a reason not
+            related to the arguments
+    """
+    headers = {
+        'X-Authy-API-Key': settings.TWILIO_VERIFY_API_KEY
+    }
+
+    url = authy_url + 'start'
+    with provider_errors(PhoneVerificationError):
+        response = http_client.post(url, params=params, headers=headers)
+
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as exc:
+        logger.exception(exc)
+        raise phone_verification_start_error(response.json()['error_code'])
+
+
+@contextmanager
+def provider_errors(error_class, unreachable=PROVIDER_UNREACHABLE):
+    """Raise error_class, with a 503 status, when a provider call in the
+    block can't be made: the provider's circuit breaker is open, the call
+    failed or timed out, or the request ran out of time.
+
+    Args:
+        error_class (type): ServiceError subclass of the verification
+        unreachable (tuple): Exception types that mean the provider could not
+            be reached
+    """
+    try:
+        yield
+    except (CircuitOpenError, DeadlineExceeded) + unreachable as exc:
+        logger.warning('Provider call failed: %r', exc)
+        raise error_class(
+            'The verification service is unavailable. Please try again '
+            'shortly.', 503)
+
+
+def phone_verification_start_error(error_code):
+    """Map an Authy error code for a failed verification start to the
+    exception to raise."""
+    if error_code == "60033":
+        return ValidationError('Phone number is invalid.',
+                               field_names=['phone'])
+    elif error_code == "60082":
+        return ValidationError('Cannot send SMS to landline.',
+                               field_names=['phone'])
+    # Remaining error codes are due to Twilio account issues or
+    # configuration of API key.
+    # See https://www.twilio.com/docs/verify/return-and-error-codes
+    return PhoneVerificationError(
+        'Could not send verification code. Please try again shortly.'
+    )
+
+
+def phone_verification_check_error(error_code):
+    """Map an Authy error code for a failed verification check to the
+    exception to raise."""
+    if error_code == '60023':
+        # This error code could also mean that no phone verification was ever
+        # created for that country calling code and phone number
+        return ValidationError('Verification code has expired.',
+                               field_names=['code'])
+    elif error_code == '60022':
+        return ValidationError('Verification code is incorrect.',
+                               field_names=['code'])
+    return PhoneVerificationError(
+        'Could not verify code. Please try again shortly.'
+    )
+
+
+def facebook_access_token_params(code):
+    return {
+        "client_id": settings.FACEBOOK_CLIENT_ID,
+        "client_secret": settings.FACEBOOK_CLIENT_SECRET,
+        "redirect_uri": urls.absurl("/redirects/facebook/"),
+        "code": code
+    }
+
+
+def facebook_profile_params(access_token):
+    # Only ask for the fields that are stored with the attestation
+    return {"access_token": access_token, "fields": "name"}
+
+
+def facebook_access_token(body):
+    """Extract the access token from a Facebook access token response.
+
+    Raises:
+        FacebookVerificationError: The code was not exchanged for a token
+    """
+    if "access_token" not in body or "error" in body:
+        if "error" in body:
+            logger.error(body["error"])
+        raise FacebookVerificationError("The code you provided is invalid.")
+    return body["access_token"]
+
+
+def fetch_twitter_request_token():
+    """Request a new OAuth request token from Twitter.
+
+    Returns:
+        dict: oauth_token and oauth_token_secret
+
+    Raises:
+        TwitterVerificationError: Twitter did not issue a request token
+    """
+    oauth = OAuth1(
+        settings.TWITTER_CONSUMER_KEY,
+        settings.TWITTER_CONSUMER_SECRET,
+        callback_uri=urls.absurl("/redirects/twitter/")
+    )
+
+    with provider_errors(TwitterVerificationError):
+        response = http_client.post(url=twitter_request_token_url, auth=oauth)
+
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as exc:
+        logger.exception(exc)
+        raise TwitterVerificationError('Invalid response from Twitter.')
+
+    as_bytes = urllib.parse.parse_qs(response.content)
+    token_bytes = as_bytes[b'oauth_token'][0]
+    token_secret_bytes = as_bytes[b'oauth_token_secret'][0]
+    return {
+        'oauth_token': token_bytes.decode('utf-8'),
+        'oauth_token_secret': token_secret_bytes.decode('utf-8')
+    }
+
+
+_twitter_request_tokens = None
+_twitter_request_tokens_lock = threading.Lock()
+
+
+def twitter_request_token_pool():
+    """Return the shared pool of pre-fetched Twitter request tokens, starting
+    it on first use, or None when TWITTER_REQUEST_TOKEN_POOL_SIZE is 0.
+    """
+    global _twitter_request_tokens
+    if _twitter_request_tokens is None and settings.TWITTER_REQUEST_TOKEN_POOL_SIZE:
+        with _twitter_request_tokens_lock:
+            if _twitter_request_tokens is None:
+                _twitter_request_tokens = TokenPool(
+                    fetch_twitter_request_token,
+                    settings.TWITTER_REQUEST_TOKEN_POOL_SIZE,
+                    settings.TWITTER_REQUEST_TOKEN_MAX_AGE,
+                    'twitter.request_token_pool'
+                )
+                _twitter_request_tokens.start()
+    return _twitter_request_tokens
+
 
-        attestation = Attestation(
-            method=AttestationTypes.AIRBNB,
+_verification_emails = None
+_verification_emails_lock = threading.Lock()
+
+
+def verification_email_queue():
+    """Return the shared queue verification emails are batched in, starting
+    it on first use, or None when EMAIL_BATCH_DELAY is 0.
+    """
+    global _verification_emails
+    if _verification_emails is None and settings.EMAIL_BATCH_DELAY:
+        with _verification_emails_lock:
+            if _verification_emails is None:
+                message = {
+                    'from': {'email': settings.SENDGRID_FROM_EMAIL},
+                    'subject': EMAIL_SUBJECT,
+                    'content': [{
+                        'type': 'text/plain',
+                        'value': EMAIL_MESSAGE.format(EMAIL_CODE_TAG)
+                    }]
+                }
+                _verification_emails = EmailQueue(
+                    email_queue.get_transport(), message,
+                    'email.verification',
+                    batch_size=settings.EMAIL_BATCH_SIZE,
+                    max_delay=settings.EMAIL_BATCH_DELAY
+                )
+                _verification_emails.start()
+    return _verification_emails
+
+
+_attestation_writer = None
+_attestation_writer_lock = threading.Lock()
+
+
+def attestation_writer():
+    """Return the shared write-behind writer attestations are stored with,
+    starting it on first use, or None when ATTESTATION_WRITE_DELAY is 0.
+    """
+    global _attestation_writer
+    if _attestation_writer is None and settings.ATTESTATION_WRITE_DELAY:
+        with _attestation_writer_lock:
+            if _attestation_writer is None:
+                _attestation_writer = AttestationWriter(
+                    functools.partial(insert_attestations,
+                                      current_app._get_current_object()),
+                    settings.ATTESTATION_SPOOL_DIR,
+                    batch_size=settings.ATTESTATION_WRITE_BATCH_SIZE,
+                    max_delay=settings.ATTESTATION_WRITE_DELAY,
+                    max_pending=settings.ATTESTATION_WRITE_QUEUE_SIZE,
+                    # Anything else is a row the database refuses, such as
+                    # a DataError, and is set aside rather than retried
+                    transient=(OperationalError,)
+                )
+                _attestation_writer.start()
+                atexit.register(_attestation_writer.stop)
+    return _attestation_writer
+
+
+def insert_attestations(app, rows):
+    """Insert attestations queued by the write-behind writer, in one
+    transaction and ROWS_PER_INSERT rows per statement.
+
+    Args:
+        app (Flask): App whose database the rows are written to
+        rows (list of dict): Attestation columns, with method the name of an
+            AttestationTypes member and created_at a UTC timestamp
+    """
+    with app.app_context():
+        for start in range(0, len(rows), ROWS_PER_INSERT):
+            db.session.execute(Attestation.__table__.insert().values([
+                dict(row,
+                     # Rows spooled before signer was added lack it
+                     signer=row.get('signer'),
+                     method=AttestationTypes[row['method']],
+                     created_at=datetime.datetime.utcfromtimestamp(
+                         row['created_at']))
+                for row in rows[start:start + ROWS_PER_INSERT]
+            ]))
+        with metrics.observed('db.commit', task='insert_attestations'):
+            db.session.commit()
+    for eth_address in {row['eth_address'] for row in rows}:
+        attestations_changed(eth_address)
+
+
+def record_phone_attestation(country_calling_code, phone, eth_address,
+                             remote_ip_address):
+    # TODO: determine what the text should be
+    data = 'phone verified'
+    # TODO: determine claim type integer code for phone verification
+    value = "{} {}".format(country_calling_code, phone)
+    return _record_attestation(AttestationTypes.PHONE, eth_address, value,
+                               CLAIM_TYPES['phone'], data, remote_ip_address)
+
+
+def record_facebook_attestation(name, eth_address, remote_ip_address):
+    # TODO: determine what the text should be
+    data = 'facebook verified'
+    return _record_attestation(AttestationTypes.FACEBOOK, eth_address, name,
+                               CLAIM_TYPES['facebook'], data, remote_ip_address)
+
+
+def record_airbnb_attestation(airbnbUserId, eth_address, remote_ip_address):
+    # TODO: determine the schema for claim data
+    data = 'airbnbUserId:' + airbnbUserId
+    return _record_attestation(AttestationTypes.AIRBNB, eth_address,
+                               airbnbUserId, CLAIM_TYPES['airbnb'], data,
+                               remote_ip_address)
+
+
+def _record_attestation(method, eth_address, value, claim_type, data,
+                        remote_ip_address):
+    """Sign the claim for a successful verification and store the attestation.
+
+    Returns:
+        VerificationServiceResponse
+    """
+    signature = _sign_attestation(method, eth_address, value, claim_type, data)
+    signer = attestation_utils.get_signer(signing_key).address
+
+    # The response only needs the signature, so the row can be written by the
+    # worker, or by the write-behind writer once it is spooled. Whichever
+    # writes it drops the identity's cached attestation pages after committing
+    writer = attestation_writer()
+    if writer is None:
+        tasks.store_attestation.delay(method.name, eth_address, value,
+                                      signature, remote_ip_address, signer)
+    else:
+        try:
+            writer.submit({
+                'method': method.name,
+                'eth_address': eth_address,
+                'value': value,
+                'signature': signature,
+                'remote_ip_address': remote_ip_address,
+                'signer': signer,
+                'created_at': time.time()
+            }, timeout=settings.ATTESTATION_WRITE_TIMEOUT)
+        except WriterFull:
+            raise ServiceError(
+                'Too many verifications are in progress. Please try again '
+                'shortly.', 503)
+
+    return VerificationServiceResponse({
+        'signature': signature,
+        'claim_type': claim_type,
+        'data': data
+    })
+
+
+def _sign_attestation(method, eth_address, value, claim_type, data):
+    """Sign the claim for an attestation.
+
+    Repeat verifications are served from the signature cache. When
+    SIGNATURE_DB_FALLBACK is set, a cache miss first looks for a stored
+    attestation with the same method, identity and value signed by the
+    current signing key, and reuses its signature without signing or
+    recovering it. Attestations of a rotated key, or stored before their
+    signer was, are signed afresh.
+
+    Returns:
+        str: Hex encoded signature
+    """
+    def stored_signature():
+        if not is_hex_address(eth_address):
+            # Can't be stored, signing will reject it
+            return None
+        # The claim type and data follow from the method and value
+        attestation = Attestation.query.with_entities(
+            Attestation.signature
+        ).filter_by(
+            method=method,
             eth_address=eth_address,
-            value=airbnbUserId,
-            signature=signature,
-            remote_ip_address=request.remote_addr
-        )
-        db.session.add(attestation)
-        db.session.commit()
+            value=value,
+            signer=attestation_utils.get_signer(signing_key).address
+        ).order_by(Attestation.id.desc()).first()
+        if attestation is None:
+            return None
+        return attestation.signature
 
-        return VerificationServiceResponse({
-            'signature': signature,
-            'claim_type': CLAIM_TYPES['airbnb'],
-            'data': data
-        })
+    return signing_pool.generate_signature(
+        signing_key, eth_address, claim_type, data,
+        lookup=stored_signature if settings.SIGNATURE_DB_FALLBACK else None
+    )
 
 
+@functools.lru_cache(maxsize=AIRBNB_CODE_CACHE_SIZE)
 def get_airbnb_verification_code(eth_address, airbnbUserid):
-    # take the last 7 bytes of the hash
-    hashCode = Web3.sha3(text=eth_address + airbnbUserid)[:7]
-
-    with open("./{}/mnemonic_words_english.txt".format(settings.RESOURCES_DIR)) as f:
-        mnemonicWords = f.readlines()
-        # convert those bytes to mnemonic phrases
-        return ' '.join(
-            list(
-                map(
-                    lambda i: mnemonicWords[int(i)].rstrip(), hashCode
-                )
-            )
-        )
+    # convert the first 7 bytes of the hash to mnemonic words
+    hashCode = keccak(text=eth_address + airbnbUserid)[:7]
+    return mnemonic.get_wordlist().encode(hashCode)
 
 
 def validate_airbnb_user_id(airbnbUserId):
@@ -511,7 +791,8 @@ def numeric_eth(str_eth_address):
 
 
 def _send_email_using_sendgrid(mail):
-    """Send a SendGrid mail object using the SendGrid API.
+    """Send a SendGrid mail object using the SendGrid API, from the worker
+    when BACKGROUND_TASKS is set.
 
     This functionality is in a separate function so it can be mocked during
     tests.
@@ -519,5 +800,4 @@ def _send_email_using_sendgrid(mail):
     Args:
         mail (sendgrid.helpers.mail.mail.Mail) - mail to be sent
     """
-    sg = sendgrid.SendGridAPIClient(apikey=settings.SENDGRID_API_KEY)
-    sg.client.mail.send.post(request_body=mail.get())
+    tasks.send_email.delay(mail.get())
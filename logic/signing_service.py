@@ -0,0 +1,89 @@
+from collections import deque
+
+from config import settings
+from util import signing_pool
+from util.attestations import get_signer
+
+
+class SigningServiceResponse():
+    def __init__(self, data={}):
+        self.data = data
+
+
+class SigningService:
+
+    def sign_claims(claims, pool=None):
+        """Sign a stream of claims with the attestation signing key.
+
+        Args:
+            claims (iterable of dict): Claims with 'eth_address', 'claim_type'
+                and 'data' keys. Consumed lazily.
+            pool (SigningPool): Pool to sign in. Defaults to the shared
+                signing pool, or the calling thread when SIGNING_POOL_SIZE
+                is 0, so no worker processes are started per request.
+
+        Yields:
+            dict: The claim with either a 'signature' or an 'errors' key added,
+                one per claim and in input order.
+        """
+        pending = deque()
+
+        def to_sign():
+            for claim in claims:
+                pending.append(claim)
+                yield claim['eth_address'], claim['claim_type'], claim['data']
+
+        pool = pool or signing_pool.get_pool()
+        if pool is not None:
+            signed = pool.sign_many(to_sign())
+        else:
+            signed = signing_pool.sign_claims(
+                settings.ATTESTATION_SIGNING_KEY, to_sign())
+
+        for signature, error in signed:
+            result = dict(pending.popleft())
+            if error is None:
+                result['signature'] = signature
+            else:
+                result['errors'] = [error]
+            yield result
+
+    def verify_signatures(attestations, issuer=None):
+        """Check which of a batch of issued attestations were signed by the
+        issuer.
+
+        The signers are recovered on the shared signing pool when
+        SIGNING_POOL_SIZE is set, and on the request thread otherwise. No
+        worker processes are started per request.
+
+        Args:
+            attestations (list of dict): Attestations with 'eth_address',
+                'claim_type', 'data' and 'signature' keys.
+            issuer (str): Address expected to have signed the attestations.
+                Defaults to the address of the attestation signing key.
+
+        Returns:
+            SigningServiceResponse
+        """
+        if issuer is None:
+            issuer = get_signer(settings.ATTESTATION_SIGNING_KEY).address
+
+        claims = [(a['eth_address'], a['claim_type'], a['data'], a['signature'])
+                  for a in attestations]
+        pool = signing_pool.get_pool()
+        if pool is not None:
+            recovered = pool.recover_many(claims)
+        else:
+            recovered = signing_pool.recover_signers(claims)
+
+        results = []
+        for signer, error in recovered:
+            if error is None:
+                results.append({
+                    'valid': signer.lower() == issuer.lower(),
+                    'signer': signer
+                })
+            else:
+                results.append({'valid': False, 'errors': [error]})
+
+        return SigningServiceResponse({'issuer': issuer, 'results': results})
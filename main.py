@@ -1,7 +1,7 @@
 from app import app
 from app import app_config
 from config import settings
-from util import patches
+from util import patches, signing_pool
 
 from views import web_views
 
@@ -9,6 +9,8 @@ from views import web_views
 assert patches
 assert web_views
 
+# Fork the signing workers before any request thread is started
+signing_pool.start_pool()
 app_config.init_prod_app(app)
 
 if __name__ == '__main__':
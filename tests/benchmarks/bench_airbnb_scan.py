@@ -0,0 +1,157 @@
+"""
+Wall time, bytes transferred and peak memory of checking an Airbnb profile
+page for a verification code: reading and decoding the whole page, as
+verify_airbnb used to, against util.streams.response_contains reading a
+gzip compressed stream and stopping at the code.
+
+Pages are served by a local stand-in server. The code is placed near the
+start, at the end, or left out of the page.
+
+Usage:
+    python -m tests.benchmarks.bench_airbnb_scan [--size-mb 4] [--count 10] \\
+        [--bandwidth-mbps 50] [--chunk-kb 16]
+"""
+import argparse
+import gzip
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.request import Request, urlopen
+
+from util import http_client
+from util.streams import response_contains
+
+CODE = 'art brick aspect accident brass betray antenna'
+HEADERS = {
+    'User-Agent': 'Origin Protocol client-0.1.0',
+    'Accept-Encoding': 'gzip'
+}
+CHUNK_SIZE = 16 * 1024
+
+
+def _page(size, position):
+    """
+    HTML of about size bytes built from mnemonic words, with CODE inserted at
+    position (a fraction of the page) or left out when position is None.
+    """
+    with open('resources/mnemonic_words_english.txt') as f:
+        words = f.read().split()
+    rng = random.Random(0)
+    body = []
+    length = 0
+    while length < size:
+        line = '<p>{}</p>\n'.format(' '.join(rng.choice(words) for _ in range(12)))
+        body.append(line)
+        length += len(line)
+    if position is not None:
+        body.insert(int(len(body) * position),
+                    '<p>Origin verification code: {}</p>\n'.format(CODE))
+    return ('<html><body>' + ''.join(body) + '</body></html>').encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    pages = {}
+    # Bytes per second the page is sent at, 0 for as fast as possible
+    bandwidth = 0
+
+    def handle(self):
+        try:
+            super(_Handler, self).handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading once it found the code
+            pass
+
+    def do_GET(self):
+        page, compressed = self.pages[self.path]
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = compressed if gzipped else page
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 64 * 1024):
+            if self.bandwidth:
+                time.sleep(64 * 1024 / self.bandwidth)
+            self.wfile.write(body[start:start + 64 * 1024])
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def read_whole_page(url):
+    body = urlopen(Request(url, headers={'User-Agent': HEADERS['User-Agent']})).read()
+    return CODE in body.decode('utf-8'), len(body)
+
+
+def stream_page(url):
+    response = http_client.get(url, headers=HEADERS, stream=True)
+    response.raise_for_status()
+    matcher = response_contains(response, CODE.encode('utf-8'), CHUNK_SIZE, normalize=True)
+    return matcher.found, response.raw.tell()
+
+
+def _measure(check, url, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        found, transferred = check(url)
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    check(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return found, transferred, statistics.median(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=float, default=4,
+                        help="size of each profile page")
+    parser.add_argument('--count', type=int, default=10,
+                        help="timed checks per page and implementation")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0,
+                        help="throttle the server to this many megabits per second")
+    parser.add_argument('--chunk-kb', type=int, default=16,
+                        help="bytes read at a time by the streaming reader")
+    args = parser.parse_args()
+
+    global CHUNK_SIZE
+    CHUNK_SIZE = args.chunk_kb * 1024
+    _Handler.bandwidth = args.bandwidth_mbps * 1000 * 1000 / 8
+
+    size = int(args.size_mb * 1024 * 1024)
+    placements = [('early', 0.05), ('end', 1), ('missing', None)]
+    for name, position in placements:
+        page = _page(size, position)
+        _Handler.pages['/users/show/' + name] = (page, gzip.compress(page))
+
+    server = _Server(('localhost', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        print("{:8} {:7} {:>6} {:>12} {:>10} {:>12}".format(
+            'code', 'reader', 'found', 'transferred', 'median', 'peak memory'))
+        for name, _ in placements:
+            url = 'http://localhost:{}/users/show/{}'.format(
+                server.server_address[1], name)
+            for reader, check in [('whole', read_whole_page), ('stream', stream_page)]:
+                found, transferred, median, peak = _measure(check, url, args.count)
+                print("{:8} {:7} {:>6} {:>9.0f} KB {:>7.1f} ms {:>9.0f} KB".format(
+                    name, reader, str(found), transferred / 1024, median, peak / 1024))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Table and index sizes of --rows synthetic attestations stored as hex
+strings and a Postgres enum, as before migration d7a2e5b8c1f3, and as the
+bytea and smallint columns it leaves them in.
+
+Both tables have the primary key and the identity index of the list
+endpoint. Runs against a throwaway PostgreSQL started with
+testing.postgresql, as the test suite does.
+
+Usage:
+    python -m tests.benchmarks.bench_attestation_storage [--rows 10000000] \\
+        [--identities 1000000]
+"""
+import argparse
+
+import psycopg2
+from testing.postgresql import Postgresql
+
+TABLES = {
+    'hex': {
+        'columns': """
+            method attestationtypes,
+            eth_address varchar,
+            signature varchar
+        """,
+        'index': '(lower(eth_address), created_at, id)',
+        'method': '(enum_range(NULL::attestationtypes))[g % 5 + 1]',
+        'eth_address': "'0x' || lpad(to_hex(g % {identities}), 40, '0')",
+        'signature': "'0x' || {signature}",
+    },
+    'bytes': {
+        'columns': """
+            method smallint,
+            eth_address bytea,
+            signature bytea
+        """,
+        'index': '(eth_address, created_at, id)',
+        'method': 'g % 5 + 1',
+        'eth_address': "decode(lpad(to_hex(g % {identities}), 40, '0'), 'hex')",
+        'signature': "decode({signature}, 'hex')",
+    },
+}
+
+# 65 bytes varying per row, as signatures do
+SIGNATURE = "md5(g::text) || md5((g + 1)::text) || md5((g + 2)::text) " \
+            "|| md5((g + 3)::text) || 'ab'"
+
+
+def _create(cursor, name, table, rows, identities):
+    cursor.execute(
+        'CREATE TABLE attestation_{} (id serial PRIMARY KEY, {}, '
+        'value varchar, remote_ip_address inet, created_at timestamp)'.format(
+            name, table['columns']))
+    cursor.execute(
+        'INSERT INTO attestation_{name} (method, eth_address, signature, '
+        'value, remote_ip_address, created_at) '
+        "SELECT {method}, {eth_address}, {signature}, '1 ' || g, "
+        "'192.168.1.1', now() - g * interval '1 second' "
+        'FROM generate_series(1, {rows}) g'.format(
+            name=name, rows=rows, method=table['method'],
+            eth_address=table['eth_address'].format(identities=identities),
+            signature=table['signature'].format(signature=SIGNATURE)))
+    cursor.execute('CREATE INDEX ix_attestation_{}_eth_address_created_at '
+                   'ON attestation_{} {}'.format(name, name, table['index']))
+    cursor.execute('VACUUM ANALYZE attestation_{}'.format(name))
+
+
+def _size(cursor, relation):
+    cursor.execute('SELECT pg_relation_size(%s)', (relation,))
+    return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--identities', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with Postgresql() as postgresql:
+        connection = psycopg2.connect(postgresql.url())
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute("CREATE TYPE attestationtypes AS ENUM "
+                       "('PHONE', 'EMAIL', 'AIRBNB', 'FACEBOOK', 'TWITTER')")
+
+        print("{:6} {:>12} {:>12} {:>12} {:>12}".format(
+            'layout', 'table', 'primary key', 'identity ix', 'bytes/row'))
+        for name, table in TABLES.items():
+            _create(cursor, name, table, args.rows, args.identities)
+            heap = _size(cursor, 'attestation_{}'.format(name))
+            primary_key = _size(cursor, 'attestation_{}_pkey'.format(name))
+            identity = _size(
+                cursor, 'ix_attestation_{}_eth_address_created_at'.format(name))
+            print("{:6} {:>9.1f} MB {:>9.1f} MB {:>9.1f} MB {:>12.1f}".format(
+                name, heap / 2 ** 20, primary_key / 2 ** 20,
+                identity / 2 ** 20, heap / args.rows))
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
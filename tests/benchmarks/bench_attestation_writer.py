@@ -0,0 +1,92 @@
+"""
+Request thread latency and total time for storing attestations from
+concurrent request threads: one transaction per attestation, as verify
+methods did, against util.attestation_writer.AttestationWriter, which
+spools them locally and inserts them together.
+
+The database is stood in for by a lock held for --commit-ms per
+transaction, as a WAL flush serializes commits.
+
+Usage:
+    python -m tests.benchmarks.bench_attestation_writer [--rows 2000] \\
+        [--threads 50] [--commit-ms 4] [--write-delay-ms 20]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+
+from util.attestation_writer import AttestationWriter
+
+
+class StandInDatabase(object):
+    def __init__(self, commit_ms):
+        self.commit_ms = commit_ms
+        self.transactions = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def insert(self, rows):
+        with self._lock:
+            time.sleep(self.commit_ms / 1000)
+            self.transactions += 1
+            self.rows += len(rows)
+
+
+def _run(store, rows, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        for i in range(offset, rows, threads):
+            start = time.perf_counter()
+            store({'eth_address': '0x{:040x}'.format(i),
+                   'signature': '0x' + '00' * 65})
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(offset,))
+               for offset in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=50,
+                        help="concurrent request threads")
+    parser.add_argument('--commit-ms', type=float, default=4,
+                        help="time each database transaction takes")
+    parser.add_argument('--write-delay-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    print("{:12} {:>12} {:>12} {:>12} {:>10}".format(
+        'writer', 'transactions', 'median wait', 'max wait', 'total'))
+    for name in ('direct', 'write-behind'):
+        database = StandInDatabase(args.commit_ms)
+        if name == 'direct':
+            latencies, total = _run(lambda row: database.insert([row]),
+                                    args.rows, args.threads)
+        else:
+            with tempfile.TemporaryDirectory() as spool_dir:
+                writer = AttestationWriter(
+                    database.insert, spool_dir, 'bench.attestation.writer',
+                    max_delay=args.write_delay_ms / 1000)
+                writer.start()
+                latencies, total = _run(writer.submit, args.rows,
+                                        args.threads)
+                writer.stop()
+        assert database.rows == args.rows
+        print("{:12} {:>12} {:>9.2f} ms {:>9.2f} ms {:>8.2f} s".format(
+            name, database.transactions, statistics.median(latencies),
+            max(latencies), total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Request thread latency, total time and SendGrid API calls for sending
+verification emails from concurrent request threads: one API call on the
+request thread per email, as email/generate-code did, against submitting to
+util.email_queue.EmailQueue, which sends them in batches.
+
+SendGrid is stood in for by LocalTransport, with --latency-ms added to each
+API call.
+
+Usage:
+    python -m tests.benchmarks.bench_email_queue [--emails 1000] \\
+        [--threads 50] [--latency-ms 150] [--batch-delay-ms 200] \\
+        [--batch-size 100]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from util.email_queue import EmailQueue, LocalTransport
+
+MESSAGE = {
+    'from': {'email': 'origin@foo.bar'},
+    'subject': 'Your Origin Verification Code',
+    'content': [{'type': 'text/plain',
+                 'value': 'Your Origin verification code is -code-.'}]
+}
+
+
+def direct(transport):
+    def send(email, code):
+        transport.send(dict(MESSAGE, personalizations=[
+            {'to': [{'email': email}], 'substitutions': {'-code-': code}}]))
+    return send, lambda: None
+
+
+def queued(transport, batch_size, max_delay):
+    queue = EmailQueue(transport, MESSAGE, 'bench.email',
+                       batch_size=batch_size, max_delay=max_delay)
+    queue.start()
+    deliveries = []
+
+    def send(email, code):
+        deliveries.append(queue.submit(email, {'-code-': code}))
+
+    def wait():
+        for delivery in deliveries:
+            delivery.wait()
+        queue.stop()
+    return send, wait
+
+
+def _run(send, wait, emails, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        for i in range(offset, emails, threads):
+            start = time.perf_counter()
+            send('user{}@foo.bar'.format(i), '{:06d}'.format(i))
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(offset,))
+               for offset in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wait()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=50,
+                        help="concurrent request threads")
+    parser.add_argument('--latency-ms', type=float, default=150,
+                        help="time each SendGrid API call takes")
+    parser.add_argument('--batch-delay-ms', type=float, default=200)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    print("{:8} {:>10} {:>12} {:>12} {:>10}".format(
+        'sender', 'api calls', 'median wait', 'max wait', 'total'))
+    for name in ('direct', 'queued'):
+        transport = LocalTransport(latency=args.latency_ms / 1000)
+        if name == 'direct':
+            send, wait = direct(transport)
+        else:
+            send, wait = queued(transport, args.batch_size,
+                                args.batch_delay_ms / 1000)
+        latencies, total = _run(send, wait, args.emails, args.threads)
+        assert len(transport.sent) == args.emails
+        print("{:8} {:>10} {:>9.2f} ms {:>9.2f} ms {:>8.2f} s".format(
+            name, len(transport.requests), statistics.median(latencies),
+            max(latencies), total))
+
+
+if __name__ == '__main__':
+    main()
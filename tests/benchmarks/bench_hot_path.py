@@ -0,0 +1,169 @@
+"""
+Microbenchmarks for the attestation hashing and signing hot path.
+
+Runs offline. Each case is timed over batches of distinct inputs and the best
+of several repeats is kept, as microseconds per operation. Results are
+written as JSON so runs can be compared between commits; with --baseline the
+run fails when any case got slower than the threshold allows.
+
+Usage:
+    python -m tests.benchmarks.bench_hot_path --output after.json \\
+        [--baseline before.json] [--threshold 0.1] [--batch-sizes 1,100,1000]
+"""
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import mock
+from eth_account.messages import defunct_hash_message
+from eth_utils import keccak, to_checksum_address
+from web3 import Web3
+from web3.auto.http import w3
+
+from util import attestations
+
+PRIVATE_KEY = ('0x1fc2b755568ce8402e422f8fd0da54d3'
+               '84f42962c8f925116964f39245d429e0')
+
+w3.eth.enable_unaudited_features()
+
+
+def _subjects(count):
+    return [to_checksum_address(keccak(i.to_bytes(8, 'big'))[:20])
+            for i in range(count)]
+
+
+def _claim_hashes(subjects):
+    return [Web3.soliditySha3(['address', 'uint256', 'bytes32'],
+                              [subject, 10, Web3.sha3(text='phone verified')])
+            for subject in subjects]
+
+
+def _generate_signature(subject):
+    return attestations.generate_signature(
+        PRIVATE_KEY, subject, 10, 'phone verified')
+
+
+def _cases(batch_size):
+    """
+    Returns {name: (setup, run, context)}. setup builds the inputs for a batch
+    outside of the timed section, run processes one input and context is
+    entered around the whole case.
+    """
+    subjects = _subjects(batch_size)
+    return {
+        'Web3.sha3': (
+            lambda: ['airbnbUserId:{}'.format(i) for i in range(batch_size)],
+            lambda data: Web3.sha3(text=data),
+            contextlib.ExitStack),
+        'Web3.soliditySha3': (
+            lambda: [[subject, 10, Web3.sha3(text='phone verified')]
+                     for subject in subjects],
+            lambda values: Web3.soliditySha3(
+                ['address', 'uint256', 'bytes32'], values),
+            contextlib.ExitStack),
+        'defunct_hash_message': (
+            lambda: [claim_hash.hex() for claim_hash in _claim_hashes(subjects)],
+            lambda hexstr: defunct_hash_message(hexstr=hexstr),
+            contextlib.ExitStack),
+        'signHash': (
+            lambda: [defunct_hash_message(hexstr=claim_hash.hex())
+                     for claim_hash in _claim_hashes(subjects)],
+            lambda message_hash: w3.eth.account.signHash(
+                message_hash=message_hash, private_key=PRIVATE_KEY),
+            contextlib.ExitStack),
+        'generate_signature': (
+            lambda: subjects,
+            _generate_signature,
+            lambda: mock.patch.object(attestations, 'signature_cache',
+                                      attestations.SignatureCache(0))),
+        'generate_signature (cached)': (
+            lambda: subjects,
+            _generate_signature,
+            contextlib.ExitStack),
+    }
+
+
+def run(batch_sizes, repeat):
+    results = {}
+    for batch_size in batch_sizes:
+        for name, (setup, func, context) in _cases(batch_size).items():
+            inputs = setup()
+            best = None
+            with context():
+                # Warm up caches and lazy imports outside the timed runs
+                for value in inputs:
+                    func(value)
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for value in inputs:
+                        func(value)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+            results['{}[{}]'.format(name, batch_size)] = {
+                'batch_size': batch_size,
+                'us_per_op': best / batch_size * 1e6,
+                'ops_per_sec': batch_size / best
+            }
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """
+    Returns (name, baseline us/op, current us/op) for every case present in
+    both runs that is more than threshold slower than the baseline.
+    """
+    slower = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before and result['us_per_op'] > before['us_per_op'] * (1 + threshold):
+            slower.append((name, before['us_per_op'], result['us_per_op']))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="file to write the JSON results to")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="allowed slowdown against the baseline, 0.1 is 10%%")
+    parser.add_argument('--batch-sizes', default='1,100,1000',
+                        help="comma separated batch sizes")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="timed runs per case, the best one is kept")
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    results = run(batch_sizes, args.repeat)
+    for name, result in sorted(results.items()):
+        print("{:40} {:12.2f} us/op {:12.1f} ops/sec".format(
+            name, result['us_per_op'], result['ops_per_sec']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'threshold': args.threshold,
+                'results': results
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        slower = regressions(results, baseline, args.threshold)
+        for name, before, after in slower:
+            print("REGRESSION {}: {:.2f} -> {:.2f} us/op ({:+.0%})".format(
+                name, before, after, after / before - 1))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Latency of provider style HTTPS calls made with a fresh connection per
+request (requests.get) compared with util.http_client's pooled keep-alive
+sessions, against a local stand-in HTTPS server with a self-signed
+certificate. The difference is the TCP and TLS handshake each verification
+no longer pays for.
+
+Usage:
+    python -m tests.benchmarks.bench_http_pool [--count 200] [--latency-ms 0]
+"""
+import argparse
+import datetime
+import os
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from util import http_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        body = b'{"name": "Origin"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _certificate(directory):
+    key = rsa.generate_private_key(65537, 2048, default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.utcnow()
+    cert = x509.CertificateBuilder() \
+        .subject_name(name).issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), False) \
+        .sign(key, hashes.SHA256(), default_backend())
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_file, key_file
+
+
+def _serve(cert_file, key_file):
+    server = _Server(('localhost', 0), _Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _latencies(get, url, count, cert_file):
+    get(url, verify=cert_file).raise_for_status()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        get(url, verify=cert_file).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def _report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print("{:8} mean {:8.2f} ms  p50 {:8.2f} ms  p99 {:8.2f} ms".format(
+        name, statistics.mean(latencies), statistics.median(latencies), p99))
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200,
+                        help="requests per client")
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help="simulated server processing time per request")
+    args = parser.parse_args()
+
+    _Handler.latency = args.latency_ms / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = _certificate(directory)
+        server = _serve(cert_file, key_file)
+        url = 'https://localhost:{}/me'.format(server.server_address[1])
+        try:
+            before = _report('fresh', _latencies(requests.get, url, args.count, cert_file))
+            after = _report('pooled', _latencies(http_client.get, url, args.count, cert_file))
+        finally:
+            server.shutdown()
+    print("saved {:.2f} ms per request ({:.1f}x)".format(before - after, before / after))
+
+
+if __name__ == '__main__':
+    main()
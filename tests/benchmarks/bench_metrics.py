@@ -0,0 +1,84 @@
+"""
+Cost of recording request metrics from many threads at once, as waitress
+request threads do, with a single lock per metric compared with
+util.metrics' per-thread cells, and the time a /metrics scrape takes to
+render the result.
+
+Usage:
+    python -m tests.benchmarks.bench_metrics [--threads 16] \\
+        [--records 100000] [--endpoints 10]
+"""
+import argparse
+import threading
+import time
+
+from util import metrics
+
+
+class LockedHistogram(object):
+    """A histogram behind one lock, as metrics.Timer used to be."""
+
+    def __init__(self):
+        self.counts = [0] * (len(metrics.BUCKETS) + 1)
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            for i, bound in enumerate(metrics.BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(metrics.BUCKETS)
+            self.counts[i] += 1
+            self.sum += seconds
+
+
+def _run(observe, threads, records):
+    def worker():
+        for i in range(records):
+            observe(i % 100 / 1000)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--records', type=int, default=100000,
+                        help="observations per thread")
+    parser.add_argument('--endpoints', type=int, default=10,
+                        help="labelled histograms and counters to scrape")
+    args = parser.parse_args()
+    total = args.threads * args.records
+
+    locked = LockedHistogram()
+    seconds = _run(locked.observe, args.threads, args.records)
+    print("locked     {:>8.2f} s {:>8.0f} ns/observation".format(
+        seconds, seconds / total * 1e9))
+
+    sharded = metrics.histogram('bench.metrics')
+    seconds = _run(sharded.observe, args.threads, args.records)
+    print("per-thread {:>8.2f} s {:>8.0f} ns/observation".format(
+        seconds, seconds / total * 1e9))
+    assert sharded.totals()[0][-1] == total
+
+    for i in range(args.endpoints):
+        endpoint = '/api/attestations/endpoint-{}'.format(i)
+        metrics.histogram('bench.request', endpoint=endpoint).observe(0.1)
+        metrics.counter('bench.responses', endpoint=endpoint,
+                        status=200).inc()
+    start = time.perf_counter()
+    text = metrics.exposition()
+    print("scrape     {:>8.2f} ms {:>8} bytes".format(
+        (time.perf_counter() - start) * 1000, len(text)))
+
+
+if __name__ == '__main__':
+    main()
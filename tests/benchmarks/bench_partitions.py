@@ -0,0 +1,205 @@
+"""
+Insert, list and retention performance of the attestation table as a plain
+table and range partitioned by month, as migration c4e8a1f0b9d2 leaves it,
+each loaded with --rows attestations spread over the last --months months.
+
+Runs against a throwaway PostgreSQL 11 or later started with
+testing.postgresql, as the test suite does. Loading the default 50 million
+rows takes a while and well over 10 GB of disk per table.
+
+Reported for each table:
+    load     time of the bulk load, in --chunk rows per transaction
+    insert   median and 99th percentile of a single row insert and commit
+    list     median and 99th percentile of the first page of an identity's
+             attestations, the query of the list endpoint
+    expire   time to remove the attestations older than --retention months,
+             with DELETE for the plain table and by dropping partitions
+
+Usage:
+    python -m tests.benchmarks.bench_partitions [--rows 50000000] \\
+        [--months 24] [--identities 1000000] [--retention 12]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+import psycopg2
+from testing.postgresql import Postgresql
+
+MIGRATION = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'database', 'migrations',
+    'versions', 'c4e8a1f0b9d2_partition_attestations_by_month.py')
+
+COLUMNS = """
+    method attestationtypes,
+    eth_address varchar,
+    value varchar,
+    signature varchar,
+    remote_ip_address inet,
+    created_at timestamp
+"""
+
+LOAD = """
+INSERT INTO {table} (method, eth_address, value, signature,
+                     remote_ip_address, created_at)
+SELECT (enum_range(NULL::attestationtypes))[g % 5 + 1],
+       '0x' || lpad(to_hex(g % {identities}), 40, '0'),
+       'value-' || g,
+       '0x' || repeat('ab', 65),
+       '192.168.1.1',
+       '{start}'::timestamp + (g - 1) * interval '{step} microseconds'
+FROM generate_series({first}, {last}) g
+"""
+
+INSERT = """
+INSERT INTO {table} (method, eth_address, value, signature,
+                     remote_ip_address, created_at)
+VALUES ('PHONE', %s, 'value', %s, '192.168.1.1', now() AT TIME ZONE 'utc')
+RETURNING id
+"""
+
+LIST = """
+SELECT id, method, signature, created_at FROM {table}
+WHERE lower(eth_address) = %s
+ORDER BY created_at DESC, id DESC
+LIMIT 21
+"""
+
+
+def _migration():
+    spec = importlib.util.spec_from_file_location('migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def _add_months(month, months):
+    months += month.year * 12 + month.month - 1
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def _create_tables(cursor, first_month, months):
+    migration = _migration()
+    cursor.execute("CREATE TYPE attestationtypes AS ENUM "
+                   "('PHONE', 'EMAIL', 'AIRBNB', 'FACEBOOK', 'TWITTER')")
+
+    cursor.execute('CREATE TABLE attestation_plain '
+                   '(id serial PRIMARY KEY, {})'.format(COLUMNS))
+    cursor.execute('CREATE INDEX ON attestation_plain '
+                   '(lower(eth_address), created_at, id)')
+
+    cursor.execute('CREATE SEQUENCE attestation_id_seq')
+    cursor.execute(migration.PARTITIONED_TABLE)
+    cursor.execute('CREATE INDEX ix_attestation_eth_address_created_at '
+                   'ON attestation (lower(eth_address), created_at, id)')
+    cursor.execute('CREATE TABLE attestation_default PARTITION OF attestation '
+                   'DEFAULT')
+    cursor.execute(migration.CREATE_PARTITIONS_FUNCTION)
+    cursor.execute(migration.DROP_PARTITIONS_FUNCTION)
+    # The months loaded, which the migration would have left in
+    # attestation_legacy, then those ahead as the beat task creates them
+    for i in range(months):
+        month = _add_months(first_month, i)
+        cursor.execute(
+            "CREATE TABLE attestation_{:%Y_%m} PARTITION OF attestation "
+            "FOR VALUES FROM ('{}') TO ('{}')".format(
+                month, month, _add_months(month, 1)))
+    cursor.execute('SELECT attestation_create_partitions({})'.format(
+        migration.PARTITIONS_AHEAD))
+
+
+def _load(cursor, table, args, start, step):
+    began = time.perf_counter()
+    for first in range(1, args.rows + 1, args.chunk):
+        cursor.execute(LOAD.format(
+            table=table, identities=args.identities, start=start, step=step,
+            first=first, last=min(first + args.chunk - 1, args.rows)))
+    cursor.execute('ANALYZE {}'.format(table))
+    return time.perf_counter() - began
+
+
+def _latencies(run, samples):
+    latencies = []
+    for i in range(samples):
+        began = time.perf_counter()
+        run(i)
+        latencies.append((time.perf_counter() - began) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(samples * 0.99)]
+
+
+def _expire(cursor, table, retention):
+    began = time.perf_counter()
+    if table == 'attestation':
+        cursor.execute('SELECT attestation_drop_partitions(%s)', (retention,))
+    else:
+        cursor.execute(
+            "DELETE FROM attestation_plain WHERE created_at < "
+            "date_trunc('month', now() AT TIME ZONE 'utc') "
+            "- make_interval(months => %s)", (retention,))
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000000)
+    parser.add_argument('--months', type=int, default=24,
+                        help="months the loaded attestations span")
+    parser.add_argument('--identities', type=int, default=1000000)
+    parser.add_argument('--retention', type=int, default=12,
+                        help="months of attestations kept when expiring")
+    parser.add_argument('--chunk', type=int, default=1000000,
+                        help="rows loaded per transaction")
+    parser.add_argument('--samples', type=int, default=1000,
+                        help="single row inserts and list queries timed")
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    first_month = _add_months(datetime(now.year, now.month, 1),
+                              1 - args.months)
+    # Rows are loaded in created_at order, ending now
+    step = int((now - first_month).total_seconds() * 1e6 / args.rows)
+
+    with Postgresql() as postgresql:
+        connection = psycopg2.connect(postgresql.url())
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute('SHOW server_version_num')
+        if int(cursor.fetchone()[0]) < 110000:
+            parser.exit(1, 'Partitioning needs PostgreSQL 11 or later.\n')
+        _create_tables(cursor, first_month, args.months)
+
+        print("{:12} {:>10} {:>20} {:>20} {:>10}".format(
+            'table', 'load', 'insert median/p99', 'list median/p99',
+            'expire'))
+        for table in ('attestation_plain', 'attestation'):
+            load = _load(cursor, table, args, first_month, step)
+
+            def insert(i):
+                cursor.execute(INSERT.format(table=table), (
+                    '0x{:040x}'.format(i), '0x' + 'cd' * 65))
+                cursor.fetchone()
+            insert_ms = _latencies(insert, args.samples)
+
+            identities = [
+                '0x{:040x}'.format(random.randrange(args.identities))
+                for _ in range(args.samples)]
+
+            def list_page(i):
+                cursor.execute(LIST.format(table=table), (identities[i],))
+                cursor.fetchall()
+            list_ms = _latencies(list_page, args.samples)
+
+            expire = _expire(cursor, table, args.retention)
+            print("{:12} {:>8.1f} s {:>8.2f}/{:>6.2f} ms {:>8.2f}/{:>6.2f} ms "
+                  "{:>8.2f} s".format(table, load, insert_ms[0], insert_ms[1],
+                                      list_ms[0], list_ms[1], expire))
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
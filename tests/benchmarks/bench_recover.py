@@ -0,0 +1,57 @@
+"""
+Throughput of batch signer recovery, as done by /api/signatures/verify,
+on the request thread and across a util.signing_pool process pool.
+
+Usage:
+    python -m tests.benchmarks.bench_recover [--count 10000] [--workers 4]
+"""
+import argparse
+import time
+
+from eth_utils import keccak, to_checksum_address
+
+from util import attestations
+from util.signing_pool import SigningPool, recover_signers
+
+PRIVATE_KEY = ('0x1fc2b755568ce8402e422f8fd0da54d3'
+               '84f42962c8f925116964f39245d429e0')
+
+
+def claims(count):
+    signer = attestations.get_signer(PRIVATE_KEY)
+    for i in range(count):
+        subject = to_checksum_address(keccak(i.to_bytes(8, 'big'))[:20])
+        data = 'airbnbUserId:{}'.format(i)
+        yield subject, 5, data, signer.sign(subject, 5, data)
+
+
+def report(label, count, elapsed):
+    print("{:8} {:6d} items in {:7.2f}s, {:9.1f} items/sec".format(
+        label, count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="recovery processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+
+    batch = list(claims(args.count))
+
+    start = time.perf_counter()
+    inline = recover_signers(batch)
+    report('inline', args.count, time.perf_counter() - start)
+
+    with SigningPool(PRIVATE_KEY, args.workers) as pool:
+        # Start the workers before measuring
+        list(pool.recover_many(batch[:1]))
+        start = time.perf_counter()
+        pooled = list(pool.recover_many(batch))
+        report('pool', args.count, time.perf_counter() - start)
+
+    assert inline == pooled
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Signatures/sec of the original web3 signing path compared with
+util.attestations.generate_signature. The same claim is signed every time,
+so the signature cache is disabled while measuring; otherwise every
+signature after the first would be a cache hit.
+
+Usage:
+    python -m tests.benchmarks.bench_signing [--count 2000]
+"""
+import argparse
+import time
+
+import mock
+
+from tests.helpers.eth_utils import legacy_generate_signature
+from util import attestations
+
+PRIVATE_KEY = ('0x1fc2b755568ce8402e422f8fd0da54d3'
+               '84f42962c8f925116964f39245d429e0')
+SUBJECT = '0x112234455C3a32FD11230C42E7Bccd4A84e02010'
+
+
+def signatures_per_second(sign, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        sign(PRIVATE_KEY, SUBJECT, 10, 'phone verified')
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=2000,
+                        help="signatures per implementation")
+    args = parser.parse_args()
+
+    assert (attestations.generate_signature(PRIVATE_KEY, SUBJECT, 10, 'phone verified') ==
+            legacy_generate_signature(PRIVATE_KEY, SUBJECT, 10, 'phone verified'))
+
+    before = signatures_per_second(legacy_generate_signature, args.count)
+    with mock.patch.object(attestations, 'signature_cache',
+                           attestations.SignatureCache(0)):
+        after = signatures_per_second(attestations.generate_signature,
+                                      args.count)
+    print("before: {:10.1f} signatures/sec".format(before))
+    print("after:  {:10.1f} signatures/sec ({:.2f}x)".format(after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Latency of concurrent verify requests with signing on the request threads
+compared with signing in util.signing_pool.
+
+Each simulated request waits on a provider (sleep, which releases the GIL)
+and then signs a claim, the shape of every VerificationService.verify_*
+call. With signing on the request threads, each signature holds the GIL
+and stalls all other in-flight requests.
+
+Usage:
+    python -m tests.benchmarks.bench_signing_pool [--concurrency 50]
+        [--requests 20] [--provider-latency 0.05] [--workers 4]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from util import attestations
+from util.signing_pool import SigningPool
+
+PRIVATE_KEY = ('0x1fc2b755568ce8402e422f8fd0da54d3'
+               '84f42962c8f925116964f39245d429e0')
+SUBJECT = '0x112234455C3a32FD11230C42E7Bccd4A84e02010'
+
+
+def run(sign, concurrency, requests, provider_latency):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests):
+            start = time.perf_counter()
+            time.sleep(provider_latency)
+            sign(SUBJECT, 10, 'phone verified')
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+
+def report(label, latencies):
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print("{:8} p50 {:8.1f}ms  p99 {:8.1f}ms".format(
+        label, statistics.median(latencies) * 1000, p99 * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20,
+                        help="requests per concurrent client")
+    parser.add_argument('--provider-latency', type=float, default=0.05,
+                        help="seconds each request waits on the provider")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="signing processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+
+    signer = attestations.get_signer(PRIVATE_KEY)
+    report('sync', run(signer.sign, args.concurrency, args.requests,
+                       args.provider_latency))
+
+    with SigningPool(PRIVATE_KEY, args.workers) as pool:
+        # Start the workers before measuring
+        pool.sign(SUBJECT, 10, 'phone verified')
+        report('pool', run(pool.sign, args.concurrency, args.requests,
+                           args.provider_latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+from tests.benchmarks.bench_hot_path import regressions
+
+
+def test_regressions_over_threshold():
+    baseline = {
+        'generate_signature[1]': {'us_per_op': 100.0},
+        'Web3.sha3[1]': {'us_per_op': 10.0},
+    }
+    results = {
+        'generate_signature[1]': {'us_per_op': 115.0},
+        'Web3.sha3[1]': {'us_per_op': 10.5},
+        'signHash[1]': {'us_per_op': 500.0},
+    }
+    assert regressions(results, baseline, 0.1) == [
+        ('generate_signature[1]', 100.0, 115.0)
+    ]
@@ -25,6 +25,10 @@ from app import app as flask_app
 from app.app_config import init_api
 from database import db as _db
 from config import settings
+from tests.helpers.async_providers import provider_app
+from util import async_http_client, http_client
+
+pytest_plugins = 'aiohttp.pytest_plugin'
 
 
 class PollDelayCounter:
@@ -134,6 +138,15 @@ def session(db):
     session_.remove()
 
 
+@pytest.yield_fixture(scope='function', autouse=True)
+def circuit_breakers():
+    """Starts each test with closed circuit breakers, so provider failures
+    mocked by one test don't refuse the calls of the next."""
+    http_client.reset_breakers()
+    yield
+    http_client.reset_breakers()
+
+
 @pytest.yield_fixture(scope='function')
 def mock_normalize_number(app):
     patcher = patch('logic.attestation_service.normalize_number',
@@ -142,6 +155,19 @@ def mock_normalize_number(app):
     patcher.stop()
 
 
+@pytest.yield_fixture(scope='function')
+def async_providers(loop, aiohttp_server):
+    """Points the async verification service at a local stand-in for the
+    identity providers. Yields the server, whose app holds the fake state."""
+    server = loop.run_until_complete(aiohttp_server(provider_app()))
+    with patch.multiple('logic.async_attestation_service',
+                        authy_url=str(server.make_url('/authy/')),
+                        facebook_graph_url=str(server.make_url('/facebook')),
+                        airbnb_profile_url=str(server.make_url('/airbnb/'))):
+        yield server
+    loop.run_until_complete(async_http_client.close())
+
+
 @pytest.yield_fixture(scope='function')
 def mock_ipfs_init(app):
     patcher = patch('util.ipfs.IPFSHelper.__init__',
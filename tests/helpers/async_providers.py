@@ -0,0 +1,75 @@
+import asyncio
+import zlib
+
+from aiohttp import web
+
+VERIFICATION_CODE = '123456'
+FACEBOOK_CODE = 'abcde12345'
+FACEBOOK_NAME = 'Origin Protocol'
+
+
+async def _delay(request):
+    if request.app['state']['delay']:
+        await asyncio.sleep(request.app['state']['delay'])
+
+
+async def authy_start(request):
+    request.app['state']['authy_starts'] += 1
+    await _delay(request)
+    if request.query['phone_number'] == '1234':
+        return web.json_response({'error_code': '60033'}, status=400)
+    return web.json_response({'success': True})
+
+
+async def authy_check(request):
+    await _delay(request)
+    if request.query['verification_code'] != VERIFICATION_CODE:
+        return web.json_response({'error_code': '60022'}, status=401)
+    return web.json_response({
+        'message': 'Verification code is correct.',
+        'success': True
+    })
+
+
+async def facebook_access_token(request):
+    await _delay(request)
+    if request.query['code'] != FACEBOOK_CODE:
+        return web.json_response({'error': {'message': 'Invalid code.'}})
+    return web.json_response({'access_token': '12345'})
+
+
+async def facebook_me(request):
+    await _delay(request)
+    return web.json_response({'name': FACEBOOK_NAME, 'id': '1'})
+
+
+async def airbnb_profile(request):
+    request.app['state']['airbnb_requests'] += 1
+    await _delay(request)
+    profile = request.app['state']['airbnb_profiles'].get(request.match_info['user_id'])
+    if profile is None:
+        return web.Response(text='User not found', status=404)
+    etag = '"{}"'.format(zlib.crc32(profile.encode('utf-8')))
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304)
+    return web.Response(text=profile, content_type='text/html',
+                        headers={'ETag': etag})
+
+
+def provider_app(delay=0):
+    """
+    aiohttp app standing in for Authy, the Facebook Graph API and Airbnb.
+    Tests change app['state'] while the server runs: 'delay' is added to
+    every response and Airbnb profiles are served from 'airbnb_profiles',
+    keyed by user id, with an ETag. 'authy_starts' counts verification start
+    calls and 'airbnb_requests' profile requests.
+    """
+    app = web.Application()
+    app['state'] = {'delay': delay, 'airbnb_profiles': {}, 'authy_starts': 0,
+                    'airbnb_requests': 0}
+    app.router.add_post('/authy/start', authy_start)
+    app.router.add_get('/authy/check', authy_check)
+    app.router.add_get('/facebook/v2.12/oauth/access_token', facebook_access_token)
+    app.router.add_get('/facebook/me', facebook_me)
+    app.router.add_get('/airbnb/{user_id}', airbnb_profile)
+    return app
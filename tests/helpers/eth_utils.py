@@ -5,3 +5,22 @@ sample_eth_address = 562046206989085878832492993516240920558397288279
 
 def str_eth(numeric_eth_address):
     return Web3.toChecksumAddress(hex(int(numeric_eth_address)))
+
+
+def legacy_generate_signature(private_key, subject, claim_type, data):
+    """
+    The original web3 based attestation signing, kept as a reference for
+    tests and benchmarks of util.attestations.
+    """
+    from eth_account.messages import defunct_hash_message
+    from web3.auto.http import w3
+    w3.eth.enable_unaudited_features()
+
+    hashed_data = Web3.sha3(text=data)
+    hash_to_sign = Web3.soliditySha3(['address', 'uint256', 'bytes32'], [
+        subject, claim_type, hashed_data])
+
+    result = w3.eth.account.signHash(
+        message_hash=defunct_hash_message(hexstr=hash_to_sign.hex()),
+        private_key=private_key)
+    return result['signature'].hex()
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import time
+
+import mock
+import pytest
+from marshmallow.exceptions import ValidationError
+
+from config import settings
+from database.models import Attestation, AttestationTypes
+from logic import airbnb_profiles
+from logic.async_attestation_service import (
+    AsyncVerificationService,
+    _profile_has_code
+)
+from logic.attestation_service import (
+    CLAIM_TYPES,
+    VerificationServiceResponse,
+    get_airbnb_verification_code
+)
+from logic.service_utils import (
+    AirbnbVerificationError,
+    FacebookVerificationError
+)
+from tests.helpers.async_providers import (
+    FACEBOOK_CODE,
+    FACEBOOK_NAME,
+    VERIFICATION_CODE
+)
+from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import metrics
+
+SIGNATURE_LENGTH = 132
+
+
+async def test_send_phone_verification(async_providers):
+    response = await AsyncVerificationService.send_phone_verification(
+        '1', '12341234', 'sms', None)
+    assert isinstance(response, VerificationServiceResponse)
+
+
+async def test_send_phone_verification_invalid_number(async_providers):
+    with pytest.raises(ValidationError) as validation_err:
+        await AsyncVerificationService.send_phone_verification(
+            '1', '1234', 'sms', None)
+
+    assert validation_err.value.messages[0] == 'Phone number is invalid.'
+
+
+async def test_concurrent_phone_verifications_share_one_call(async_providers):
+    async_providers.app['state']['delay'] = 0.2
+    collapsed = metrics.counter('phone.start.collapsed').value
+
+    responses = await asyncio.gather(*[
+        AsyncVerificationService.send_phone_verification(
+            '1', phone, 'sms', None)
+        for phone in ['12341234', '1234-1234', '1234 1234']])
+
+    assert len(responses) == 3
+    assert async_providers.app['state']['authy_starts'] == 1
+    assert metrics.counter('phone.start.collapsed').value == collapsed + 2
+
+
+async def test_verify_phone(async_providers, app):
+    response = await AsyncVerificationService.verify_phone(
+        '1', '12341234', VERIFICATION_CODE,
+        str_eth(sample_eth_address), remote_ip_address='192.0.2.1')
+
+    assert len(response.data['signature']) == SIGNATURE_LENGTH
+    assert response.data['claim_type'] == CLAIM_TYPES['phone']
+    assert response.data['data'] == 'phone verified'
+
+    attestations = Attestation.query.all()
+    assert len(attestations) == 1
+    assert attestations[0].method == AttestationTypes.PHONE
+    assert attestations[0].value == '1 12341234'
+    assert attestations[0].remote_ip_address == '192.0.2.1'
+
+
+async def test_verify_phone_invalid_code(async_providers):
+    with pytest.raises(ValidationError) as validation_err:
+        await AsyncVerificationService.verify_phone(
+            '1', '12341234', '654321', str_eth(sample_eth_address))
+
+    assert validation_err.value.messages[0] == 'Verification code is incorrect.'
+    assert len(Attestation.query.all()) == 0
+
+
+async def test_verify_facebook(async_providers, app):
+    response = await AsyncVerificationService.verify_facebook(
+        FACEBOOK_CODE, str_eth(sample_eth_address))
+
+    assert len(response.data['signature']) == SIGNATURE_LENGTH
+    assert response.data['claim_type'] == CLAIM_TYPES['facebook']
+
+    attestations = Attestation.query.all()
+    assert len(attestations) == 1
+    assert attestations[0].value == FACEBOOK_NAME
+
+
+async def test_verify_facebook_invalid_code(async_providers):
+    with pytest.raises(FacebookVerificationError):
+        await AsyncVerificationService.verify_facebook(
+            'bananas', str_eth(sample_eth_address))
+
+
+async def test_verify_airbnb(async_providers, app):
+    eth_address = str_eth(sample_eth_address)
+    async_providers.app['state']['airbnb_profiles']['123456'] = (
+        '<html><div>Origin verification code: {}</div></html>'.format(
+            get_airbnb_verification_code(eth_address, '123456')))
+
+    response = await AsyncVerificationService.verify_airbnb(
+        eth_address, '123456')
+
+    assert response.data['data'] == 'airbnbUserId:123456'
+    assert Attestation.query.one().method == AttestationTypes.AIRBNB
+
+
+async def test_verify_airbnb_waits_for_code(async_providers, app):
+    eth_address = str_eth(sample_eth_address)
+    profiles = async_providers.app['state']['airbnb_profiles']
+    profiles['123456'] = '<html><div>Airbnb profile</div></html>'
+
+    async def save_profile():
+        await asyncio.sleep(0.2)
+        profiles['123456'] = 'Origin verification code: {}'.format(
+            get_airbnb_verification_code(eth_address, '123456'))
+
+    asyncio.ensure_future(save_profile())
+    with mock.patch.object(settings, 'AIRBNB_VERIFY_MAX_WAIT', 5), \
+            mock.patch('logic.async_attestation_service.backoff_delays',
+                       return_value=itertools.repeat(0.05)):
+        response = await AsyncVerificationService.verify_airbnb(
+            eth_address, '123456', wait=5)
+
+    assert response.data['data'] == 'airbnbUserId:123456'
+
+
+async def test_airbnb_profile_checks_are_shared_and_cached(async_providers):
+    state = async_providers.app['state']
+    state['airbnb_profiles']['123456'] = 'Origin verification code: art brick'
+    state['delay'] = 0.1
+    airbnb_profiles.profile_cache.clear()
+
+    with mock.patch.object(settings, 'AIRBNB_PROFILE_CACHE_TTL', 60):
+        # Concurrent checks of a user make one request
+        assert await asyncio.gather(*[
+            _profile_has_code('123456', 'art brick') for _ in range(5)
+        ]) == [True] * 5
+        assert state['airbnb_requests'] == 1
+
+        assert await _profile_has_code('123456', 'art brick')
+        assert state['airbnb_requests'] == 1
+
+        # Once the TTL is up the page is revalidated with its ETag. The
+        # event loop's clock stands still meanwhile, so nothing may sleep.
+        state['delay'] = 0
+        with mock.patch.object(airbnb_profiles.time, 'monotonic',
+                               return_value=time.monotonic() + 120):
+            assert await _profile_has_code('123456', 'art brick')
+    assert state['airbnb_requests'] == 2
+    assert metrics.counter('airbnb.profile_cache.not_modified').value >= 1
+    airbnb_profiles.profile_cache.clear()
+
+
+async def test_verify_airbnb_non_existing_user(async_providers):
+    with pytest.raises(AirbnbVerificationError) as service_err:
+        await AsyncVerificationService.verify_airbnb(
+            str_eth(sample_eth_address), '99999999999999999')
+
+    assert str(service_err.value) == \
+        'Airbnb user id: 99999999999999999 not found.'
+
+
+async def test_concurrent_verifications(async_providers):
+    # Provider round trips overlap on the event loop instead of each
+    # holding a thread
+    async_providers.app['state']['delay'] = 0.5
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[
+        AsyncVerificationService.send_phone_verification(
+            '1', str(12340000 + i), 'sms', None)
+        for i in range(200)
+    ])
+    assert len(responses) == 200
+    assert time.perf_counter() - start < 5
@@ -1,19 +1,26 @@
 import datetime
+import functools
 import mock
+import os
 import pytest
-from urllib.request import HTTPError
+import threading
+import time
 
 from marshmallow.exceptions import ValidationError
 import responses
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from config import settings
+from database import db
 from database.models import AttestationTypes
 from database.models import Attestation
+from logic import airbnb_profiles, attestation_service
 from logic.attestation_service import (
     VerificationService,
     VerificationServiceResponse
 )
 from logic.attestation_service import CLAIM_TYPES
+from logic.attestation_service import get_airbnb_verification_code
 from logic.attestation_service import twitter_access_token_url
 from logic.attestation_service import twitter_request_token_url
 from logic.service_utils import (
@@ -24,10 +31,17 @@ from logic.service_utils import (
     TwitterVerificationError,
 )
 from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import attestations as attestation_utils
+from util import deadline, metrics, signing_pool
+from util.attestation_writer import AttestationWriter
+from util.email_queue import EmailQueue, LocalTransport
+from util.singleflight import SingleFlight
 
 
 SIGNATURE_LENGTH = 132
 
+AIRBNB_PROFILE_URL = 'https://www.airbnb.com/users/show/'
+
 
 @responses.activate
 def test_send_phone_verification_success():
@@ -47,6 +61,43 @@ def test_send_phone_verification_success():
     assert isinstance(response, VerificationServiceResponse)
 
 
+@responses.activate
+def test_send_phone_verification_deduplicated():
+    responses.add(
+        responses.POST,
+        'https://api.authy.com/protected/json/phones/verification/start',
+        status=200
+    )
+    deduplicated = metrics.counter('phone.start.deduplicated').value
+
+    with mock.patch('logic.attestation_service._phone_flights',
+                    SingleFlight('phone.start', ttl=30)):
+        for method in ['sms', 'sms', 'call']:
+            VerificationService.send_phone_verification(
+                '1', '12341234', method, None)
+
+    # The repeated sms is not sent again, a call is
+    assert len(responses.calls) == 2
+    assert metrics.counter('phone.start.deduplicated').value == \
+        deduplicated + 1
+
+
+def test_send_phone_verification_is_not_queued():
+    # Its error is the response, even with BACKGROUND_TASKS set
+    with mock.patch('logic.attestation_service.start_phone_verification') \
+            as start:
+        VerificationService.send_phone_verification('1', '12341234', 'sms',
+                                                    'en')
+
+    start.assert_called_once_with({
+        'country_code': '1',
+        'phone_number': '12341234',
+        'via': 'sms',
+        'code_length': 6,
+        'locale': 'en'
+    })
+
+
 @responses.activate
 def test_send_phone_verification_invalid_number():
     responses.add(
@@ -148,6 +199,109 @@ def test_verify_phone_valid_code(app):
     assert(attestations[0].value) == "1 12341234"
 
 
+@responses.activate
+def test_verify_phone_write_behind(app, tmpdir):
+    responses.add(
+        responses.GET,
+        'https://api.authy.com/protected/json/phones/verification/check',
+        json={
+            'message': 'Verification code is correct.',
+            'success': True
+        }
+    )
+    commits = metrics.histogram('db.commit', task='insert_attestations')
+    count = commits.snapshot()['count']
+    writer = AttestationWriter(
+        functools.partial(attestation_service.insert_attestations, app),
+        str(tmpdir), 'test.attestation.writer', max_delay=0.1)
+    writer.start()
+
+    with mock.patch('logic.attestation_service.attestation_writer',
+                    return_value=writer):
+        with app.test_request_context():
+            for phone in ('12341234', '12341235'):
+                VerificationService.verify_phone(
+                    country_calling_code='1', phone=phone, code='123456',
+                    eth_address=str_eth(sample_eth_address))
+    writer.stop(5)
+
+    attestations = Attestation.query.order_by(Attestation.value).all()
+    assert [a.value for a in attestations] == ['1 12341234', '1 12341235']
+    assert attestations[0].method == AttestationTypes.PHONE
+    assert attestations[0].signature
+    assert os.listdir(str(tmpdir)) == []
+    assert commits.snapshot()['count'] > count
+
+
+def _verify_phone_with_stored_signature(app, stored_signature, signer):
+    responses.add(
+        responses.GET,
+        'https://api.authy.com/protected/json/phones/verification/check',
+        json={
+            'message': 'Verification code is correct.',
+            'success': True
+        }
+    )
+
+    db.session.add(Attestation(
+        method=AttestationTypes.PHONE,
+        eth_address=str_eth(sample_eth_address),
+        value='1 12341234',
+        signature=stored_signature,
+        signer=signer
+    ))
+    db.session.commit()
+
+    args = {
+        'eth_address': str_eth(sample_eth_address),
+        'country_calling_code': '1',
+        'phone': '12341234',
+        'code': '123456'
+    }
+    cache = attestation_utils.SignatureCache(10)
+    with mock.patch.object(attestation_utils, 'signature_cache', cache), \
+            mock.patch.object(settings, 'SIGNATURE_DB_FALLBACK', True), \
+            mock.patch.object(signing_pool, '_sign',
+                              wraps=signing_pool._sign) as sign:
+        with app.test_request_context():
+            response = VerificationService.verify_phone(**args)
+
+    assert cache.stats()['misses'] == 1
+    return response.data['signature'], sign.called
+
+
+@responses.activate
+def test_verify_phone_reuses_stored_signature(app):
+    signer = attestation_utils.get_signer(attestation_service.signing_key)
+    stored_signature = signer.sign(
+        str_eth(sample_eth_address), CLAIM_TYPES['phone'], 'phone verified')
+
+    with mock.patch.object(attestation_utils, 'recover_signer') as recover:
+        signature, signed = _verify_phone_with_stored_signature(
+            app, stored_signature, signer.address)
+
+    assert signature == stored_signature
+    assert not signed
+    # Trusted by its signer column rather than recovered
+    assert not recover.called
+
+
+@responses.activate
+def test_verify_phone_resigns_foreign_stored_signature(app):
+    # Made by another key, e.g. from before a rotation
+    stored_signature = '0x' + 'ab' * 65
+
+    signature, signed = _verify_phone_with_stored_signature(
+        app, stored_signature, '0x' + '12' * 20)
+
+    assert signed
+    assert signature != stored_signature
+    assert attestation_utils.recover_signer(
+        str_eth(sample_eth_address), CLAIM_TYPES['phone'], 'phone verified',
+        signature) == attestation_utils.get_signer(
+            attestation_service.signing_key).address
+
+
 @responses.activate
 def test_verify_phone_expired_code():
     responses.add(
@@ -231,6 +385,33 @@ def test_send_email_verification_sendgrid_error(
         'Could not send verification code. Please try again shortly.'
 
 
+def test_send_email_verification_batched():
+    transport = LocalTransport(reject=lambda email: email.startswith('bad'))
+    queue = EmailQueue(transport, {}, 'test.email.verification',
+                       max_delay=0.1)
+    queue.start()
+
+    with mock.patch('logic.attestation_service.verification_email_queue',
+                    return_value=queue), \
+            mock.patch('logic.attestation_service.session', dict()) as session:
+        VerificationService.send_email_verification('origin@protocol.foo')
+        code = session['email_attestation']['code']
+        VerificationService.send_email_verification('bad@protocol.foo')
+        queue.stop(5)
+
+        # The failed send is reported once the code is checked
+        with pytest.raises(EmailVerificationError) as service_err:
+            VerificationService.verify_email('bad@protocol.foo', code,
+                                             str_eth(sample_eth_address))
+
+    assert str(service_err.value) == \
+        'Could not send verification code. Please try again shortly.'
+    assert transport.requests[0]['personalizations'] == [{
+        'to': [{'email': 'origin@protocol.foo'}],
+        'substitutions': {'-code-': code}
+    }]
+
+
 @mock.patch('logic.attestation_service.session')
 def test_verify_email_valid_code(mock_session, app):
     session_dict = {
@@ -420,6 +601,29 @@ def test_verify_facebook_valid_code(app):
     assert(attestations[0].value) == 'Origin Protocol'
 
 
+@responses.activate
+def test_verify_facebook_fetches_only_stored_fields(app):
+    responses.add(
+        responses.GET,
+        'https://graph.facebook.com/v2.12/oauth/access_token',
+        json={'access_token': 12345}
+    )
+    responses.add(
+        responses.GET,
+        'https://graph.facebook.com/me',
+        json={'name': 'Origin Protocol'}
+    )
+    profile_count = metrics.timer('facebook.profile').count
+
+    with app.test_request_context():
+        VerificationService.verify_facebook(
+            code='abcde12345', eth_address=str_eth(sample_eth_address))
+
+    assert len(responses.calls) == 2
+    assert 'fields=name' in responses.calls[1].request.url
+    assert metrics.timer('facebook.profile').count == profile_count + 1
+
+
 @responses.activate
 def test_verify_facebook_invalid_code():
     auth_url = 'https://graph.facebook.com/v2.12/oauth/access_token' + \
@@ -469,6 +673,27 @@ def test_twitter_auth_url(app):
     )
 
 
+@responses.activate
+def test_twitter_auth_url_uses_prefetched_token(app):
+    pool = mock.Mock()
+    pool.get.return_value = {
+        'oauth_token': 'peaches',
+        'oauth_token_secret': 'pears'
+    }
+
+    with mock.patch('logic.attestation_service.twitter_request_token_pool',
+                    return_value=pool), \
+            mock.patch('logic.attestation_service.session', dict()) as session:
+        verification_response = VerificationService.twitter_auth_url()
+
+    # Served from the pool without calling Twitter
+    assert len(responses.calls) == 0
+    assert session['request_token']['oauth_token_secret'] == 'pears'
+    assert verification_response.data['url'] == (
+        'https://api.twitter.com/oauth/authenticate?oauth_token=peaches'
+    )
+
+
 @mock.patch('logic.attestation_service.session')
 @responses.activate
 def test_verify_twitter_valid_code(mock_session, app):
@@ -579,14 +804,14 @@ def test_generate_airbnb_verification_code_incorrect_user_id_format():
     assert str(validation_error.value) == 'AirbnbUserId should be a number.'
 
 
-@mock.patch('logic.attestation_service.urlopen')
-def test_verify_airbnb(mock_urllib_request, app):
-    mock_urllib_request.return_value.read.return_value = """
+@responses.activate
+def test_verify_airbnb(app):
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', body="""
         <html><div>
             Airbnb profile description
             Origin verification code: art brick aspect accident brass betray antenna
             some more profile description
-        </div></html>""".encode('utf-8')
+        </div></html>""")
     airbnbUserId = "123456"
 
     with app.test_request_context():
@@ -607,12 +832,141 @@ def test_verify_airbnb(mock_urllib_request, app):
     assert(attestations[0].value) == "123456"
 
 
-@mock.patch('logic.attestation_service.urlopen')
-def test_verify_airbnb_verification_code_missing(mock_urllib_request):
-    mock_urllib_request.return_value.read.return_value = """
+@responses.activate
+def test_verify_airbnb_code_case_and_whitespace(app):
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', body="""
+        <html><div>
+            Origin verification code: Art Brick
+            aspect  accident brass BETRAY antenna
+        </div></html>""")
+
+    with app.test_request_context():
+        verification_response = VerificationService.verify_airbnb(
+            '0x112234455C3a32FD11230C42E7Bccd4A84e02010', '123456')
+
+    assert verification_response.data['data'] == 'airbnbUserId:123456'
+
+
+def test_airbnb_verification_code_is_memoized():
+    eth_address = '0x112234455C3a32FD11230C42E7Bccd4A84e02010'
+    code = get_airbnb_verification_code(eth_address, '123456')
+    hits = get_airbnb_verification_code.cache_info().hits
+
+    assert get_airbnb_verification_code(eth_address, '123456') == code
+    assert get_airbnb_verification_code.cache_info().hits == hits + 1
+    assert code == 'art brick aspect accident brass betray antenna'
+
+
+@responses.activate
+def test_airbnb_profile_checks_are_cached():
+    airbnb_profiles.profile_cache.clear()
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456',
+                  body='Origin verification code: art brick aspect',
+                  headers={'ETag': '"v1"'})
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', status=304)
+
+    with mock.patch.object(settings, 'AIRBNB_PROFILE_CACHE_TTL', 60):
+        assert airbnb_profiles.profile_has_code('123456', 'art brick aspect')
+        assert airbnb_profiles.profile_has_code('123456', 'art brick aspect')
+        assert len(responses.calls) == 1
+
+        # Once the TTL is up the page is revalidated, and a 304 keeps the
+        # earlier result
+        with mock.patch.object(airbnb_profiles.time, 'monotonic',
+                               return_value=time.monotonic() + 120):
+            assert airbnb_profiles.profile_has_code(
+                '123456', 'art brick aspect')
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.headers['If-None-Match'] == '"v1"'
+    airbnb_profiles.profile_cache.clear()
+
+
+def test_airbnb_profile_checks_share_a_request_per_user():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def check(airbnbUserId, code):
+        calls.append(code)
+        started.set()
+        release.wait(5)
+        return code, True
+
+    results = {}
+    collapsed = metrics.counter('airbnb.profile.collapsed').value
+    with mock.patch.object(airbnb_profiles, '_check_profile',
+                           side_effect=check):
+        first = threading.Thread(target=lambda: results.setdefault(
+            'first', airbnb_profiles.profile_has_code('123456', 'art')))
+        first.start()
+        started.wait(5)
+        # Joins the first check, then checks its own code
+        second = threading.Thread(target=lambda: results.setdefault(
+            'second', airbnb_profiles.profile_has_code('123456', 'brick')))
+        second.start()
+        time.sleep(0.1)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+    assert results == {'first': True, 'second': True}
+    assert calls == ['art', 'brick']
+    assert metrics.counter('airbnb.profile.collapsed').value == collapsed + 1
+
+
+@responses.activate
+def test_verify_airbnb_waits_for_code(app):
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456',
+                  body='Airbnb profile description')
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', body="""
+        Origin verification code: art brick aspect accident brass betray antenna
+        """)
+
+    with mock.patch.object(settings, 'AIRBNB_VERIFY_MAX_WAIT', 30), \
+            mock.patch.object(airbnb_profiles.time, 'sleep') as sleep, \
+            app.test_request_context():
+        verification_response = VerificationService.verify_airbnb(
+            '0x112234455C3a32FD11230C42E7Bccd4A84e02010', '123456', wait=60)
+
+    assert verification_response.data['data'] == 'airbnbUserId:123456'
+    assert len(responses.calls) == 2
+    sleep.assert_called_once_with(1)
+
+
+@responses.activate
+def test_verify_airbnb_wait_is_capped(app):
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456',
+                  body='Airbnb profile description')
+
+    with mock.patch.object(airbnb_profiles.time, 'sleep') as sleep:
+        with pytest.raises(AirbnbVerificationError):
+            VerificationService.verify_airbnb(
+                '0x112234455C3a32FD11230C42E7Bccd4A84e02010', '123456',
+                wait=60)
+
+    # AIRBNB_VERIFY_MAX_WAIT defaults to 0, a single check
+    assert len(responses.calls) == 1
+    sleep.assert_not_called()
+
+
+def test_wait_for_code_leaves_budget_for_a_last_check():
+    provider_timeout = settings.HTTP_CONNECT_TIMEOUT + settings.HTTP_READ_TIMEOUT
+    with mock.patch.object(airbnb_profiles, 'profile_has_code',
+                           return_value=False) as check, \
+            mock.patch.object(airbnb_profiles.time, 'sleep') as sleep, \
+            deadline.budget(provider_timeout):
+        assert not airbnb_profiles.wait_for_code('123456', 'code', 60)
+
+    check.assert_called_once_with('123456', 'code')
+    sleep.assert_not_called()
+
+
+@responses.activate
+def test_verify_airbnb_verification_code_missing():
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', body="""
         <html><div>
         Airbnb profile description some more profile description
-        </div></html>""".encode('utf-8')
+        </div></html>""")
 
     with pytest.raises(AirbnbVerificationError) as service_err:
         VerificationService.verify_airbnb(
@@ -628,14 +982,14 @@ def test_verify_airbnb_verification_code_missing(mock_urllib_request):
     assert(len(attestations)) == 0
 
 
-@mock.patch('logic.attestation_service.urlopen')
-def test_verify_airbnb_verification_code_incorrect(mock_urllib_request):
-    mock_urllib_request.return_value.read.return_value = """
+@responses.activate
+def test_verify_airbnb_verification_code_incorrect():
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '123456', body="""
         <html><div>
         Airbnb profile description
         Origin verification code: art brick aspect pimpmobile
         some more profile description
-        </div></html>""".encode('utf-8')
+        </div></html>""")
 
     with pytest.raises(AirbnbVerificationError) as service_err:
         VerificationService.verify_airbnb(
@@ -651,15 +1005,14 @@ def test_verify_airbnb_verification_code_incorrect(mock_urllib_request):
     assert(len(attestations)) == 0
 
 
-@mock.patch('logic.attestation_service.urlopen')
-def test_verify_airbnb_verification_code_incorrect_user_id_format(
-        mock_urllib_request):
-    mock_urllib_request.return_value.read.return_value = """
+@responses.activate
+def test_verify_airbnb_verification_code_incorrect_user_id_format():
+    responses.add(responses.GET, AIRBNB_PROFILE_URL + '12a34', body="""
         <html><div>
         Airbnb profile description
         Origin verification code: art brick aspect accident brass betray antenna
         some more profile description
-        </div></html>""".encode('utf-8')
+        </div></html>""")
 
     with pytest.raises(ValidationError) as validation_error:
         VerificationService.verify_airbnb(
@@ -674,15 +1027,15 @@ def test_verify_airbnb_verification_code_incorrect_user_id_format(
     assert(len(attestations)) == 0
 
 
-@mock.patch('logic.attestation_service.urlopen', side_effect=HTTPError(
-    'https://www.airbnb.com/users/show/99999999999999999',
-    404,
-    "User not found",
-    {},
-    {}
-))
-def test_verify_airbnb_verification_code_non_existing_user(
-        mock_urllib_request):
+@responses.activate
+def test_verify_airbnb_verification_code_non_existing_user():
+    responses.add(
+        responses.GET,
+        AIRBNB_PROFILE_URL + '99999999999999999',
+        body='User not found',
+        status=404
+    )
+
     with pytest.raises(AirbnbVerificationError) as service_err:
         VerificationService.verify_airbnb(
             '0x112234455C3a32FD11230C42E7Bccd4A84e02010',
@@ -697,15 +1050,15 @@ def test_verify_airbnb_verification_code_non_existing_user(
     assert(len(attestations)) == 0
 
 
-@mock.patch('logic.attestation_service.urlopen', side_effect=HTTPError(
-    'https://www.airbnb.com/users/show/123',
-    500,
-    "Internal server error",
-    {},
-    {}
-))
-def test_verify_airbnb_verification_code_internal_server_error(
-        mock_urllib_request):
+@responses.activate
+def test_verify_airbnb_verification_code_internal_server_error():
+    responses.add(
+        responses.GET,
+        AIRBNB_PROFILE_URL + '123',
+        body='Internal server error',
+        status=500
+    )
+
     with pytest.raises(AirbnbVerificationError) as service_err:
         VerificationService.verify_airbnb(
             '0x112234455C3a32FD11230C42E7Bccd4A84e02010',
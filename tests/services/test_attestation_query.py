@@ -0,0 +1,207 @@
+import datetime
+
+import mock
+import pytest
+from marshmallow.exceptions import ValidationError
+
+from database import db
+from database.models import Attestation, AttestationTypes
+from logic.attestation_query_service import (
+    AttestationListCache,
+    AttestationQueryService,
+    attestation_cache,
+    attestations_changed
+)
+from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import tasks
+
+ETH_ADDRESS = str_eth(sample_eth_address)
+OTHER_ETH_ADDRESS = '0x112234455C3a32FD11230C42E7Bccd4A84e02010'
+START = datetime.datetime(2018, 11, 1, 12, 0, 0)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    attestation_cache.clear()
+    yield
+    attestation_cache.clear()
+
+
+def add_attestation(method, minutes, eth_address=ETH_ADDRESS):
+    attestation = Attestation(
+        method=method,
+        eth_address=eth_address,
+        value='value-{}'.format(minutes),
+        signature='0x{:04x}'.format(minutes),
+        remote_ip_address='192.168.1.1',
+        created_at=START + datetime.timedelta(minutes=minutes)
+    )
+    db.session.add(attestation)
+    db.session.commit()
+    return attestation
+
+
+def list_signatures(**kwargs):
+    kwargs.setdefault('eth_address', ETH_ADDRESS)
+    response = AttestationQueryService.list_attestations(**kwargs)
+    return ([a['signature'] for a in response.data['attestations']],
+            response.data['next_cursor'])
+
+
+def test_list_attestations_newest_first(app):
+    add_attestation(AttestationTypes.PHONE, 1)
+    add_attestation(AttestationTypes.EMAIL, 2)
+    add_attestation(AttestationTypes.PHONE, 3, eth_address=OTHER_ETH_ADDRESS)
+
+    response = AttestationQueryService.list_attestations(
+        eth_address=ETH_ADDRESS.lower())
+
+    assert response.data == {
+        'attestations': [{
+            'method': 'email',
+            'claim_type': 11,
+            'signature': '0x0002',
+            'created_at': START + datetime.timedelta(minutes=2)
+        }, {
+            'method': 'phone',
+            'claim_type': 10,
+            'signature': '0x0001',
+            'created_at': START + datetime.timedelta(minutes=1)
+        }],
+        'next_cursor': None
+    }
+
+
+def test_list_attestations_pages(app):
+    for minutes in range(5):
+        add_attestation(AttestationTypes.PHONE, minutes)
+    # Same created_at, told apart by id
+    add_attestation(AttestationTypes.EMAIL, 2)
+
+    signatures, cursor = list_signatures(limit=2)
+    assert signatures == ['0x0004', '0x0003']
+    signatures, cursor = list_signatures(limit=2, cursor=cursor)
+    assert signatures == ['0x0002', '0x0002']
+    signatures, cursor = list_signatures(limit=2, cursor=cursor)
+    assert signatures == ['0x0001', '0x0000']
+    assert cursor is None
+
+
+def test_list_attestations_by_method(app):
+    add_attestation(AttestationTypes.PHONE, 1)
+    add_attestation(AttestationTypes.EMAIL, 2)
+
+    assert list_signatures(method='phone') == (['0x0001'], None)
+
+
+def test_list_attestations_of_invalid_identity(app):
+    assert list_signatures(eth_address='bananas') == ([], None)
+
+
+def test_attestations_are_stored_as_bytes(app):
+    add_attestation(AttestationTypes.EMAIL, 1, eth_address=ETH_ADDRESS.lower())
+
+    method, eth_address, signature = db.session.execute(
+        'SELECT method, eth_address, signature FROM attestation').first()
+    assert method == AttestationTypes.EMAIL.value
+    assert bytes(eth_address) == bytes.fromhex(ETH_ADDRESS[2:])
+    assert bytes(signature) == b'\x00\x01'
+
+    # Read back checksummed, whatever the case it was written in
+    attestation = Attestation.query.filter_by(eth_address=ETH_ADDRESS).one()
+    assert attestation.method == AttestationTypes.EMAIL
+    assert attestation.eth_address == ETH_ADDRESS
+    assert attestation.signature == '0x0001'
+
+
+def test_list_attestations_invalid_cursor(app):
+    with pytest.raises(ValidationError) as validation_err:
+        list_signatures(cursor='not-a-cursor')
+    assert validation_err.value.field_names[0] == 'cursor'
+
+
+def test_list_attestations_cache_is_invalidated(app):
+    add_attestation(AttestationTypes.PHONE, 1)
+    assert list_signatures() == (['0x0001'], None)
+
+    add_attestation(AttestationTypes.EMAIL, 2)
+    # Served from the cache until the identity's attestations change
+    assert list_signatures() == (['0x0001'], None)
+    attestations_changed(ETH_ADDRESS)
+    assert list_signatures() == (['0x0002', '0x0001'], None)
+
+
+def test_stored_attestation_invalidates_cache(app):
+    add_attestation(AttestationTypes.PHONE, 1)
+    assert list_signatures() == (['0x0001'], None)
+
+    tasks.store_attestation.delay('EMAIL', ETH_ADDRESS, 'value', '0x0002',
+                                  '192.168.1.1')
+
+    assert list_signatures() == (['0x0002', '0x0001'], None)
+
+
+def test_cache_ignores_pages_read_before_a_change():
+    cache = AttestationListCache(size=2, ttl=60, pages=2)
+    page, generation = cache.get('0xabc', 'query')
+    assert page is None
+
+    cache.invalidate('0xabc')
+    cache.put('0xabc', 'query', 'stale', generation)
+    assert cache.get('0xabc', 'query')[0] is None
+
+    page, generation = cache.get('0xabc', 'query')
+    cache.put('0xabc', 'query', 'fresh', generation)
+    assert cache.get('0xabc', 'query')[0] == 'fresh'
+
+
+def at(seconds):
+    return mock.patch('logic.attestation_query_service.time.monotonic',
+                      return_value=seconds)
+
+
+def test_cache_keeps_pages_read_from_a_replica_briefly():
+    cache = AttestationListCache(size=2, ttl=60, pages=2, replica_lag=5)
+    with at(100):
+        cache.invalidate('0xabc')
+    with at(102):
+        generation = cache.get('0xabc', 'query')[1]
+        cache.put('0xabc', 'query', 'lagging', generation)
+        assert cache.get('0xabc', 'query')[0] == 'lagging'
+
+    # Dropped once the replica has caught up, then cached for the TTL
+    with at(105):
+        page, generation = cache.get('0xabc', 'query')
+        assert page is None
+        cache.put('0xabc', 'query', 'fresh', generation)
+    with at(164):
+        assert cache.get('0xabc', 'query')[0] == 'fresh'
+
+
+def test_cache_of_size_0_is_off():
+    cache = AttestationListCache(size=0, ttl=60, pages=2)
+    page, generation = cache.get('0xabc', 'query')
+    cache.put('0xabc', 'query', 'page', generation)
+    assert cache.get('0xabc', 'query')[0] is None
+
+
+def test_cache_expires_pages():
+    cache = AttestationListCache(size=2, ttl=0, pages=2)
+    page, generation = cache.get('0xabc', 'query')
+    cache.put('0xabc', 'query', 'page', generation)
+    assert cache.get('0xabc', 'query')[0] is None
+
+
+def test_cache_keeps_recently_used_pages_of_an_identity():
+    cache = AttestationListCache(size=2, ttl=60, pages=2)
+    for query in ('first', 'second'):
+        generation = cache.get('0xabc', query)[1]
+        cache.put('0xabc', query, query, generation)
+    assert cache.get('0xabc', 'first')[0] == 'first'
+
+    generation = cache.get('0xabc', 'third')[1]
+    cache.put('0xabc', 'third', 'third', generation)
+
+    assert cache.get('0xabc', 'second')[0] is None
+    assert cache.get('0xabc', 'first')[0] == 'first'
+    assert cache.get('0xabc', 'third')[0] == 'third'
@@ -0,0 +1,139 @@
+"""
+Provider outages against local stand-ins for Twilio and Facebook that can
+be made slow or failing: calls to a degraded provider are cut off at the
+request deadline and then refused by its circuit breaker, while the other
+providers keep being served.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import mock
+import pytest
+
+from config import settings
+from logic.attestation_service import VerificationService
+from logic.service_utils import PhoneVerificationError
+from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import deadline, http_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        server.calls += 1
+        if server.delay:
+            time.sleep(server.delay)
+        if server.failing:
+            status, body = 503, {'error_code': '60060'}
+        elif self.path.startswith('/facebook/v2.12/oauth/access_token'):
+            status, body = 200, {'access_token': '12345'}
+        elif self.path.startswith('/facebook/me'):
+            status, body = 200, {'name': 'Origin Protocol'}
+        else:
+            status, body = 200, {'success': True}
+        data = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow response
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    calls = 0
+    delay = 0
+    failing = False
+
+    def url(self, path):
+        return 'http://localhost:{}{}'.format(self.server_address[1], path)
+
+
+@pytest.yield_fixture
+def stand_ins():
+    servers = [StandIn(('localhost', 0), _Handler) for _ in range(2)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    twilio, facebook = servers
+    http_client.reset_breakers()
+    with mock.patch.multiple('logic.attestation_service',
+                             authy_url=twilio.url('/authy/'),
+                             facebook_graph_url=facebook.url('/facebook')), \
+            mock.patch.object(settings, 'CIRCUIT_BREAKER_MIN_CALLS', 4):
+        yield twilio, facebook
+    http_client.reset_breakers()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def send_code():
+    return VerificationService.send_phone_verification(
+        '1', '12341234', 'sms', None)
+
+
+def test_failing_provider_fails_fast(stand_ins, app):
+    twilio, facebook = stand_ins
+    twilio.failing = True
+
+    errors = []
+    for _ in range(10):
+        with pytest.raises(PhoneVerificationError) as service_err:
+            send_code()
+        errors.append(service_err.value.status_code)
+
+    # Twilio stops being called once half its calls have failed
+    assert twilio.calls == 4
+    assert errors == [422] * 4 + [503] * 6
+
+    # Facebook is unaffected
+    with app.test_request_context():
+        response = VerificationService.verify_facebook(
+            'abcde12345', str_eth(sample_eth_address))
+    assert response.data['data'] == 'facebook verified'
+
+
+def test_slow_provider_is_cut_off_at_deadline(stand_ins):
+    twilio, _ = stand_ins
+    twilio.delay = 5
+
+    start = time.monotonic()
+    with deadline.budget(0.5):
+        with pytest.raises(PhoneVerificationError) as service_err:
+            send_code()
+
+    assert time.monotonic() - start < 2
+    assert service_err.value.status_code == 503
+
+
+def test_slow_provider_opens_circuit(stand_ins):
+    twilio, _ = stand_ins
+    twilio.delay = 0.3
+
+    with mock.patch.object(settings, 'CIRCUIT_BREAKER_SLOW_CALL', 0.1):
+        http_client.reset_breakers()
+        # Slow calls succeed until there are enough of them to judge
+        for _ in range(4):
+            send_code()
+        with pytest.raises(PhoneVerificationError):
+            send_code()
+
+    assert twilio.calls == 4
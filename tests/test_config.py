@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 """Test configs."""
 from app.app_config import AppConfig
+from config import settings
 
 
 def test_app_config():
     assert hasattr(AppConfig, 'SQLALCHEMY_DATABASE_URI')
+
+
+def test_app_config_pool():
+    assert AppConfig.SQLALCHEMY_POOL_SIZE == settings.WAITRESS_THREADS
+    assert AppConfig.SQLALCHEMY_POOL_PRE_PING
+    assert not AppConfig.SQLALCHEMY_PGBOUNCER
@@ -0,0 +1,51 @@
+"""Test pool options and read replica routing."""
+import mock
+import pytest
+from sqlalchemy.pool import NullPool
+
+from database import REPLICA, db
+from database.models import Attestation
+
+
+@pytest.fixture
+def replica(app):
+    binds = {REPLICA: app.config['SQLALCHEMY_DATABASE_URI']}
+    with mock.patch.dict(app.config, {'SQLALCHEMY_BINDS': binds}):
+        engine = db.get_engine(app, bind=REPLICA)
+        yield engine
+    engine.dispose()
+
+
+def test_reads_go_to_the_replica_until_a_write(replica):
+    session = db.session()
+    select = Attestation.query.filter_by(id=1).statement
+    assert session.get_bind(clause=select) is replica
+    assert session.get_bind(clause=select.with_for_update()) is not replica
+
+    session.get_bind(clause=Attestation.__table__.insert())
+    # The transaction's reads see its writes
+    assert session.get_bind(clause=select) is not replica
+    session.rollback()
+    assert session.get_bind(clause=select) is replica
+
+
+def test_reads_use_the_primary_without_a_replica(app):
+    select = Attestation.query.filter_by(id=1).statement
+    assert db.session().get_bind(clause=select) is db.session.bind
+
+
+def test_pool_options(app):
+    options = {}
+    with mock.patch.dict(app.config, {'SQLALCHEMY_POOL_SIZE': 8,
+                                      'SQLALCHEMY_POOL_PRE_PING': True}):
+        db.apply_pool_defaults(app, options)
+    assert options['pool_size'] == 8
+    assert options['pool_pre_ping']
+
+
+def test_pgbouncer_mode_does_not_pool(app):
+    options = {}
+    with mock.patch.dict(app.config, {'SQLALCHEMY_POOL_SIZE': 8,
+                                      'SQLALCHEMY_PGBOUNCER': True}):
+        db.apply_pool_defaults(app, options)
+    assert options == {'poolclass': NullPool}
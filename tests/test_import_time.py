@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Import time budgets for the web process entry points."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from config import settings
+
+# Import time budgets in milliseconds, measured in a fresh interpreter.
+IMPORT_TIME_BUDGETS_MS = {
+    'main': 3000,
+    'logic.attestation_service': 2000,
+}
+
+# Modules that must only be loaded on first use, never at import time.
+LAZY_MODULES = ['web3', 'eth_keys', 'eth_account']
+
+# Run in the fresh interpreter. Timed with perf_counter rather than
+# -X importtime, which needs Python 3.7, and the runtime is 3.6.
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def import_module(module):
+    """Returns the milliseconds importing module took in a fresh
+    interpreter, and the names of the modules loaded by then."""
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+        cwd=settings.PROJECTPATH,
+        env=dict(os.environ),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+    imported = json.loads(result.stdout.splitlines()[-1])
+    return imported['ms'], set(imported['modules'])
+
+
+@pytest.mark.parametrize('module', sorted(IMPORT_TIME_BUDGETS_MS))
+def test_import_time_budget(module):
+    elapsed_ms, modules = import_module(module)
+
+    for lazy_module in LAZY_MODULES:
+        assert lazy_module not in modules
+
+    assert elapsed_ms < IMPORT_TIME_BUDGETS_MS[module]
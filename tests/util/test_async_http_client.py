@@ -0,0 +1,34 @@
+import mock
+import pytest
+
+from util import async_http_client, http_client
+from util.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+URL = 'http://half-open.example.com/'
+
+
+@pytest.fixture
+def half_open():
+    http_client.reset_breakers()
+    breaker = http_client.get_breaker(URL)
+    breaker.state = CircuitBreaker.HALF_OPEN
+    yield breaker
+    http_client.reset_breakers()
+
+
+def test_requests_claim_the_trial_call_on_entering(half_open):
+    # Created but never entered
+    async_http_client.get(URL)
+
+    half_open.check()
+    with pytest.raises(CircuitOpenError):
+        half_open.check()
+
+
+async def test_open_circuit_is_raised_on_entering(half_open):
+    half_open.check()
+    with mock.patch.object(async_http_client, 'get_session') as get_session:
+        with pytest.raises(CircuitOpenError):
+            async with async_http_client.get(URL):
+                pass
+    assert not get_session.called
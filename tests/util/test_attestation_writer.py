@@ -0,0 +1,159 @@
+import os
+import threading
+
+import mock
+import pytest
+
+from util.attestation_writer import AttestationWriter, WriterFull
+
+
+class Inserts(object):
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.inserted = threading.Event()
+
+    def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is down')
+        self.batches.append(rows)
+        self.inserted.set()
+
+
+def spool_files(spool_dir):
+    return [name for name in os.listdir(str(spool_dir))
+            if name.endswith('.spool')]
+
+
+def test_rows_are_inserted_together(tmpdir):
+    inserts = Inserts()
+    writer = AttestationWriter(inserts, str(tmpdir), 'test.writer.batch',
+                               max_delay=0.2)
+    writer.start()
+    for i in range(10):
+        writer.submit({'signature': str(i)})
+    writer.stop()
+
+    assert inserts.batches == [[{'signature': str(i)} for i in range(10)]]
+    assert spool_files(tmpdir) == []
+
+
+def test_full_batch_is_flushed_early(tmpdir):
+    inserted = threading.Event()
+
+    def insert(rows):
+        inserted.set()
+
+    writer = AttestationWriter(insert, str(tmpdir), 'test.writer.early',
+                               batch_size=5, max_delay=60)
+    writer.start()
+    for i in range(5):
+        writer.submit({'signature': str(i)})
+    assert inserted.wait(5)
+    writer.stop()
+
+
+def test_full_queue_applies_backpressure(tmpdir):
+    release = threading.Event()
+    writer = AttestationWriter(lambda rows: release.wait(), str(tmpdir),
+                               'test.writer.full', max_delay=0,
+                               max_pending=2)
+    writer.start()
+    writer.submit({'signature': '1'})
+    writer.submit({'signature': '2'})
+    with pytest.raises(WriterFull):
+        writer.submit({'signature': '3'}, timeout=0.1)
+
+    release.set()
+    writer.submit({'signature': '3'}, timeout=5)
+    writer.stop()
+
+
+def test_failed_inserts_are_retried(tmpdir):
+    inserts = Inserts(failures=2)
+    with mock.patch('util.attestation_writer.RETRY_DELAYS', (0.01,)):
+        writer = AttestationWriter(inserts, str(tmpdir), 'test.writer.retry',
+                                   max_delay=0)
+        writer.start()
+        writer.submit({'signature': '1'})
+        assert inserts.inserted.wait(5)
+        writer.stop()
+
+    assert inserts.batches == [[{'signature': '1'}]]
+    assert spool_files(tmpdir) == []
+
+
+def test_spooled_rows_survive_a_crash(tmpdir):
+    down = AttestationWriter(Inserts(failures=1000), str(tmpdir),
+                             'test.writer.crash', max_delay=0)
+    down.start()
+    down.submit({'signature': '1'})
+    down.submit({'signature': '2'})
+    down.stop()
+    assert spool_files(tmpdir)
+
+    # A torn last line was never acknowledged, and is skipped
+    with open(os.path.join(str(tmpdir), spool_files(tmpdir)[0]), 'a') as spool:
+        spool.write('{"signa')
+
+    inserts = Inserts()
+    writer = AttestationWriter(inserts, str(tmpdir), 'test.writer.crash')
+    writer.start()
+    writer.stop()
+
+    assert sorted(row['signature'] for rows in inserts.batches
+                  for row in rows) == ['1', '2']
+    assert spool_files(tmpdir) == []
+
+
+def test_rows_the_database_refuses_are_set_aside(tmpdir):
+    inserted = []
+
+    def insert(rows):
+        if any(row['signature'] == 'bad' for row in rows):
+            raise ValueError('invalid input syntax for type inet')
+        inserted.extend(rows)
+
+    writer = AttestationWriter(insert, str(tmpdir), 'test.writer.dead',
+                               max_delay=0.2, transient=(RuntimeError,))
+    writer.start()
+    for signature in ('1', '2', 'bad', '3', '4'):
+        writer.submit({'signature': signature})
+    writer.stop()
+
+    assert [row['signature'] for row in inserted] == ['1', '2', '3', '4']
+    assert spool_files(tmpdir) == []
+    dead, = [name for name in os.listdir(str(tmpdir))
+             if name.endswith('.dead')]
+    with open(os.path.join(str(tmpdir), dead)) as dead_letters:
+        assert dead_letters.read() == '{"signature": "bad"}\n'
+
+
+def test_spools_of_a_running_writer_are_not_recovered(tmpdir):
+    release = threading.Event()
+    inserting = threading.Event()
+    inserted = []
+
+    def insert(rows):
+        inserting.set()
+        release.wait()
+        inserted.extend(rows)
+
+    running = AttestationWriter(insert, str(tmpdir), 'test.writer.running',
+                                max_delay=0)
+    running.start()
+    running.submit({'signature': '1'})
+    assert inserting.wait(5)
+
+    # Same process, so only the lock tells its spool files apart
+    inserts = Inserts()
+    other = AttestationWriter(inserts, str(tmpdir), 'test.writer.other')
+    other.start()
+    other.stop()
+    release.set()
+    running.stop()
+
+    assert inserts.batches == []
+    assert inserted == [{'signature': '1'}]
+    assert spool_files(tmpdir) == []
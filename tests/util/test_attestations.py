@@ -0,0 +1,103 @@
+import mock
+import pytest
+
+from logic.service_utils import AccountNotFoundError
+from tests.helpers.eth_utils import (
+    legacy_generate_signature,
+    sample_eth_address,
+    str_eth
+)
+from util import attestations, metrics
+
+PRIVATE_KEY = ('0x1fc2b755568ce8402e422f8fd0da54d3'
+               '84f42962c8f925116964f39245d429e0')
+
+
+@pytest.mark.parametrize('claim_type,data', [
+    (10, 'phone verified'),
+    (11, 'email verified'),
+    (5, 'airbnbUserId:123456'),
+])
+def test_generate_signature_matches_web3(claim_type, data):
+    subject = str_eth(sample_eth_address)
+    signature = attestations.generate_signature(
+        PRIVATE_KEY, subject, claim_type, data)
+    assert signature == legacy_generate_signature(
+        PRIVATE_KEY, subject, claim_type, data)
+
+
+def test_get_signer_is_cached():
+    signer = attestations.get_signer(PRIVATE_KEY)
+    assert attestations.get_signer(PRIVATE_KEY) is signer
+    assert signer.address == '0x99C03fBb0C995ff1160133A8bd210D0E77bCD101'
+
+
+def test_claim_cache_keeps_recently_used_claims():
+    attestations._claim_bytes.cache_clear()
+    for i in range(2 * attestations.CLAIM_CACHE_SIZE):
+        attestations._claim_bytes(5, 'airbnbUserId:{}'.format(i))
+        attestations._claim_bytes(10, 'phone verified')
+
+    info = attestations._claim_bytes.cache_info()
+    assert info.currsize == attestations.CLAIM_CACHE_SIZE
+    # Only the first 'phone verified' missed
+    assert info.hits == 2 * attestations.CLAIM_CACHE_SIZE - 1
+
+
+def test_generate_signature_invalid_address():
+    with pytest.raises(AccountNotFoundError):
+        attestations.generate_signature(
+            PRIVATE_KEY, str_eth(sample_eth_address).lower(), 10, 'phone verified')
+
+
+def test_signature_cache_evicts_least_recently_used():
+    cache = attestations.SignatureCache(2)
+    cache.put('a', '0x01')
+    cache.put('b', '0x02')
+    assert cache.get('a') == '0x01'
+    cache.put('c', '0x03')
+
+    assert cache.get('b') is None
+    assert cache.get('c') == '0x03'
+    assert cache.stats() == {'size': 2, 'hits': 2, 'misses': 1, 'evictions': 1}
+
+
+def test_signature_cache_publishes_metrics():
+    cache = attestations.SignatureCache(1, name='test.signature_cache')
+    cache.put('a', '0x01')
+    cache.get('a')
+    cache.put('b', '0x02')
+    cache.get('a')
+
+    assert metrics.counter('test.signature_cache.hit').value == 1
+    assert metrics.counter('test.signature_cache.miss').value == 1
+    assert metrics.counter('test.signature_cache.eviction').value == 1
+    assert metrics.gauge('test.signature_cache.size').value == 1
+
+
+def test_generate_signature_uses_cache():
+    cache = attestations.SignatureCache(10)
+    subject = str_eth(sample_eth_address)
+    with mock.patch.object(attestations, 'signature_cache', cache):
+        first = attestations.generate_signature(
+            PRIVATE_KEY, subject, 10, 'phone verified')
+        second = attestations.generate_signature(
+            PRIVATE_KEY, subject, 10, 'phone verified')
+
+    assert first == second
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_recover_signer():
+    subject = str_eth(sample_eth_address)
+    signature = attestations.generate_signature(
+        PRIVATE_KEY, subject, 10, 'phone verified')
+
+    assert attestations.recover_signer(subject, 10, 'phone verified', signature) == \
+        attestations.get_signer(PRIVATE_KEY).address
+    assert attestations.recover_signer(subject, 11, 'phone verified', signature) != \
+        attestations.get_signer(PRIVATE_KEY).address
+
+    with pytest.raises(ValueError):
+        attestations.recover_signer(subject, 10, 'phone verified', signature[:-2])
@@ -0,0 +1,81 @@
+import time
+
+import mock
+import pytest
+
+from util import metrics
+from util.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.check()
+        breaker.record(False)
+
+
+def later(seconds):
+    return mock.patch('util.circuit_breaker.time.monotonic',
+                      return_value=time.monotonic() + seconds)
+
+
+def test_opens_at_failure_rate():
+    breaker = CircuitBreaker('test.breaker.rate', failure_rate=0.5,
+                             window=10, min_calls=4)
+    breaker.record(True)
+    fail(breaker, 2)
+    # Two of three calls failed, but too few calls were made to judge
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert metrics.counter('circuit.test.breaker.rate.rejected').value == 1
+    assert metrics.gauge('circuit.test.breaker.rate.open').value == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker('test.breaker.slow', min_calls=2, slow_call=1)
+    breaker.record(True, duration=2)
+    breaker.record(True, duration=0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_trial_call_after_open_seconds():
+    breaker = CircuitBreaker('test.breaker.trial', min_calls=1,
+                             open_seconds=30)
+    fail(breaker)
+
+    with later(31):
+        breaker.check()
+        # Only one trial call at a time
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with later(62):
+        with breaker.call():
+            pass
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert metrics.gauge('circuit.test.breaker.trial.open').value == 0
+
+
+def test_release_lets_another_trial_through():
+    breaker = CircuitBreaker('test.breaker.release', min_calls=1,
+                             open_seconds=30)
+    fail(breaker)
+
+    with later(31):
+        breaker.check()
+        breaker.release()
+        breaker.check()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_call_records_exceptions():
+    breaker = CircuitBreaker('test.breaker.call', min_calls=1)
+    with pytest.raises(ValueError):
+        with breaker.call():
+            raise ValueError()
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,33 @@
+import pytest
+
+from util import deadline
+from util.deadline import DeadlineExceeded
+
+
+def test_no_budget():
+    assert deadline.remaining() is None
+    assert deadline.cap_timeout((3, 10)) == (3, 10)
+
+
+def test_budget_caps_timeouts():
+    with deadline.budget(5):
+        assert 4 < deadline.remaining() <= 5
+        connect_timeout, read_timeout = deadline.cap_timeout((3, 10))
+        assert connect_timeout == 3
+        assert 4 < read_timeout <= 5
+        assert deadline.cap_timeout(None) <= 5
+    assert deadline.remaining() is None
+
+
+def test_inner_budget_cannot_extend_outer():
+    with deadline.budget(1):
+        with deadline.budget(60):
+            assert deadline.remaining() <= 1
+        with deadline.budget(0.5):
+            assert deadline.remaining() <= 0.5
+
+
+def test_exhausted_budget():
+    with deadline.budget(0):
+        with pytest.raises(DeadlineExceeded):
+            deadline.cap_timeout(10)
@@ -0,0 +1,96 @@
+import pytest
+import responses
+
+from util import metrics
+from util.email_queue import (
+    Delivery,
+    EmailQueue,
+    LocalTransport,
+    SendGridTransport,
+    TransportError
+)
+
+MESSAGE = {
+    'from': {'email': 'origin@foo.bar'},
+    'subject': 'Code',
+    'content': [{'type': 'text/plain', 'value': 'Your code is -code-.'}]
+}
+
+
+@pytest.fixture
+def transport():
+    return LocalTransport(reject=lambda email: email.startswith('bad'))
+
+
+def make_queue(transport, **kwargs):
+    queue = EmailQueue(transport, MESSAGE, 'test.email', **kwargs)
+    queue.start()
+    return queue
+
+
+def test_emails_are_batched(transport):
+    queue = make_queue(transport, max_delay=0.2)
+    deliveries = [queue.submit('{}@foo.bar'.format(i), {'-code-': str(i)})
+                  for i in range(5)]
+    assert all(delivery.wait(5) for delivery in deliveries)
+    queue.stop()
+
+    assert len(transport.requests) == 1
+    request_body = transport.requests[0]
+    assert request_body['subject'] == 'Code'
+    assert request_body['personalizations'][3] == {
+        'to': [{'email': '3@foo.bar'}],
+        'substitutions': {'-code-': '3'}
+    }
+    assert [queue.status(delivery.id) for delivery in deliveries] == \
+        [Delivery.SENT] * 5
+
+
+def test_full_batch_is_sent_without_delay(transport):
+    queue = make_queue(transport, batch_size=2, max_delay=60)
+    first = queue.submit('1@foo.bar', {})
+    second = queue.submit('2@foo.bar', {})
+    assert first.wait(5) and second.wait(5)
+    queue.stop()
+    assert transport.sent == ['1@foo.bar', '2@foo.bar']
+
+
+def test_rejected_email_fails_alone(transport):
+    failed = metrics.counter('test.email.failed').value
+    queue = make_queue(transport, max_delay=0.2)
+    deliveries = [queue.submit(email, {}) for email in
+                  ['1@foo.bar', 'bad@foo.bar', '2@foo.bar', '3@foo.bar']]
+    assert all(delivery.wait(5) for delivery in deliveries)
+    queue.stop()
+
+    assert [delivery.status for delivery in deliveries] == [
+        Delivery.SENT, Delivery.FAILED, Delivery.SENT, Delivery.SENT]
+    assert sorted(transport.sent) == ['1@foo.bar', '2@foo.bar', '3@foo.bar']
+    assert metrics.counter('test.email.failed').value == failed + 1
+
+
+def test_stop_sends_queued_emails(transport):
+    queue = make_queue(transport, max_delay=60)
+    delivery = queue.submit('1@foo.bar', {})
+    queue.stop(5)
+    assert delivery.status == Delivery.SENT
+
+
+def test_unknown_delivery_status(transport):
+    assert EmailQueue(transport, MESSAGE, 'test.email').status('id') is None
+
+
+@responses.activate
+def test_sendgrid_transport():
+    responses.add(responses.POST, SendGridTransport.url, status=202)
+    responses.add(responses.POST, SendGridTransport.url, status=400,
+                  json={'errors': [{'message': 'Invalid email'}]})
+    transport = SendGridTransport('api-key')
+
+    transport.send(MESSAGE)
+    with pytest.raises(TransportError) as transport_err:
+        transport.send(MESSAGE)
+
+    assert transport_err.value.status_code == 400
+    assert responses.calls[0].request.headers['Authorization'] == \
+        'Bearer api-key'
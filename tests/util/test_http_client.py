@@ -0,0 +1,108 @@
+import mock
+import pytest
+import requests
+import responses
+
+from config import settings
+from util import deadline, http_client, metrics
+from util.circuit_breaker import CircuitOpenError
+from util.deadline import DeadlineExceeded
+
+
+def test_get_session_is_shared_per_host():
+    session = http_client.get_session('https://api.authy.com/protected/json/phones')
+    assert http_client.get_session('https://api.authy.com/other') is session
+    assert http_client.get_session('https://graph.facebook.com/me') is not session
+    assert http_client.get_session('http://api.authy.com/') is not session
+
+
+def test_session_pool_size():
+    session = http_client.get_session('https://pool-size.example.com/')
+    adapter = session.get_adapter('https://pool-size.example.com/')
+    assert adapter._pool_maxsize == settings.HTTP_POOL_SIZE
+
+
+@responses.activate
+def test_default_timeout():
+    responses.add(responses.GET, 'https://timeout.example.com/', body='ok')
+    session = http_client.get_session('https://timeout.example.com/')
+    with mock.patch.object(session, 'send', wraps=session.send) as send:
+        http_client.get('https://timeout.example.com/')
+        assert send.call_args[1]['timeout'] == (
+            settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+        http_client.get('https://timeout.example.com/', timeout=1)
+        assert send.call_args[1]['timeout'] == 1
+
+
+@responses.activate
+def test_cookies_are_not_shared():
+    responses.add(responses.GET, 'https://cookies.example.com/',
+                  body='ok', headers={'Set-Cookie': 'session=user-a'})
+    http_client.get('https://cookies.example.com/')
+    http_client.get('https://cookies.example.com/')
+    assert 'Cookie' not in responses.calls[1].request.headers
+
+
+@responses.activate
+def test_timeout_is_capped_by_deadline():
+    responses.add(responses.GET, 'https://deadline.example.com/', body='ok')
+    session = http_client.get_session('https://deadline.example.com/')
+    with mock.patch.object(session, 'send', wraps=session.send) as send:
+        with deadline.budget(5):
+            http_client.get('https://deadline.example.com/')
+        connect_timeout, read_timeout = send.call_args[1]['timeout']
+        assert connect_timeout == settings.HTTP_CONNECT_TIMEOUT
+        assert 4 < read_timeout <= 5
+
+        with deadline.budget(0):
+            with pytest.raises(DeadlineExceeded):
+                http_client.get('https://deadline.example.com/')
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_deadline_timeouts_do_not_open_circuit():
+    responses.add(responses.GET, 'https://slow.example.com/',
+                  body=requests.exceptions.ReadTimeout())
+    http_client.reset_breakers()
+    with mock.patch.object(settings, 'CIRCUIT_BREAKER_MIN_CALLS', 1):
+        with deadline.budget(1):
+            with pytest.raises(requests.exceptions.ReadTimeout):
+                http_client.get('https://slow.example.com/')
+        assert http_client.get_breaker(
+            'https://slow.example.com/').state == 'closed'
+
+        # Timing out within the host's own timeout is held against it
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            http_client.get('https://slow.example.com/')
+        assert http_client.get_breaker(
+            'https://slow.example.com/').state == 'open'
+    http_client.reset_breakers()
+
+
+@responses.activate
+def test_server_errors_open_circuit():
+    responses.add(responses.GET, 'https://failing.example.com/', status=503)
+    http_client.reset_breakers()
+    with mock.patch.object(settings, 'CIRCUIT_BREAKER_MIN_CALLS', 4):
+        for _ in range(4):
+            assert http_client.get('https://failing.example.com/').status_code == 503
+        with pytest.raises(CircuitOpenError):
+            http_client.get('https://failing.example.com/')
+    http_client.reset_breakers()
+
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_calls_are_measured_per_host():
+    responses.add(responses.GET, 'https://measured.example.com/', body='ok')
+    responses.add(responses.GET, 'https://measured.example.com/missing',
+                  status=404)
+    http_client.get('https://measured.example.com/')
+    http_client.get('https://measured.example.com/missing')
+
+    snapshot = metrics.snapshot()
+    assert snapshot['provider.request{host=measured.example.com}']['count'] == 2
+    assert snapshot['provider.responses{host=measured.example.com,status=200}'] == 1
+    assert snapshot['provider.responses{host=measured.example.com,status=404}'] == 1
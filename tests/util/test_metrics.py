@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from util import metrics
+
+
+def test_counter():
+    metrics.counter('test.counter').inc()
+    metrics.counter('test.counter').inc(2)
+    assert metrics.snapshot()['test.counter'] == 3
+
+
+def test_timed_records_on_error():
+    with pytest.raises(ValueError):
+        with metrics.timed('test.timer'):
+            raise ValueError()
+    with metrics.timed('test.timer'):
+        pass
+
+    timer = metrics.snapshot()['test.timer']
+    assert timer['count'] == 2
+    assert 0 <= timer['min_ms'] <= timer['mean_ms'] <= timer['max_ms']
+
+
+def test_metric_type_mismatch():
+    metrics.gauge('test.gauge').set(5)
+    assert metrics.snapshot()['test.gauge'] == 5
+    with pytest.raises(TypeError):
+        metrics.counter('test.gauge')
+
+
+def test_counter_threads():
+    def work():
+        for _ in range(1000):
+            metrics.counter('test.threads').inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.counter('test.threads').value == 8000
+
+
+def test_cells_of_exited_threads_are_retired():
+    def work():
+        metrics.counter('test.exited').inc()
+        metrics.timer('test.exited_ms').record(5)
+
+    for _ in range(3):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    assert metrics.counter('test.exited').value == 3
+    assert metrics.timer('test.exited_ms').totals() == (3, 15.0, 5, 5)
+    assert not metrics.counter('test.exited')._cells._cells
+    assert not metrics.timer('test.exited_ms')._cells._cells
+
+
+def test_labels():
+    metrics.counter('test.labelled', status=200).inc()
+    metrics.counter('test.labelled', status=200).inc()
+    metrics.counter('test.labelled', status=503).inc()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['test.labelled{status=200}'] == 2
+    assert snapshot['test.labelled{status=503}'] == 1
+
+
+def test_histogram():
+    histogram = metrics.histogram('test.histogram')
+    for seconds in (0.004, 0.005, 0.2, 30):
+        histogram.observe(seconds)
+
+    snapshot = metrics.snapshot()['test.histogram']
+    assert snapshot['count'] == 4
+    assert snapshot['sum_s'] == pytest.approx(30.209)
+    assert snapshot['buckets'][0.005] == 2
+    assert snapshot['buckets'][0.25] == 3
+    assert snapshot['buckets'][10] == 3
+
+
+def test_exposition():
+    metrics.counter('test.exposed', host='api.authy.com').inc(3)
+    with metrics.observed('test.exposed.latency', endpoint='/api/"x"'):
+        pass
+
+    lines = metrics.exposition().splitlines()
+    assert '# TYPE test_exposed_total counter' in lines
+    assert 'test_exposed_total{host="api.authy.com"} 3' in lines
+    assert '# TYPE test_exposed_latency_seconds histogram' in lines
+    assert 'test_exposed_latency_seconds_bucket' \
+        '{endpoint="/api/\\"x\\"",le="+Inf"} 1' in lines
+    assert 'test_exposed_latency_seconds_count{endpoint="/api/\\"x\\""} 1' \
+        in lines
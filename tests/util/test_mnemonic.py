@@ -0,0 +1,42 @@
+import pytest
+
+from util import mnemonic
+
+CODE = 'art brick aspect accident brass betray antenna'
+
+
+def test_encode_decode_round_trip():
+    wordlist = mnemonic.get_wordlist()
+    data = bytes(range(256))
+    assert wordlist.decode(wordlist.encode(data)) == data
+
+
+def test_decode_ignores_case_and_whitespace():
+    wordlist = mnemonic.get_wordlist()
+    assert wordlist.decode(' Art  BRICK\naspect\taccident brass betray antenna ') == \
+        wordlist.decode(CODE)
+    assert len(wordlist.decode(CODE)) == 7
+
+
+def test_encode():
+    wordlist = mnemonic.get_wordlist()
+    assert wordlist.encode(bytes([0, 255])) == '{} {}'.format(
+        wordlist.words[0], wordlist.words[255])
+    assert len(wordlist.encode(bytes(7)).split()) == 7
+
+
+def test_decode_unknown_word():
+    with pytest.raises(ValueError):
+        mnemonic.get_wordlist().decode('art brick bananas')
+
+
+def test_wordlist_is_loaded_once():
+    assert mnemonic.get_wordlist() is mnemonic.get_wordlist()
+
+
+def test_invalid_wordlist():
+    words = list(mnemonic.get_wordlist().words)
+    with pytest.raises(ValueError):
+        mnemonic.Wordlist(words[:-1])
+    with pytest.raises(ValueError):
+        mnemonic.Wordlist(words[:-1] + words[:1])
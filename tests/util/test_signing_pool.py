@@ -0,0 +1,74 @@
+import mock
+import pytest
+
+from config import settings
+from logic.service_utils import AccountNotFoundError
+from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import attestations, signing_pool
+
+
+@pytest.fixture
+def pool():
+    with mock.patch.object(settings, 'SIGNING_POOL_SIZE', 1):
+        yield signing_pool.start_pool()
+    pool = signing_pool.get_pool()
+    if pool is not None:
+        signing_pool._discard_pool(pool)
+
+
+def expected_signature(claim_type, data):
+    return attestations.generate_signature(
+        settings.ATTESTATION_SIGNING_KEY, str_eth(sample_eth_address),
+        claim_type, data)
+
+
+def test_generate_signature_without_pool():
+    assert signing_pool.get_pool() is None
+    signature = signing_pool.generate_signature(
+        settings.ATTESTATION_SIGNING_KEY, str_eth(sample_eth_address),
+        10, 'phone verified')
+    assert signature == expected_signature(10, 'phone verified')
+
+
+def test_generate_signature_in_pool(pool):
+    signature = signing_pool.generate_signature(
+        settings.ATTESTATION_SIGNING_KEY, str_eth(sample_eth_address),
+        11, 'email verified')
+    assert signature == expected_signature(11, 'email verified')
+
+    with pytest.raises(AccountNotFoundError):
+        signing_pool.generate_signature(
+            settings.ATTESTATION_SIGNING_KEY,
+            str_eth(sample_eth_address).lower(), 11, 'email verified')
+
+
+def test_sign_in_pool_raises_the_signing_error(pool):
+    with pytest.raises(OverflowError) as exc_info:
+        pool.sign(str_eth(sample_eth_address), 2 ** 256, 'phone verified')
+    assert str(exc_info.value) == 'Invalid claim.'
+
+
+def test_generate_signature_broken_pool_falls_back(pool):
+    with mock.patch.object(pool, 'sign', side_effect=RuntimeError):
+        signature = signing_pool.generate_signature(
+            settings.ATTESTATION_SIGNING_KEY, str_eth(sample_eth_address),
+            10, 'phone verified')
+    assert signature == expected_signature(10, 'phone verified')
+    assert signing_pool.get_pool() is not pool
+
+
+def test_sign_chunk_keeps_going_past_invalid_claims():
+    subject = str_eth(sample_eth_address)
+    results = signing_pool._sign_chunk(settings.ATTESTATION_SIGNING_KEY, [
+        (subject, -1, 'phone verified'),
+        (subject, 2 ** 256, 'phone verified'),
+        (subject, 10, {'not': 'a string'}),
+        (subject.lower(), 10, 'phone verified'),
+        (subject, 10, 'phone verified'),
+    ])
+
+    assert [result[:2] for result in results[:3]] == \
+        [(None, 'Invalid claim.')] * 3
+    assert results[3][0] is None
+    assert results[3][2] is AccountNotFoundError
+    assert results[4] == (expected_signature(10, 'phone verified'), None, None)
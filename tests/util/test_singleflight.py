@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import mock
+import pytest
+
+from util import metrics
+from util.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def call_concurrently(flights, func, callers):
+    """
+    Starts callers threads on the same key while the first is still running
+    func, then lets func return. Returns each caller's result or exception.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def blocking_func():
+        started.set()
+        release.wait(5)
+        return func()
+
+    def call():
+        try:
+            results.append(flights.do('key', blocking_func))
+        except Exception as exc:
+            results.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Let the other callers reach the call in flight
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    def func():
+        calls.append(1)
+        return 'result'
+
+    assert call_concurrently(flights, func, 5) == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_concurrent_callers_get_the_exception():
+    flights = SingleFlight()
+
+    def func():
+        raise ValueError('failed')
+
+    results = call_concurrently(flights, func, 3)
+
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_calls_after_completion_run_again():
+    flights = SingleFlight()
+    assert flights.do('key', lambda: 1) == 1
+    assert flights.do('key', lambda: 2) == 2
+
+
+def test_recent_results_are_reused():
+    flights = SingleFlight('test.singleflight.recent', ttl=60)
+    assert flights.do('key', lambda: 1) == 1
+    assert flights.do('key', lambda: 2) == 1
+    assert flights.do('other', lambda: 3) == 3
+    assert metrics.counter('test.singleflight.recent.deduplicated').value == 1
+
+    with mock.patch('util.singleflight.time.monotonic',
+                    return_value=time.monotonic() + 120):
+        assert flights.do('key', lambda: 4) == 4
+
+
+def test_failures_are_not_reused():
+    flights = SingleFlight(ttl=60)
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flights.do('key', fail)
+    assert flights.do('key', lambda: 1) == 1
+
+
+async def test_async_concurrent_callers_share_one_call():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def func():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'result'
+
+    results = await asyncio.gather(*[flights.do('key', func) for _ in range(5)])
+
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert flights._calls == {}
+
+
+async def test_async_recent_results_are_reused():
+    flights = AsyncSingleFlight(ttl=60)
+
+    async def value(result):
+        return result
+
+    assert await flights.do('key', value, 1) == 1
+    assert await flights.do('key', value, 2) == 1
@@ -0,0 +1,50 @@
+import mock
+
+from util.streams import StreamMatcher, response_contains
+
+
+def test_match_within_chunk():
+    matcher = StreamMatcher(b'art brick')
+    assert not matcher.feed(b'<html>')
+    assert matcher.feed(b'code: art brick aspect')
+    assert matcher.bytes_read == 28
+
+
+def test_match_across_chunks():
+    matcher = StreamMatcher(b'art brick')
+    for chunk in [b'code: a', b'rt', b' bri', b'ck aspect']:
+        matcher.feed(chunk)
+    assert matcher.found
+
+
+def test_no_match():
+    matcher = StreamMatcher(b'art brick')
+    for chunk in [b'art', b' bric', b'aspect art bri']:
+        matcher.feed(chunk)
+    assert not matcher.found
+
+
+def test_single_byte_needle():
+    matcher = StreamMatcher(b'x')
+    assert not matcher.feed(b'abc')
+    assert matcher.feed(b'abx')
+
+
+def test_normalized_match_across_chunks():
+    matcher = StreamMatcher(b'art brick aspect', normalize=True)
+    for chunk in [b'code: ART  ', b'\n Brick', b'\t', b' aspect']:
+        matcher.feed(chunk)
+    assert matcher.found
+    assert matcher.bytes_read == 26
+
+
+def test_response_contains_stops_reading():
+    chunks = iter([b'code: art ', b'brick', b'never read'])
+    response = mock.Mock()
+    response.iter_content.return_value = chunks
+
+    matcher = response_contains(response, b'art brick')
+
+    assert matcher.found
+    assert next(chunks) == b'never read'
+    response.close.assert_called_once_with()
@@ -0,0 +1,74 @@
+import threading
+
+import mock
+import pytest
+from celery.contrib.testing.tasks import ping
+from celery.contrib.testing.worker import start_worker
+
+from util import metrics, tasks
+
+# Registers the ping task start_worker expects
+assert ping
+
+ran = threading.Event()
+
+
+@tasks.celery.task(base=tasks.AppTask)
+def record_run(value):
+    ran.set()
+    return value
+
+
+@tasks.celery.task(base=tasks.AppTask)
+def fail():
+    raise ValueError('failed')
+
+
+@pytest.fixture
+def background(app):
+    """Queues tasks on the in-memory broker and runs them on a worker
+    thread, outside the test's app context."""
+    ran.clear()
+    tasks.celery.conf.task_always_eager = False
+    try:
+        with mock.patch.object(tasks, '_flask_app', app):
+            yield
+    finally:
+        tasks.celery.conf.task_always_eager = True
+
+
+def test_tasks_run_eagerly_by_default():
+    count = metrics.timer('task.record_run').count
+    assert record_run.delay('value').get() == 'value'
+    assert metrics.timer('task.record_run').count == count + 1
+
+
+def test_eager_task_exceptions_propagate():
+    failures = metrics.counter('task.fail.failure').value
+    with pytest.raises(ValueError):
+        fail.delay()
+    assert metrics.counter('task.fail.failure').value == failures + 1
+
+
+def test_background_tasks_run_on_worker(background):
+    record_run.delay('value')
+    assert not ran.is_set()
+
+    with start_worker(tasks.celery, perform_ping_check=False):
+        assert ran.wait(10)
+
+
+@pytest.mark.parametrize('retention_months,statements', [
+    (0, ['SELECT attestation_create_partitions(:months)']),
+    (12, ['SELECT attestation_create_partitions(:months)',
+          'SELECT attestation_drop_partitions(:months)']),
+])
+def test_maintain_attestation_partitions(app, retention_months, statements):
+    with mock.patch.object(tasks.settings, 'ATTESTATION_RETENTION_MONTHS',
+                           retention_months), \
+            mock.patch.object(tasks.db.session, 'execute') as execute:
+        tasks.maintain_attestation_partitions.delay()
+
+    assert [call[0][0] for call in execute.call_args_list] == statements
+    assert execute.call_args_list[0][0][1] == {'months': 3}
+    assert 'maintain-attestation-partitions' in tasks.celery.conf.beat_schedule
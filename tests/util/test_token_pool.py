@@ -0,0 +1,54 @@
+import itertools
+import time
+
+import mock
+
+from util import metrics
+from util.token_pool import TokenPool
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_fills_to_size_and_refills():
+    fetch = mock.Mock(side_effect=itertools.count())
+    pool = TokenPool(fetch, 3, 300, 'test.token_pool.refill')
+    pool.start()
+    try:
+        wait_for(lambda: fetch.call_count == 3)
+        assert pool.get() == 0
+        assert pool.get() == 1
+        wait_for(lambda: fetch.call_count == 5)
+        assert [pool.get() for _ in range(3)] == [2, 3, 4]
+    finally:
+        pool.stop()
+
+
+def test_empty_pool_misses():
+    pool = TokenPool(mock.Mock(), 1, 300, 'test.token_pool.miss')
+    assert pool.get() is None
+    assert metrics.counter('test.token_pool.miss.miss').value == 1
+    assert metrics.gauge('test.token_pool.miss.hit_rate').value == 0
+
+
+def test_expired_tokens_are_dropped():
+    pool = TokenPool(mock.Mock(), 2, 60, 'test.token_pool.expired')
+    pool._tokens.append((time.monotonic() - 120, 'stale'))
+    pool._tokens.append((time.monotonic(), 'fresh'))
+    assert pool.get() == 'fresh'
+    assert metrics.counter('test.token_pool.expired.expired').value == 1
+
+
+def test_fetch_errors_are_retried():
+    fetch = mock.Mock(side_effect=[ValueError(), 'token'])
+    pool = TokenPool(fetch, 1, 300, 'test.token_pool.error', retry_delay=0)
+    pool.start()
+    try:
+        wait_for(lambda: pool.get() == 'token')
+        assert metrics.counter('test.token_pool.error.fetch_error').value == 1
+    finally:
+        pool.stop()
@@ -0,0 +1,66 @@
+from app.async_app import create_app
+from logic.attestation_service import CLAIM_TYPES
+from tests.helpers.async_providers import VERIFICATION_CODE
+from tests.helpers.eth_utils import sample_eth_address, str_eth
+
+
+async def test_request_phone_verify(aiohttp_client, async_providers):
+    client = await aiohttp_client(create_app())
+    response = await client.post('/api/attestations/phone/generate-code', json={
+        'country_calling_code': '1',
+        'phone': '12341234',
+        'method': 'sms'
+    })
+
+    assert response.status == 200
+    assert await response.json() == {}
+
+
+async def test_verify_phone(aiohttp_client, async_providers, app):
+    client = await aiohttp_client(create_app())
+    response = await client.post('/api/attestations/phone/verify', json={
+        'country_calling_code': '1',
+        'phone': '12341234',
+        'code': VERIFICATION_CODE,
+        'identity': str_eth(sample_eth_address)
+    })
+
+    assert response.status == 200
+    body = await response.json()
+    assert body['claim-type'] == CLAIM_TYPES['phone']
+    assert body['data'] == 'phone verified'
+
+
+async def test_verify_phone_invalid_code(aiohttp_client, async_providers):
+    client = await aiohttp_client(create_app())
+    response = await client.post('/api/attestations/phone/verify', json={
+        'country_calling_code': '1',
+        'phone': '12341234',
+        'code': '654321',
+        'identity': str_eth(sample_eth_address)
+    })
+
+    assert response.status == 400
+    assert await response.json() == {
+        'errors': {'code': ['Verification code is incorrect.']}
+    }
+
+
+async def test_missing_fields(aiohttp_client, async_providers):
+    client = await aiohttp_client(create_app())
+    response = await client.post('/api/attestations/phone/verify', json={})
+
+    assert response.status == 400
+    assert 'identity' in (await response.json())['errors']
+
+
+async def test_facebook_auth_url(aiohttp_client):
+    client = await aiohttp_client(create_app())
+    response = await client.get('/api/attestations/facebook/auth-url',
+                                headers={'Origin': 'https://dapp.originprotocol.com'})
+
+    assert response.status == 200
+    assert (await response.json())['url'].startswith(
+        'https://www.facebook.com/v2.12/dialog/oauth')
+    assert response.headers['Access-Control-Allow-Origin'] == \
+        'https://dapp.originprotocol.com'
@@ -1,13 +1,16 @@
 from views import web_views  # noqa
+import json
 import mock
 import responses
 
 from flask import session
 
+from config import settings
 from logic.attestation_service import twitter_access_token_url
 from logic.attestation_service import twitter_request_token_url
 from tests.helpers.rest_utils import post_json, json_of_response
 from tests.helpers.eth_utils import sample_eth_address, str_eth
+from util import attestations, metrics
 
 
 def test_index(client):
@@ -61,6 +64,66 @@ def test_verify_phone(client):
         assert response_json['data'] == 'phone verified'
 
 
+def test_list_attestations(client):
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            'https://api.authy.com/protected/json/phones/verification/check',
+            json={'success': True}
+        )
+        post_json(client, '/api/attestations/phone/verify', {
+            'country_calling_code': '1',
+            'phone': '12341234',
+            'code': '123456',
+            'identity': str_eth(sample_eth_address)
+        })
+
+    response = client.get('/api/attestations/', query_string={
+        'identity': str_eth(sample_eth_address).lower(),
+        'method': 'phone'
+    })
+    assert response.status_code == 200
+    response_json = json_of_response(response)
+    assert response_json['next-cursor'] is None
+    attestation, = response_json['attestations']
+    # Neither the phone number nor the IP address is exposed
+    assert set(attestation) == {'method', 'claim-type', 'signature',
+                                'created-at'}
+    assert attestation['method'] == 'phone'
+    assert len(attestation['signature']) == 132
+
+    response = client.get('/api/attestations/', query_string={
+        'identity': str_eth(sample_eth_address),
+        'method': 'fax'
+    })
+    assert response.status_code == 400
+
+
+def test_metrics(client):
+    endpoint = '/api/attestations/phone/verify'
+    responses_400 = metrics.counter('http.responses', endpoint=endpoint,
+                                    status=400)
+    count = responses_400.value
+    post_json(client, endpoint, {})
+    assert responses_400.value == count + 1
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    lines = response.data.decode('utf8').splitlines()
+    assert '# TYPE http_request_seconds histogram' in lines
+    assert 'http_responses_total{{endpoint="{}",status="400"}} {}'.format(
+        endpoint, count + 1) in lines
+
+
+def test_metrics_requires_token(client):
+    with mock.patch.object(settings, 'METRICS_TOKEN', 'scrape-token'):
+        assert client.get('/metrics').status_code == 401
+        response = client.get(
+            '/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        assert response.status_code == 200
+
+
 @mock.patch('logic.attestation_service._send_email_using_sendgrid')
 def test_email_verify(mock_send_email_using_sendgrid, client):
     mock_send_email_using_sendgrid.return_value = True
@@ -165,3 +228,103 @@ def test_twitter_verify(client):
         assert response.status_code == 200
         assert len(response_json['signature']) == 132
         assert response_json['data'] == 'twitter verified'
+
+
+def test_sign_claims(client):
+    responses_200 = metrics.counter('http.responses',
+                                    endpoint='/api/signatures/sign', status=200)
+    count = responses_200.value
+    identity = str_eth(sample_eth_address)
+    claims = [
+        json.dumps({'identity': identity, 'claim-type': 10, 'data': 'phone verified'}),
+        json.dumps({'identity': identity.lower(), 'claim-type': 10, 'data': 'phone verified'}),
+        json.dumps({'identity': identity}),
+        'not json'
+    ]
+    response = client.post(
+        '/api/signatures/sign',
+        data='\n'.join(claims),
+        content_type='application/x-ndjson',
+        headers={'X-Internal-API-Token': 'internal-api-token'}
+    )
+
+    assert response.status_code == 200
+    results = {
+        result['line']: result
+        for result in map(json.loads, response.data.decode('utf8').splitlines())
+    }
+    assert sorted(results) == [1, 2, 3, 4]
+    assert results[1]['signature'] == attestations.generate_signature(
+        settings.ATTESTATION_SIGNING_KEY, identity, 10, 'phone verified')
+    assert results[1]['claim-type'] == 10
+    assert 'signature' not in results[2]
+    assert 'errors' in results[3]
+    assert results[4]['errors'] == ['Invalid JSON.']
+    assert responses_200.value == count + 1
+
+
+def test_sign_claims_uses_the_shared_pool(client):
+    pool = mock.Mock()
+    pool.sign_many.side_effect = lambda claims: (
+        ('0x01', None) for claim in claims)
+    claim = json.dumps({'identity': str_eth(sample_eth_address),
+                        'claim-type': 10, 'data': 'phone verified'})
+
+    with mock.patch('util.signing_pool.get_pool', return_value=pool):
+        response = client.post(
+            '/api/signatures/sign',
+            data=claim,
+            content_type='application/x-ndjson',
+            headers={'X-Internal-API-Token': 'internal-api-token'}
+        )
+        results = response.data.decode('utf8').splitlines()
+
+    assert [json.loads(result)['signature'] for result in results] == ['0x01']
+
+
+def test_sign_claims_requires_internal_token(client):
+    response = client.post(
+        '/api/signatures/sign',
+        data=json.dumps({'identity': str_eth(sample_eth_address),
+                         'claim-type': 10, 'data': 'phone verified'}),
+        content_type='application/x-ndjson',
+        headers={'X-Internal-API-Token': 'wrong-token'}
+    )
+    assert response.status_code == 400
+
+
+def test_verify_signatures(client):
+    identity = str_eth(sample_eth_address)
+    signature = attestations.generate_signature(
+        settings.ATTESTATION_SIGNING_KEY, identity, 10, 'phone verified')
+    items = [
+        {'identity': identity, 'claim-type': 10, 'data': 'phone verified',
+         'signature': signature},
+        {'identity': identity, 'claim-type': 11, 'data': 'phone verified',
+         'signature': signature},
+        {'identity': identity, 'claim-type': 10, 'data': 'phone verified',
+         'signature': '0x1234'},
+    ]
+
+    response = post_json(client, '/api/signatures/verify', {'attestations': items})
+
+    assert response.status_code == 200
+    response_json = json_of_response(response)
+    issuer = attestations.get_signer(settings.ATTESTATION_SIGNING_KEY).address
+    assert response_json['issuer'] == issuer
+    results = response_json['results']
+    assert results[0] == {'valid': True, 'signer': issuer}
+    assert results[1]['valid'] is False
+    assert results[1]['signer'] != issuer
+    assert results[2]['valid'] is False
+    assert results[2]['errors'] == ['Signature must be 65 bytes.']
+
+
+def test_verify_signatures_limits_batch_size(client):
+    item = {'identity': str_eth(sample_eth_address), 'claim-type': 10,
+            'data': 'phone verified', 'signature': '0x1234'}
+
+    response = post_json(client, '/api/signatures/verify',
+                         {'attestations': [item] * 101})
+
+    assert response.status_code == 400
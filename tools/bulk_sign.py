@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+from marshmallow import ValidationError
+
+from api.modules.signatures import SignClaimRequest
+from config import settings
+from logic.signing_service import SigningService
+from util.signing_pool import SigningPool
+
+
+def _claims(lines, errors):
+    """
+    Parses newline delimited JSON claims in the format accepted by
+    /api/signatures/sign, validated as that endpoint validates them. Lines
+    that can't be parsed or are invalid are written to errors.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            claim = SignClaimRequest().loads(line)
+        except ValidationError as validation_err:
+            error = {'line': number,
+                     'errors': validation_err.normalized_messages()}
+        except ValueError:
+            error = {'line': number, 'errors': ['Invalid JSON.']}
+        else:
+            claim['line'] = number
+            yield claim
+            continue
+        errors.write(json.dumps(error) + '\n')
+
+
+def _bulk_sign(infile, outfile, pool):
+    for result in SigningService.sign_claims(_claims(infile, outfile), pool):
+        body = {
+            'line': result['line'],
+            'identity': result['eth_address'],
+            'claim-type': result['claim_type'],
+            'data': result['data']
+        }
+        if 'signature' in result:
+            body['signature'] = result['signature']
+        else:
+            body['errors'] = result['errors']
+        outfile.write(json.dumps(body) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Signs newline delimited JSON claims "
+        "({\"identity\": ..., \"claim-type\": ..., \"data\": ...}) with the "
+        "attestation signing key and writes the signatures as newline "
+        "delimited JSON.")
+    parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
+                        default=sys.stdin, help="claims to sign, defaults to stdin")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of signing processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+    with SigningPool(settings.ATTESTATION_SIGNING_KEY,
+                     args.workers or settings.SIGNING_WORKERS) as pool:
+        _bulk_sign(args.infile, sys.stdout, pool)
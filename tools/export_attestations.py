@@ -0,0 +1,211 @@
+#! /usr/bin/env python3
+"""
+Exports attestations, for compliance dumps, as newline delimited JSON or
+CSV, optionally gzipped:
+
+    python -m tools.export_attestations --format csv --gzip \\
+        --since 2018-01-01 --until 2018-07-01 --output attestations.csv.gz
+
+CSV is streamed by PostgreSQL's COPY, and formatted by the server. Its
+addresses are therefore lowercase rather than checksummed. JSON rows are
+read through a server-side cursor BATCH_SIZE at a time. Either way memory
+use stays the same however many are exported. Rows are read from the
+replica when DATABASE_REPLICA_URL is set, in no particular order.
+"""
+import argparse
+import datetime
+import gzip
+import io
+import json
+import sys
+from contextlib import ExitStack, contextmanager
+
+from eth_utils import is_hex_address
+from sqlalchemy import literal_column, select
+
+from database import REPLICA, db
+from database.models import Attestation, AttestationTypes
+from tools import db_utils
+from util import patches
+assert patches
+
+# Rows fetched from the server-side cursor and written at a time
+BATCH_SIZE = 10000
+# zlib's default, gzip's 9 is several times slower for a few percent
+GZIP_LEVEL = 6
+
+COLUMNS = ('id', 'method', 'eth_address', 'value', 'signature',
+           'remote_ip_address', 'created_at')
+
+# COLUMNS as COPY writes them, formatted as the JSON export formats them
+CSV_COLUMNS = (
+    'id',
+    'CASE method {} END AS method'.format(' '.join(
+        "WHEN {} THEN '{}'".format(t.value, t.name.lower())
+        for t in AttestationTypes)),
+    "'0x' || encode(eth_address, 'hex') AS eth_address",
+    'value',
+    "'0x' || encode(signature, 'hex') AS signature",
+    'remote_ip_address',
+    """to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS created_at""",
+)
+
+
+def _query(methods, since, until, eth_addresses):
+    table = Attestation.__table__
+    query = select([table.c[name] for name in COLUMNS])
+    if methods:
+        query = query.where(table.c.method.in_(
+            [AttestationTypes[method.upper()] for method in methods]))
+    if since:
+        query = query.where(table.c.created_at >= since)
+    if until:
+        query = query.where(table.c.created_at < until)
+    if eth_addresses:
+        query = query.where(table.c.eth_address.in_(eth_addresses))
+    return query
+
+
+def _engine():
+    app = db.get_app()
+    if REPLICA in (app.config['SQLALCHEMY_BINDS'] or {}):
+        return db.get_engine(app, bind=REPLICA)
+    return db.engine
+
+
+def _batches(engine, query):
+    """
+    Yields lists of at most BATCH_SIZE records, tuples of the COLUMNS of an
+    attestation as JSON serializable values.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield [(
+                row.id,
+                row.method.name.lower() if row.method else None,
+                row.eth_address,
+                row.value,
+                row.signature,
+                row.remote_ip_address,
+                row.created_at.isoformat() if row.created_at else None
+            ) for row in rows]
+
+
+def export(batches, outfile):
+    """
+    Writes batches of records to outfile as JSON lines, returning how many
+    were written.
+    """
+    count = 0
+    for records in batches:
+        outfile.write(''.join(
+            json.dumps(dict(zip(COLUMNS, record))) + '\n'
+            for record in records))
+        count += len(records)
+    return count
+
+
+def export_csv(engine, query, outfile):
+    """
+    Streams the attestations query selects to outfile as CSV with COPY,
+    returning how many were written.
+    """
+    query = query.with_only_columns(
+        [literal_column(column) for column in CSV_COLUMNS]).select_from(
+            Attestation.__table__)
+    compiled = query.compile(dialect=engine.dialect)
+    # The column types turn filter values into what is stored, as they do
+    # when SQLAlchemy executes the query
+    params = {}
+    for name, value in compiled.params.items():
+        process = compiled.binds[name].type.bind_processor(engine.dialect)
+        params[name] = process(value) if process else value
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            'COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)'.format(
+                cursor.mogrify(str(compiled), params).decode('utf-8')),
+            outfile)
+        return cursor.rowcount
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _output(path, compress):
+    with ExitStack() as stack:
+        if path == '-':
+            binary = sys.stdout.buffer
+        else:
+            binary = stack.enter_context(open(path, 'wb'))
+        if compress:
+            binary = stack.enter_context(gzip.GzipFile(
+                fileobj=binary, mode='wb', compresslevel=GZIP_LEVEL))
+        outfile = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+        try:
+            yield outfile
+        finally:
+            outfile.flush()
+            # Leaves closing to the stack, and stdout open
+            outfile.detach()
+
+
+def _date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "{} is not a YYYY-MM-DD date".format(value))
+
+
+def _eth_address(value):
+    if not is_hex_address(value):
+        raise argparse.ArgumentTypeError(
+            "{} is not an Ethereum address".format(value))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exports attestations as newline delimited JSON or CSV, "
+        "streamed from the database.")
+    parser.add_argument('--format', choices=('ndjson', 'csv'),
+                        default='ndjson')
+    parser.add_argument('--gzip', action='store_true',
+                        help="gzip the output")
+    parser.add_argument('--output', default='-',
+                        help="file to write, defaults to stdout")
+    parser.add_argument('--method', action='append',
+                        choices=[t.name.lower() for t in AttestationTypes],
+                        help="only export attestations of this method, can "
+                        "be repeated")
+    parser.add_argument('--since', type=_date,
+                        help="only export attestations created on or after "
+                        "this UTC date")
+    parser.add_argument('--until', type=_date,
+                        help="only export attestations created before this "
+                        "UTC date")
+    parser.add_argument('--identity', action='append', type=_eth_address,
+                        help="only export attestations of this Ethereum "
+                        "address, can be repeated")
+    args = parser.parse_args()
+
+    query = _query(args.method, args.since, args.until, args.identity)
+    with _output(args.output, args.gzip) as outfile:
+        if args.format == 'csv':
+            count = export_csv(_engine(), query, outfile)
+        else:
+            count = export(_batches(_engine(), query), outfile)
+    print("Exported {} attestations".format(count), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    with db_utils.request_context():
+        main()
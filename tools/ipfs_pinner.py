@@ -31,7 +31,7 @@ def _ipfs_hashes_for_listings():
     return hashes
 
 
-def _scan_listings(dry_run):
+def scan_listings(dry_run):
     """
     Pins IPFS hashes with an associated listing and unpins hashes without one.
     """
@@ -79,4 +79,4 @@ if __name__ == '__main__':
     parser.add_argument('--dry-run', action='store_true',
                         help="output changes but do not execute them")
     args = parser.parse_args()
-    _scan_listings(args.dry_run)
+    scan_listings(args.dry_run)
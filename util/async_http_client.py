@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import aiohttp
+
+from config import settings
+from util.http_client import get_breaker, record_call
+
+_sessions = {}
+
+
+def get_session():
+    """
+    Returns the aiohttp session for the running event loop, creating it on
+    first use. Connections are kept alive and shared by every provider call
+    made on the loop.
+    """
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.ASYNC_HTTP_POOL_SIZE, loop=loop),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=settings.HTTP_CONNECT_TIMEOUT,
+                sock_read=settings.HTTP_READ_TIMEOUT),
+            # Sessions are shared by every user, so cookies are never kept
+            cookie_jar=aiohttp.DummyCookieJar(loop=loop),
+            loop=loop)
+    return session
+
+
+async def close():
+    """
+    Closes the session of the running event loop, if there is one.
+    """
+    session = _sessions.pop(asyncio.get_event_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class _BreakerRequest(object):
+    """
+    Checks the breaker only on entering, so a request that is never entered
+    can't hold a half-open breaker's trial call.
+    """
+
+    def __init__(self, breaker, method, url, kwargs):
+        self.breaker = breaker
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.request = None
+
+    async def __aenter__(self):
+        self.breaker.check()
+        self.request = get_session().request(self.method, self.url,
+                                             **self.kwargs)
+        start = time.monotonic()
+        try:
+            response = await self.request.__aenter__()
+        except asyncio.CancelledError:
+            # Says nothing about the host
+            self.breaker.release()
+            raise
+        except Exception:
+            record_call(self.breaker, None, time.monotonic() - start)
+            raise
+        record_call(self.breaker, response.status, time.monotonic() - start)
+        return response
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        return await self.request.__aexit__(exc_type, exc, traceback)
+
+
+def request(method, url, **kwargs):
+    """
+    Same as aiohttp.ClientSession.request on the shared session. Use as
+    `async with request(...) as response`.
+
+    Calls are refused while the host's circuit breaker, shared with
+    util.http_client, is open.
+
+    Raises:
+        CircuitOpenError: On entering, the host's circuit breaker is open
+    """
+    return _BreakerRequest(get_breaker(url), method, url, kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
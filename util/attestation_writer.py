@@ -0,0 +1,325 @@
+"""
+Write-behind for attestation rows.
+
+Rows submitted to an AttestationWriter are appended to a spool file and
+synced to disk before submit() returns. A background thread then inserts
+them in one transaction per flush, so a burst of verifications costs a few
+database commits rather than one each:
+
+    writer = AttestationWriter(insert_rows, settings.ATTESTATION_SPOOL_DIR)
+    writer.start()
+    writer.submit({'eth_address': ..., 'signature': ...})
+
+Submitters syncing at the same time share one fsync. A flush starts max_delay
+seconds after the first row it holds was submitted, or as soon as batch_size
+rows are waiting, and rotates the spool file, which is deleted once its rows
+are committed. Spool files left by a writer that crashed are inserted when a
+writer is next started on the directory, so rows are written at least once:
+a crash between a commit and the deletion of its file writes them twice.
+
+A writer holds an flock on each of its spool files until it deletes them,
+which is how other writers, in this process or another, tell a spool in use
+from one left behind. Spool files are named after a random id per writer,
+as process ids are reused, and in containers are mostly the same.
+
+Only errors of the transient types given to the writer, such as a lost
+database connection, are retried. A flush failing with any other error is
+split in halves to find the rows causing it, which are moved to a .dead file
+in the spool directory rather than blocking the rows behind them.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import count
+
+from util import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to insert rows the database refused
+RETRY_DELAYS = (0.1, 0.5, 1, 5)
+
+
+class WriterFull(Exception):
+    pass
+
+
+def _read_spool(spool):
+    rows = []
+    for line in spool:
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            # Torn by a crash during the write, so never acknowledged
+            logger.warning("Skipping a partial row in %s", spool.name)
+    return rows
+
+
+def _lock_orphan(path):
+    """
+    Returns path opened and locked if no running writer holds it, or None.
+    """
+    try:
+        spool = open(path)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Its writer may have inserted and deleted it since it was opened
+        if os.stat(path).st_ino == os.fstat(spool.fileno()).st_ino:
+            return spool
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    spool.close()
+    return None
+
+
+class AttestationWriter(object):
+    """
+    Inserts rows, dicts of JSON serializable values, by calling insert with
+    every row of a flush. insert must write them in one transaction and
+    raise if it fails. It is retried with the same rows if the error is one
+    of the transient exception types.
+
+    At most max_pending rows wait to be inserted. Beyond that submit()
+    blocks, and raises WriterFull if no room is made within its timeout.
+    Queue depth, flush timings and inserted rows are reported as metrics
+    under name.
+    """
+
+    def __init__(self, insert, spool_dir, name='attestation.writer',
+                 batch_size=500, max_delay=0.05, max_pending=10000,
+                 transient=(Exception,)):
+        self.insert = insert
+        self.transient = transient
+        self.spool_dir = spool_dir
+        self.name = name
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._prefix = uuid.uuid4().hex
+        self._segments = count()
+        self._spool = None
+        self._spool_path = None
+        self._pending = []
+        self._first_at = None
+        self._in_flight = 0
+        self._appended = 0
+        self._synced = 0
+        self._recovered = []
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the writing thread, which first inserts the rows of spool
+        files left in spool_dir by writers that are no longer running.
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._recovered = self._orphaned_spools()
+            self._in_flight = sum(len(rows) for _, _, rows in self._recovered)
+            self._spool_path, self._spool = self._open_spool()
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Inserts what is waiting and stops the writing thread. Rows that
+        can't be inserted stay in the spool.
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(self, row, timeout=None):
+        """
+        Queues row for insertion, returning once it is synced to the spool.
+
+        Raises:
+            WriterFull: No room was made in the queue within timeout seconds
+            RuntimeError: The writer is not running
+        """
+        line = json.dumps(row) + '\n'
+        with self._cond:
+            if self._thread is None:
+                raise RuntimeError('The attestation writer is not running.')
+            if not self._cond.wait_for(self._has_room, timeout):
+                metrics.counter(self.name + '.full').inc()
+                raise WriterFull('Too many attestations are waiting to be '
+                                 'written.')
+            self._spool.write(line)
+            self._spool.flush()
+            self._pending.append(row)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._appended += 1
+            position = self._appended
+            depth = len(self._pending) + self._in_flight
+            self._cond.notify_all()
+        self._sync(position)
+        metrics.counter(self.name + '.queued').inc()
+        metrics.gauge(self.name + '.depth').set(depth)
+
+    def _has_room(self):
+        return len(self._pending) + self._in_flight < self.max_pending
+
+    def _sync(self, position):
+        """
+        Waits until the row appended at position is on disk. Rows appended
+        while another thread syncs are synced together by the next thread.
+        """
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._cond:
+                appended = self._appended
+                spool = self._spool
+            os.fsync(spool.fileno())
+            self._synced = appended
+
+    def _open_spool(self):
+        """Returns the path and locked file of a new spool file."""
+        path = os.path.join(self.spool_dir, '{}-{}.spool'.format(
+            self._prefix, next(self._segments)))
+        # Locked before it is given a name other writers look for
+        spool = open(path + '.new', 'a')
+        fcntl.flock(spool, fcntl.LOCK_EX)
+        os.rename(path + '.new', path)
+        return path, spool
+
+    def _orphaned_spools(self):
+        recovered = []
+        for path in glob.glob(os.path.join(self.spool_dir, '*.spool.new')):
+            # Left by a crash before the rename, so never written to
+            spool = _lock_orphan(path)
+            if spool is not None:
+                os.unlink(path)
+                spool.close()
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.spool'))):
+            spool = _lock_orphan(path)
+            if spool is None:
+                continue
+            rows = _read_spool(spool)
+            logger.info("Recovering %d attestations from %s", len(rows), path)
+            recovered.append((path, spool, rows))
+        return recovered
+
+    def _next_flush(self):
+        """
+        Waits for a flush to be due, then returns the path and file of its
+        spool and its rows, and starts a new spool file for later rows.
+        """
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            while self._pending and not self._stopping and \
+                    len(self._pending) < self.batch_size:
+                remaining = self._first_at + self.max_delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._pending:
+                return None, None, []
+
+        # Rows of the old spool file must be on disk before it is closed
+        with self._sync_lock:
+            with self._cond:
+                path, spool = self._spool_path, self._spool
+                self._spool_path, self._spool = self._open_spool()
+                rows, self._pending = self._pending, []
+                self._first_at = None
+                self._in_flight += len(rows)
+                appended = self._appended
+            os.fsync(spool.fileno())
+            self._synced = appended
+        return path, spool, rows
+
+    def _run(self):
+        for path, spool, rows in self._recovered:
+            self._write(path, spool, rows)
+        self._recovered = []
+        while True:
+            path, spool, rows = self._next_flush()
+            if not rows:
+                break
+            self._write(path, spool, rows)
+        with self._cond:
+            if not self._pending and os.path.getsize(self._spool_path) == 0:
+                os.unlink(self._spool_path)
+            self._spool.close()
+
+    def _write(self, path, spool, rows):
+        """
+        Inserts the rows of the locked spool file at path, then deletes and
+        closes it.
+        """
+        # Rows not yet inserted, in batches that are split on errors that
+        # aren't transient
+        batches = deque([rows])
+        attempt = 0
+        while batches:
+            batch = batches[0]
+            try:
+                with metrics.observed(self.name + '.flush'):
+                    if batch:
+                        self.insert(batch)
+            except self.transient:
+                logger.exception("Could not insert %d attestations",
+                                 len(batch))
+                metrics.counter(self.name + '.retry').inc()
+                delay = RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)]
+                attempt += 1
+                with self._cond:
+                    if self._cond.wait_for(lambda: self._stopping, delay):
+                        # Left in the spool, unlocked, for the next writer
+                        spool.close()
+                        self._release(rows)
+                        return
+                continue
+            except Exception:
+                batches.popleft()
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    batches.extendleft([batch[middle:], batch[:middle]])
+                else:
+                    logger.exception("Could not insert an attestation")
+                    self._dead_letter(batch)
+                continue
+            batches.popleft()
+            metrics.counter(self.name + '.rows').inc(len(batch))
+        os.unlink(path)
+        spool.close()
+        with self._cond:
+            self._release(rows)
+
+    def _dead_letter(self, rows):
+        """Keeps rows that can't be inserted in the writer's .dead file."""
+        path = os.path.join(self.spool_dir, self._prefix + '.dead')
+        with open(path, 'a') as dead:
+            for row in rows:
+                dead.write(json.dumps(row) + '\n')
+            dead.flush()
+            os.fsync(dead.fileno())
+        metrics.counter(self.name + '.dead').inc(len(rows))
+
+    def _release(self, rows):
+        self._in_flight -= len(rows)
+        metrics.gauge(self.name + '.depth').set(
+            len(self._pending) + self._in_flight)
+        self._cond.notify_all()
@@ -1,22 +1,189 @@
-from web3 import Web3
-from web3.auto.http import w3
-from web3.exceptions import InvalidAddress
-from eth_account.messages import defunct_hash_message
+import functools
+import threading
+from collections import OrderedDict
+
+from eth_utils import decode_hex, is_checksum_address, keccak
+from config import settings
 from logic.service_utils import AccountNotFoundError
+from util import metrics
 
-# http://web3py.readthedocs.io/en/stable/web3.eth.account.html?highlight=private#not-acceptable-for-production
-w3.eth.enable_unaudited_features()
+# Prefix eth_account's defunct_hash_message applies to a 32 byte message.
+SIGNED_MESSAGE_PREFIX = b'\x19Ethereum Signed Message:\n32'
 
+# Maximum number of distinct (claim_type, data) payloads kept hashed, least
+# recently used first out. Constant claims ('phone verified', ...) stay
+# cached however much per user claim data passes through.
+CLAIM_CACHE_SIZE = 1024
 
-def generate_signature(private_key, subject, claim_type, data):
-    try:
-        hashed_data = Web3.sha3(text=data)
-        hash_to_sign = Web3.soliditySha3(['address', 'uint256', 'bytes32'], [
-            subject, claim_type, hashed_data])
-
-        result = w3.eth.account.signHash(
-            message_hash=defunct_hash_message(hexstr=hash_to_sign.hex()),
-            private_key=private_key)
-    except InvalidAddress:
+
+@functools.lru_cache(maxsize=CLAIM_CACHE_SIZE)
+def _claim_bytes(claim_type, data):
+    return claim_type.to_bytes(32, 'big') + keccak(text=data)
+
+
+def hash_claim(subject, claim_type, data):
+    """
+    Equivalent of Web3.soliditySha3(['address', 'uint256', 'bytes32'],
+    [subject, claim_type, Web3.sha3(text=data)]).
+
+    Raises:
+        AccountNotFoundError: subject is not a checksummed address
+    """
+    if not is_checksum_address(subject):
         raise AccountNotFoundError("The specified account was not found.")
-    return result['signature'].hex()
+    return keccak(decode_hex(subject) + _claim_bytes(claim_type, data))
+
+
+def hash_message(subject, claim_type, data):
+    """
+    The hash that is actually signed, equivalent of
+    defunct_hash_message(hexstr=hash_claim(...).hex()).
+    """
+    return keccak(SIGNED_MESSAGE_PREFIX + hash_claim(subject, claim_type, data))
+
+
+class Signer(object):
+    """
+    Signs attestation claims with a single private key.
+
+    The key is parsed once and the hashed payload of each claim type is kept,
+    so a signature only costs hashing the subject and the ECDSA operation.
+    Signatures are identical to signing the soliditySha3 claim hash with
+    w3.eth.account.signHash.
+    """
+
+    def __init__(self, private_key):
+        # Imported on first use so importing this module stays cheap for
+        # workers, tests and tools that never sign.
+        from eth_keys import keys
+
+        if isinstance(private_key, str):
+            private_key = decode_hex(private_key)
+        self._key = keys.PrivateKey(bytes(private_key))
+        self.address = self._key.public_key.to_checksum_address()
+
+    def sign_bytes(self, subject, claim_type, data):
+        message_hash = hash_message(subject, claim_type, data)
+        v, r, s = self._key.sign_msg_hash(message_hash).vrs
+        return r.to_bytes(32, 'big') + s.to_bytes(32, 'big') + bytes([v + 27])
+
+    def sign(self, subject, claim_type, data):
+        return '0x' + self.sign_bytes(subject, claim_type, data).hex()
+
+
+def recover_signer(subject, claim_type, data, signature):
+    """
+    Returns the checksummed address of the key that produced signature for
+    the claim, the ecrecover counterpart of Signer.sign.
+
+    Raises:
+        AccountNotFoundError: subject is not a checksummed address
+        ValueError: signature is not a valid 65 byte hex signature
+    """
+    from eth_keys import keys
+    from eth_keys.exceptions import BadSignature, ValidationError
+
+    signature = decode_hex(signature)
+    if len(signature) != 65:
+        raise ValueError("Signature must be 65 bytes.")
+    v = signature[64] - 27 if signature[64] >= 27 else signature[64]
+    try:
+        public_key = keys.Signature(signature[:64] + bytes([v])) \
+            .recover_public_key_from_msg_hash(
+                hash_message(subject, claim_type, data))
+    except (BadSignature, ValidationError) as exc:
+        raise ValueError("Invalid signature.") from exc
+    return public_key.to_checksum_address()
+
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def get_signer(private_key):
+    """
+    Returns the process wide Signer for private_key, building it on first use.
+    """
+    signer = _signers.get(private_key)
+    if signer is None:
+        with _signers_lock:
+            signer = _signers.get(private_key)
+            if signer is None:
+                signer = _signers[private_key] = Signer(private_key)
+    return signer
+
+
+class SignatureCache(object):
+    """
+    Thread safe, bounded LRU of signatures.
+
+    Signing is deterministic (RFC6979), so a claim signed once can be served
+    from here when the same identity verifies it again. Entries are keyed by
+    the signer address as well as the claim, so a rotated key never serves a
+    signature made by the previous one.
+
+    Hits, misses and evictions are also published as <name>.hit, .miss and
+    .eviction counters, and the number of entries as the <name>.size gauge.
+    """
+
+    def __init__(self, size, name='signature.cache'):
+        self.size = size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            signature = self._entries.get(key)
+            if signature is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        metrics.counter(
+            self.name + ('.miss' if signature is None else '.hit')).inc()
+        return signature
+
+    def put(self, key, signature):
+        if not self.size:
+            return
+        evicted = 0
+        with self._lock:
+            self._entries[key] = signature
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+            size = len(self._entries)
+        if evicted:
+            metrics.counter(self.name + '.eviction').inc(evicted)
+        metrics.gauge(self.name + '.size').set(size)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+signature_cache = SignatureCache(settings.SIGNATURE_CACHE_SIZE)
+
+
+def signature_cache_key(private_key, subject, claim_type, data):
+    return get_signer(private_key).address, subject, claim_type, data
+
+
+def generate_signature(private_key, subject, claim_type, data):
+    key = signature_cache_key(private_key, subject, claim_type, data)
+    signature = signature_cache.get(key)
+    if signature is None:
+        signature = get_signer(private_key).sign(subject, claim_type, data)
+        signature_cache.put(key, signature)
+    return signature
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from util import metrics
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name):
+        Exception.__init__(self, 'Circuit {} is open.'.format(name))
+        self.name = name
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a dependency that keeps failing or has become slow, so
+    callers fail fast instead of each waiting for a timeout.
+
+    The outcome of the last window calls is kept. A call fails when it
+    raises, when the caller records it as failed, or when it takes longer
+    than slow_call seconds. Once at least min_calls have been recorded and
+    the share that failed reaches failure_rate, the circuit opens and
+    check() raises CircuitOpenError for open_seconds. Then a single trial
+    call is let through: the circuit closes if it succeeds and opens again
+    if it fails.
+
+    State changes and rejected calls are reported as metrics under
+    circuit.<name>.
+
+    Usage example:
+      breaker = CircuitBreaker('api.authy.com')
+      with breaker.call():
+          response = send(...)
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, window=20, min_calls=10,
+                 slow_call=None, open_seconds=30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = CircuitBreaker.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        Raises CircuitOpenError unless a call may be made now. A caller let
+        through must record the call's outcome.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            if self.state == CircuitBreaker.OPEN and \
+                    time.monotonic() - self._opened_at >= self.open_seconds:
+                self._set_state(CircuitBreaker.HALF_OPEN)
+            if self.state == CircuitBreaker.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+        metrics.counter('circuit.{}.rejected'.format(self.name)).inc()
+        raise CircuitOpenError(self.name)
+
+    def record(self, success, duration=0):
+        """
+        Records the outcome of a call that took duration seconds.
+        """
+        failed = not success or (
+            self.slow_call is not None and duration > self.slow_call)
+        with self._lock:
+            if self.state == CircuitBreaker.HALF_OPEN:
+                self._trial = False
+                self._outcomes.clear()
+                self._set_state(CircuitBreaker.OPEN if failed
+                                else CircuitBreaker.CLOSED)
+                return
+            self._outcomes.append(failed)
+            if self.state == CircuitBreaker.CLOSED and \
+                    len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= self.failure_rate * len(self._outcomes):
+                self._outcomes.clear()
+                self._set_state(CircuitBreaker.OPEN)
+
+    def release(self):
+        """
+        Ends a call let through by check() without recording it, for a call
+        whose outcome says nothing about the dependency. A half-open circuit
+        lets the next trial call through.
+        """
+        with self._lock:
+            self._trial = False
+
+    @contextmanager
+    def call(self):
+        """
+        Checks the circuit before the block, and records the block as failed
+        if it raises, successful otherwise.
+        """
+        self.check()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(True, time.monotonic() - start)
+
+    def reset(self):
+        with self._lock:
+            self._outcomes.clear()
+            self._trial = False
+            self._set_state(CircuitBreaker.CLOSED)
+
+    def _set_state(self, state):
+        if state == CircuitBreaker.OPEN:
+            self._opened_at = time.monotonic()
+            if self.state != CircuitBreaker.OPEN:
+                metrics.counter('circuit.{}.opened'.format(self.name)).inc()
+        self.state = state
+        metrics.gauge('circuit.{}.open'.format(self.name)).set(
+            int(state != CircuitBreaker.CLOSED))
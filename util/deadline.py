@@ -0,0 +1,80 @@
+"""
+Time budget for the request being handled by the current thread.
+
+The Flask app starts a budget of REQUEST_DEADLINE seconds for each request,
+and util.http_client caps the timeouts of every provider call made while
+handling it at what is left, so a request can't outlive its budget however
+many slow calls it makes:
+
+    with deadline.budget(5):
+        deadline.remaining()  # 5.0 and falling
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining():
+    """
+    Returns the seconds left in the current budget, or None when there is
+    none.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def budget(seconds):
+    """
+    Limits the block to seconds, or to what is left of an enclosing budget
+    if that is less.
+    """
+    previous = getattr(_local, 'deadline', None)
+    deadline = time.monotonic() + seconds
+    _local.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def cap_timeout(timeout):
+    """
+    Returns timeout, a requests style timeout in seconds or a (connect, read)
+    pair, capped at the time left in the current budget.
+
+    Raises:
+        DeadlineExceeded: The budget has run out
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline exceeded.')
+    if isinstance(timeout, tuple):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    return left if timeout is None else min(timeout, left)
+
+
+def init_app(app):
+    """
+    Gives each request handled by app a budget of REQUEST_DEADLINE seconds.
+    """
+    if not settings.REQUEST_DEADLINE:
+        return
+
+    @app.before_request
+    def start_budget():
+        _local.deadline = time.monotonic() + settings.REQUEST_DEADLINE
+
+    @app.teardown_request
+    def end_budget(exc):
+        _local.deadline = None
@@ -0,0 +1,256 @@
+"""
+Batched delivery of templated emails through the SendGrid v3 mail send API.
+
+Emails submitted to an EmailQueue are sent by a background thread. Emails
+queued within max_delay seconds of each other go out in one API call, as
+one personalization each, with their own recipient and substitutions:
+
+    queue = EmailQueue(get_transport(), message, 'email.verification')
+    queue.start()
+    delivery = queue.submit('hello@foo.bar', {'-code-': '123456'})
+    queue.status(delivery.id)  # 'queued', then 'sent' or 'failed'
+
+Transports send a mail send request body: SendGridTransport over a pooled
+keep-alive connection, LocalTransport in memory for development, tests and
+benchmarks.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from config import settings
+from util import http_client, metrics
+
+logger = logging.getLogger(__name__)
+
+# Most personalizations SendGrid accepts in one mail send request
+MAX_BATCH_SIZE = 1000
+
+
+class TransportError(Exception):
+    def __init__(self, status_code, message):
+        Exception.__init__(self, message)
+        self.status_code = status_code
+
+
+class SendGridTransport(object):
+    url = 'https://api.sendgrid.com/v3/mail/send'
+
+    def __init__(self, api_key):
+        self.headers = {'Authorization': 'Bearer {}'.format(api_key)}
+
+    def send(self, request_body):
+        response = http_client.post(self.url, json=request_body,
+                                    headers=self.headers)
+        if response.status_code >= 400:
+            raise TransportError(response.status_code, response.text)
+
+
+class LocalTransport(object):
+    """
+    Stand-in for SendGrid that keeps the request bodies it is sent. Each send
+    takes latency seconds, and a request with a recipient for which reject
+    returns True fails with a 400, as SendGrid fails the whole request.
+    """
+
+    def __init__(self, latency=0, reject=None):
+        self.latency = latency
+        self.reject = reject
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def send(self, request_body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.reject is not None:
+            for recipient in recipients(request_body):
+                if self.reject(recipient):
+                    raise TransportError(400, 'Invalid email: ' + recipient)
+        with self._lock:
+            self.requests.append(request_body)
+
+    @property
+    def sent(self):
+        with self._lock:
+            return [recipient for body in self.requests
+                    for recipient in recipients(body)]
+
+
+def recipients(request_body):
+    return [to['email']
+            for personalization in request_body['personalizations']
+            for to in personalization['to']]
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Returns the transport configured by EMAIL_TRANSPORT, shared by the
+    process so its connection is reused.
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                if settings.EMAIL_TRANSPORT == 'local':
+                    _transport = LocalTransport()
+                else:
+                    _transport = SendGridTransport(settings.SENDGRID_API_KEY)
+    return _transport
+
+
+class Delivery(object):
+    QUEUED = 'queued'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    def __init__(self, to_email, substitutions):
+        self.id = uuid.uuid4().hex
+        self.to_email = to_email
+        self.substitutions = substitutions
+        self.status = Delivery.QUEUED
+        self.queued_at = time.monotonic()
+        self._done = threading.Event()
+
+    def personalization(self):
+        return {
+            'to': [{'email': self.to_email}],
+            'substitutions': self.substitutions
+        }
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the email is sent or has failed. Returns False if
+        timeout seconds pass first.
+        """
+        return self._done.wait(timeout)
+
+    def _finish(self, status):
+        self.status = status
+        self._done.set()
+
+
+class EmailQueue(object):
+    """
+    Sends emails built from message, a mail send request body without
+    personalizations, in batches of up to batch_size.
+
+    A batch is sent once its first email has waited max_delay seconds or it
+    is full. When SendGrid rejects a batch as invalid, its halves are retried
+    separately so one bad address doesn't fail the emails sent with it. The
+    status of the last history deliveries is kept for status(), and queue
+    depth, batch timings and sent and failed counts are reported as metrics
+    under name.
+    """
+
+    def __init__(self, transport, message, name, batch_size=100,
+                 max_delay=0.5, history=10000):
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError("batch_size must be between 1 and {}.".format(
+                MAX_BATCH_SIZE))
+        self.transport = transport
+        self.message = message
+        self.name = name
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.history = history
+        self._pending = deque()
+        self._deliveries = OrderedDict()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Sends what is queued and stops the sending thread.
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(self, to_email, substitutions):
+        delivery = Delivery(to_email, substitutions)
+        with self._cond:
+            self._pending.append(delivery)
+            self._deliveries[delivery.id] = delivery
+            while len(self._deliveries) > self.history:
+                self._deliveries.popitem(last=False)
+            depth = len(self._pending)
+            self._cond.notify()
+        metrics.counter(self.name + '.queued').inc()
+        metrics.gauge(self.name + '.depth').set(depth)
+        return delivery
+
+    def status(self, delivery_id):
+        """
+        Returns the status of a delivery, or None when it is unknown to this
+        queue.
+        """
+        with self._cond:
+            delivery = self._deliveries.get(delivery_id)
+        return delivery.status if delivery is not None else None
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if self._pending and not self._stopping:
+                deadline = self._pending[0].queued_at + self.max_delay
+                while len(self._pending) < self.batch_size and \
+                        not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            size = min(self.batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(size)]
+            metrics.gauge(self.name + '.depth').set(len(self._pending))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _send(self, batch):
+        request_body = dict(self.message, personalizations=[
+            delivery.personalization() for delivery in batch])
+        try:
+            with metrics.timed(self.name + '.send'):
+                self.transport.send(request_body)
+        except TransportError as exc:
+            if exc.status_code == 400 and len(batch) > 1:
+                middle = len(batch) // 2
+                self._send(batch[:middle])
+                self._send(batch[middle:])
+                return
+            logger.error("Could not send %d emails: %s", len(batch), exc)
+            self._finish(batch, Delivery.FAILED)
+        except Exception:
+            logger.exception("Could not send %d emails", len(batch))
+            self._finish(batch, Delivery.FAILED)
+        else:
+            self._finish(batch, Delivery.SENT)
+
+    def _finish(self, batch, status):
+        for delivery in batch:
+            delivery._finish(status)
+        metrics.counter(self.name + '.' + status).inc(len(batch))
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from http import cookiejar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+from util import deadline, metrics
+from util.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class _BlockAllCookies(cookiejar.CookiePolicy):
+    """
+    Sessions are shared by every request to a host, so cookies set for one
+    user must never be sent on behalf of another.
+    """
+    netscape = True
+    rfc2965 = hide_cookie2 = False
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+    def domain_return_ok(self, domain, request):
+        return False
+
+    def path_return_ok(self, path, request):
+        return False
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session for a single host that keeps up to pool_size connections
+    alive and applies default connect/read timeouts to every request.
+    """
+
+    def __init__(self, pool_size, timeout):
+        super(PooledSession, self).__init__()
+        self.timeout = timeout
+        self.cookies.set_policy(_BlockAllCookies())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(PooledSession, self).request(method, url, **kwargs)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """
+    Returns the shared session for the scheme and host of url, creating it
+    on first use.
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = PooledSession(
+                    settings.HTTP_POOL_SIZE,
+                    (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    return session
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    """
+    Returns the circuit breaker for the host of url, creating it on first
+    use.
+    """
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(
+                    host,
+                    failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                    window=settings.CIRCUIT_BREAKER_WINDOW,
+                    min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                    slow_call=settings.CIRCUIT_BREAKER_SLOW_CALL,
+                    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS)
+    return breaker
+
+
+def reset_breakers():
+    """
+    Forgets every host's circuit breaker, so they start closed with the
+    current settings.
+    """
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_server_error(status_code):
+    return status_code >= 500 or status_code == 429
+
+
+def record_call(breaker, status, seconds):
+    """
+    Records the outcome of a call to the breaker's host, status being the
+    response status code or None if no response came back.
+    """
+    breaker.record(status is not None and not is_server_error(status), seconds)
+    metrics.histogram('provider.request', host=breaker.name).observe(seconds)
+    metrics.counter('provider.responses', host=breaker.name,
+                    status='error' if status is None else status).inc()
+
+
+def request(method, url, **kwargs):
+    """
+    Same as requests.request, on the shared session for the host of url.
+
+    The timeout is capped at what is left of the current request's budget,
+    and calls are refused while the host's circuit breaker is open. A call
+    that times out because the budget ran out, rather than the host, is not
+    held against the host's breaker.
+
+    Raises:
+        CircuitOpenError: The host's circuit breaker is open
+        DeadlineExceeded: The request's budget has run out
+    """
+    session = get_session(url)
+    timeout = kwargs.get('timeout', session.timeout)
+    kwargs['timeout'] = deadline.cap_timeout(timeout)
+    capped = kwargs['timeout'] != timeout
+    breaker = get_breaker(url)
+    breaker.check()
+    start = time.monotonic()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.Timeout:
+        if capped:
+            breaker.release()
+        else:
+            record_call(breaker, None, time.monotonic() - start)
+        raise
+    except Exception:
+        record_call(breaker, None, time.monotonic() - start)
+        raise
+    record_call(breaker, response.status_code, time.monotonic() - start)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def warm_up(urls):
+    """
+    Opens a keep-alive connection to the host of each url in a background
+    thread, so the first verification doesn't pay for the TCP and TLS
+    handshakes.
+    """
+    def connect():
+        for url in urls:
+            try:
+                request('HEAD', url).close()
+            except requests.exceptions.RequestException as exc:
+                logger.warning("Could not warm up connection to %s: %s", url, exc)
+
+    thread = threading.Thread(target=connect, name='http-warm-up', daemon=True)
+    thread.start()
+    return thread
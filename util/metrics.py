@@ -0,0 +1,345 @@
+"""
+In-process counters, gauges, timers and histograms.
+
+Metrics are created on first use and live for the life of the process. A
+metric is identified by its name and optional labels:
+
+    with metrics.timed('facebook.access_token'):
+        ...
+    metrics.counter('twitter.request_token_pool.hit').inc()
+    with metrics.observed('provider.request', host='api.authy.com'):
+        ...
+
+snapshot() returns the current value of every metric, e.g. for logging, and
+exposition() renders them in the Prometheus text format for /metrics.
+"""
+import bisect
+import hmac
+import logging
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EXPOSITION_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _add(cell, other):
+    return [a + b for a, b in zip(cell, other)]
+
+
+class _ThreadExit(object):
+    """Kept in a thread's locals only, so it dies when the thread exits."""
+
+
+class _ThreadCells(object):
+    """
+    One cell, a list of values, per recording thread. A thread only ever
+    writes its own cell, so recording takes no lock and request threads
+    don't contend; readers combine the cells.
+
+    The cell of a thread that has exited is folded into a retired cell with
+    merge(retired, cell), so cells don't pile up as threads come and go.
+    """
+
+    def __init__(self, initial, merge=_add):
+        self.initial = initial
+        self.merge = merge
+        self._local = threading.local()
+        # id of each live cell -> cell
+        self._cells = {}
+        self._retired = list(initial)
+        # Ids of the cells of exited threads, still to be folded in. The
+        # finalizer that adds them can run while this thread holds _lock,
+        # so it doesn't take it.
+        self._exited = []
+        self._lock = threading.Lock()
+
+    def mine(self):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = self._local.cell = list(self.initial)
+            self._local.exit = _ThreadExit()
+            weakref.finalize(self._local.exit, self._exited.append, id(cell))
+            with self._lock:
+                self._retire()
+                self._cells[id(cell)] = cell
+        return cell
+
+    def _retire(self):
+        while self._exited:
+            self._retired = self.merge(self._retired,
+                                       self._cells.pop(self._exited.pop()))
+
+    def all(self):
+        with self._lock:
+            self._retire()
+            return [list(self._retired)] + \
+                [list(cell) for cell in self._cells.values()]
+
+    def sums(self):
+        return [sum(values) for values in zip(self.initial, *self.all())]
+
+
+class Counter(object):
+    def __init__(self):
+        self._cells = _ThreadCells([0])
+
+    def inc(self, amount=1):
+        self._cells.mine()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.sums()[0]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(object):
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+def _merge_timer(cell, other):
+    mins = [ms for ms in (cell[2], other[2]) if ms is not None]
+    maxes = [ms for ms in (cell[3], other[3]) if ms is not None]
+    return [cell[0] + other[0], cell[1] + other[1],
+            min(mins) if mins else None, max(maxes) if maxes else None]
+
+
+class Timer(object):
+    """
+    Count, total, min and max of recorded durations, in milliseconds.
+    """
+
+    def __init__(self):
+        self._cells = _ThreadCells([0, 0.0, None, None], _merge_timer)
+
+    def record(self, ms):
+        cell = self._cells.mine()
+        cell[0] += 1
+        cell[1] += ms
+        cell[2] = ms if cell[2] is None else min(cell[2], ms)
+        cell[3] = ms if cell[3] is None else max(cell[3], ms)
+
+    @property
+    def count(self):
+        return self.totals()[0]
+
+    def totals(self):
+        """
+        Returns the count, total, min and max of recorded durations.
+        """
+        cells = self._cells.all()
+        mins = [cell[2] for cell in cells if cell[2] is not None]
+        maxes = [cell[3] for cell in cells if cell[3] is not None]
+        return (sum(cell[0] for cell in cells),
+                sum(cell[1] for cell in cells),
+                min(mins) if mins else None,
+                max(maxes) if maxes else None)
+
+    def snapshot(self):
+        count, total, min_ms, max_ms = self.totals()
+        return {
+            'count': count,
+            'mean_ms': total / count if count else None,
+            'min_ms': min_ms,
+            'max_ms': max_ms
+        }
+
+
+class Histogram(object):
+    """
+    Count of recorded durations, in seconds, in each of BUCKETS, and their
+    sum.
+    """
+
+    def __init__(self):
+        # A count per bucket, one for durations over the last bound, and the
+        # sum
+        self._cells = _ThreadCells([0] * (len(BUCKETS) + 2))
+
+    def observe(self, seconds):
+        cell = self._cells.mine()
+        cell[bisect.bisect_left(BUCKETS, seconds)] += 1
+        cell[-1] += seconds
+
+    def totals(self):
+        """
+        Returns the cumulative count of durations up to each of BUCKETS and
+        then of all durations, and their sum.
+        """
+        total = self._cells.sums()
+        cumulative = []
+        for count in total[:-1]:
+            cumulative.append(count + (cumulative[-1] if cumulative else 0))
+        return cumulative, total[-1]
+
+    def snapshot(self):
+        cumulative, seconds = self.totals()
+        return {
+            'count': cumulative[-1],
+            'sum_s': seconds,
+            'buckets': dict(zip(BUCKETS, cumulative))
+        }
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _get(name, labels, cls):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    metric = _metrics.get(key)
+    if metric is None:
+        with _metrics_lock:
+            metric = _metrics.get(key)
+            if metric is None:
+                metric = _metrics[key] = cls()
+    if not isinstance(metric, cls):
+        raise TypeError("Metric {} is a {}, not a {}".format(
+            _display_name(*key), type(metric).__name__, cls.__name__))
+    return metric
+
+
+def counter(name, **labels):
+    return _get(name, labels, Counter)
+
+
+def gauge(name, **labels):
+    return _get(name, labels, Gauge)
+
+
+def timer(name, **labels):
+    return _get(name, labels, Timer)
+
+
+def histogram(name, **labels):
+    return _get(name, labels, Histogram)
+
+
+@contextmanager
+def timed(name):
+    """
+    Records the wall time of the block in the timer called name, whether or
+    not it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        timer(name).record(ms)
+        logger.debug("%s took %.1f ms", name, ms)
+
+
+@contextmanager
+def observed(name, **labels):
+    """
+    Records the wall time of the block in the histogram called name, whether
+    or not it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name, **labels).observe(time.perf_counter() - start)
+
+
+def _sorted_metrics():
+    with _metrics_lock:
+        metrics = list(_metrics.items())
+    return sorted(metrics, key=lambda item: item[0])
+
+
+def _display_name(name, labels):
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(
+        name, ','.join('{}={}'.format(k, v) for k, v in labels))
+
+
+def snapshot():
+    return {_display_name(*key): metric.snapshot()
+            for key, metric in _sorted_metrics()}
+
+
+def _exposition_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(_exposition_name(k),
+                                                _label_value(v))
+                               for k, v in labels) + '}'
+    return '{} {}'.format(name, value)
+
+
+def exposition():
+    """
+    Renders every metric in the Prometheus text exposition format. Dots in
+    names become underscores. Counters get a _total suffix, and timers and
+    histograms a _seconds one; timers are reported as summaries without
+    quantiles.
+    """
+    lines = []
+    family = None
+    for (name, labels), metric in _sorted_metrics():
+        if isinstance(metric, Counter):
+            kind, name = 'counter', _exposition_name(name) + '_total'
+        elif isinstance(metric, Gauge):
+            kind, name = 'gauge', _exposition_name(name)
+        elif isinstance(metric, Timer):
+            kind, name = 'summary', _exposition_name(name) + '_seconds'
+        else:
+            kind, name = 'histogram', _exposition_name(name) + '_seconds'
+        if name != family:
+            lines.append('# TYPE {} {}'.format(name, kind))
+            family = name
+
+        if kind in ('counter', 'gauge'):
+            lines.append(_sample(name, labels, metric.value))
+        elif kind == 'summary':
+            count, total = metric.totals()[:2]
+            lines.append(_sample(name + '_count', labels, count))
+            lines.append(_sample(name + '_sum', labels, total / 1000))
+        else:
+            cumulative, seconds = metric.totals()
+            bounds = [repr(float(b)) for b in BUCKETS] + ['+Inf']
+            for bound, count in zip(bounds, cumulative):
+                lines.append(_sample(name + '_bucket',
+                                     labels + (('le', bound),), count))
+            lines.append(_sample(name + '_count', labels, cumulative[-1]))
+            lines.append(_sample(name + '_sum', labels, seconds))
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(authorization):
+    """
+    Whether a scrape with the given Authorization header may read the
+    metrics: always, unless METRICS_TOKEN is set.
+    """
+    if not settings.METRICS_TOKEN:
+        return True
+    return hmac.compare_digest(authorization or '',
+                               'Bearer ' + settings.METRICS_TOKEN)
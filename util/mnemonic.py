@@ -0,0 +1,75 @@
+import os
+import threading
+
+from config import settings
+
+# One word per possible byte value
+WORDLIST_LENGTH = 256
+
+
+class Wordlist(object):
+    """
+    Immutable mapping between bytes and mnemonic words, one word per byte
+    value, with a reverse map for decoding.
+    """
+
+    def __init__(self, words):
+        words = tuple(words)
+        if len(words) != WORDLIST_LENGTH:
+            raise ValueError("Wordlist must have {} words, not {}.".format(
+                WORDLIST_LENGTH, len(words)))
+        indexes = {word: index for index, word in enumerate(words)}
+        if len(indexes) != len(words):
+            raise ValueError("Wordlist words must be unique.")
+        if not all(word.isalpha() and word.islower() for word in words):
+            raise ValueError("Wordlist words must be lower case letters.")
+        self.words = words
+        self._indexes = indexes
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(f.read().split())
+
+    def encode(self, data):
+        """
+        Returns the space separated words for each byte of data.
+        """
+        return ' '.join(self.words[byte] for byte in data)
+
+    def decode(self, code):
+        """
+        Returns the bytes encoded by code. Case and the whitespace between
+        words don't matter.
+
+        Raises:
+            ValueError: code contains a word that is not in the list
+        """
+        try:
+            return bytes(self._indexes[word] for word in normalize(code).split())
+        except KeyError as exc:
+            raise ValueError("Unknown mnemonic word: {}".format(exc.args[0]))
+
+
+def normalize(code):
+    """
+    Lower cases code and collapses each run of whitespace into one space.
+    """
+    return ' '.join(code.lower().split())
+
+
+_wordlist = None
+_wordlist_lock = threading.Lock()
+
+
+def get_wordlist():
+    """
+    Returns the English wordlist from RESOURCES_DIR, loading it on first use.
+    """
+    global _wordlist
+    if _wordlist is None:
+        with _wordlist_lock:
+            if _wordlist is None:
+                _wordlist = Wordlist.load(os.path.join(
+                    settings.RESOURCES_DIR, 'mnemonic_words_english.txt'))
+    return _wordlist
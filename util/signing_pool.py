@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from config import settings
+from logic.service_utils import AccountNotFoundError
+from util import attestations, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _sign_chunk(private_key, claims):
+    """
+    Signs a list of (subject, claim_type, data) tuples in a worker process.
+    Workers keep a Signer per key, so the key is only parsed once per worker.
+    Caching is left to the parent process.
+
+    A claim that can't be signed gets an error rather than failing the
+    chunk, so one bad claim doesn't lose the rest of a bulk job.
+
+    Returns:
+        list of (signature, error, error_class) tuples. Either signature is
+        None and error is the message of the error_class exception signing
+        raised, or error and error_class are None.
+    """
+    signer = attestations.get_signer(private_key)
+    results = []
+    for subject, claim_type, data in claims:
+        try:
+            signature = signer.sign(subject, claim_type, data)
+        except AccountNotFoundError as exc:
+            results.append((None, str(exc), AccountNotFoundError))
+        except (AttributeError, OverflowError, TypeError, ValueError) as exc:
+            # claim_type not a uint256, or data not a string
+            results.append((None, 'Invalid claim.', type(exc)))
+        else:
+            results.append((signature, None, None))
+    return results
+
+
+def sign_claims(private_key, claims):
+    """
+    Signs an iterable of (subject, claim_type, data) tuples on the calling
+    thread, for when there is no pool to sign them in.
+
+    Yields:
+        (signature, error) for each claim, as SigningPool.sign_many does.
+    """
+    for claim in claims:
+        signature, error, _ = _sign_chunk(private_key, [claim])[0]
+        yield signature, error
+
+
+def recover_signers(claims):
+    """
+    Recovers the signers of a list of (subject, claim_type, data, signature)
+    tuples. Runs in worker processes for SigningPool.recover_many, or
+    directly for batches too small to be worth farming out.
+
+    Returns:
+        list of (signer, error) tuples. Exactly one of the two is None.
+    """
+    results = []
+    for subject, claim_type, data, signature in claims:
+        try:
+            signer = attestations.recover_signer(
+                subject, claim_type, data, signature)
+        except (AccountNotFoundError, ValueError) as exc:
+            results.append((None, str(exc)))
+        else:
+            results.append((signer, None))
+    return results
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SigningPool(object):
+    """
+    Signs attestation claims across a pool of worker processes.
+
+    Usage example:
+      with SigningPool(private_key) as pool:
+          for signature, error in pool.sign_many(claims):
+              ...
+    """
+
+    def __init__(self, private_key, workers=None, chunk_size=256):
+        self.private_key = private_key
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def start(self):
+        """
+        Starts the worker processes now rather than on the first submit.
+        """
+        self._executor.submit(os.getpid).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def sign(self, subject, claim_type, data):
+        """
+        Signs a single claim in a worker process, blocking the calling thread
+        without holding the GIL while the worker signs.
+
+        Raises:
+            AccountNotFoundError: subject is not a checksummed address
+            AttributeError, OverflowError, TypeError, ValueError: claim_type
+                is not a uint256, or data not a string
+            BrokenProcessPool: a worker process died
+        """
+        future = self._executor.submit(
+            _sign_chunk, self.private_key, [(subject, claim_type, data)])
+        signature, error, error_class = future.result()[0]
+        if error is not None:
+            raise error_class(error)
+        return signature
+
+    def sign_many(self, claims):
+        """
+        Signs an iterable of (subject, claim_type, data) tuples.
+
+        Claims are consumed lazily and at most two chunks per worker are in
+        flight, so memory stays flat however long the input is.
+
+        Yields:
+            (signature, error) for each claim, in input order. Exactly one of
+            the two is None.
+        """
+        return ((signature, error) for signature, error, _ in
+                self._map_chunks(_sign_chunk, claims, self.private_key))
+
+    def recover_many(self, claims):
+        """
+        Recovers the signers of an iterable of
+        (subject, claim_type, data, signature) tuples, with the same flat
+        memory use as sign_many.
+
+        Yields:
+            (signer, error) for each claim, in input order. Exactly one of the
+            two is None.
+        """
+        return self._map_chunks(recover_signers, claims)
+
+    def _map_chunks(self, func, items, *args):
+        pending = deque()
+        for chunk in _chunks(items, self.chunk_size):
+            pending.append(self._executor.submit(func, *args, chunk))
+            if len(pending) >= self.workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool():
+    """
+    Creates the shared pool and starts its worker processes, when
+    SIGNING_POOL_SIZE is set. The web entry points call this before any
+    other thread runs: a worker forked from a request thread can inherit
+    locks other threads held, and hang on them.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and settings.SIGNING_POOL_SIZE:
+            _pool = SigningPool(settings.ATTESTATION_SIGNING_KEY,
+                                settings.SIGNING_POOL_SIZE)
+            _pool.start()
+    return _pool
+
+
+def get_pool():
+    """
+    Returns the shared pool the verify flows sign in, or None when
+    start_pool() didn't create one or it broke.
+    """
+    return _pool
+
+
+def _discard_pool(pool):
+    # Not replaced, as that would fork from a request thread. Claims are
+    # signed on the calling thread from then on.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool._executor.shutdown(wait=False)
+
+
+def _sign(private_key, subject, claim_type, data):
+    pool = get_pool()
+    if pool is not None and pool.private_key == private_key:
+        try:
+            return pool.sign(subject, claim_type, data)
+        except RuntimeError as exc:
+            # BrokenProcessPool, or the pool was shut down by another thread
+            logger.exception(exc)
+            _discard_pool(pool)
+    return attestations.get_signer(private_key).sign(subject, claim_type, data)
+
+
+def generate_signature(private_key, subject, claim_type, data, lookup=None):
+    """
+    Same as util.attestations.generate_signature, but signs in the shared
+    pool when one is configured for private_key. Without a pool, or if the
+    pool breaks, the claim is signed on the calling thread.
+
+    Args:
+        lookup (callable): Called on a signature cache miss, before signing.
+            Returns a known signature for the claim, or None.
+    """
+    with metrics.observed('signature.generate'):
+        return _generate_signature(private_key, subject, claim_type, data,
+                                   lookup)
+
+
+def _generate_signature(private_key, subject, claim_type, data, lookup):
+    key = attestations.signature_cache_key(private_key, subject, claim_type, data)
+    signature = attestations.signature_cache.get(key)
+    if signature is not None:
+        return signature
+    if lookup is not None:
+        signature = lookup()
+    if signature is None:
+        signature = _sign(private_key, subject, claim_type, data)
+    attestations.signature_cache.put(key, signature)
+    return signature
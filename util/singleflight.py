@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from util import metrics
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _RecentResults(object):
+    """
+    Results kept for ttl seconds after a call returns. With a fixed ttl,
+    insertion order is expiry order, so expired results are dropped from
+    the front.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._results = OrderedDict()
+
+    def get(self, key):
+        now = time.monotonic()
+        while self._results:
+            oldest = next(iter(self._results.values()))
+            if oldest[0] > now:
+                break
+            self._results.popitem(last=False)
+        entry = self._results.get(key)
+        return entry if entry is None else entry[1:]
+
+    def put(self, key, result):
+        if self.ttl:
+            self._results.pop(key, None)
+            self._results[key] = (time.monotonic() + self.ttl, result)
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key into one. The first caller
+    runs the function; callers arriving while it runs wait for it and get the
+    same result, or the same exception raised.
+
+    With ttl, a successful result is also returned to callers of the same
+    key for ttl seconds after the call. With a name, callers that joined a
+    call in flight are counted in the <name>.collapsed metric and callers
+    given a recent result in <name>.deduplicated.
+
+    Usage example:
+      flights = SingleFlight()
+      profile = flights.do(user_id, fetch_profile, user_id)
+    """
+
+    def __init__(self, name=None, ttl=0):
+        self.name = name
+        self._calls = {}
+        self._recent = _RecentResults(ttl)
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            recent = self._recent.get(key)
+            call = self._calls.get(key)
+            leader = recent is None and call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if recent is not None:
+            self._count('deduplicated')
+            return recent[0]
+        if not leader:
+            self._count('collapsed')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None:
+                    self._recent.put(key, call.result)
+            call.done.set()
+        return call.result
+
+    def _count(self, outcome):
+        if self.name:
+            metrics.counter('{}.{}'.format(self.name, outcome)).inc()
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutines, used from a single event loop.
+
+    Usage example:
+      flights = AsyncSingleFlight()
+      profile = await flights.do(user_id, fetch_profile, user_id)
+    """
+
+    async def do(self, key, func, *args, **kwargs):
+        recent = self._recent.get(key)
+        if recent is not None:
+            self._count('deduplicated')
+            return recent[0]
+        call = self._calls.get(key)
+        if call is not None:
+            self._count('collapsed')
+            # Shielded, so a caller going away doesn't cancel the call for
+            # the others
+            return await asyncio.shield(call)
+
+        call = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+        try:
+            result = await asyncio.shield(call)
+        finally:
+            del self._calls[key]
+        self._recent.put(key, result)
+        return result
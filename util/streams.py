@@ -0,0 +1,73 @@
+def normalize_bytes(data):
+    """
+    Lower cases ASCII letters, collapses each run of whitespace into a single
+    space and strips leading and trailing whitespace.
+    """
+    return b' '.join(data.lower().split())
+
+
+class StreamMatcher(object):
+    """
+    Looks for needle in a byte stream fed one chunk at a time, including
+    matches that span chunks. Only the last len(needle) - 1 bytes are kept
+    between chunks, so memory stays flat however long the stream is.
+
+    With normalize, case and the amount of whitespace between words are
+    ignored on both sides.
+    """
+
+    def __init__(self, needle, normalize=False):
+        self.normalize = normalize
+        self.needle = normalize_bytes(needle) if normalize else needle
+        self.found = False
+        self.bytes_read = 0
+        self._tail = b''
+        self._after_space = False
+
+    def feed(self, chunk):
+        """
+        Returns True once needle has been seen; later chunks are ignored.
+        """
+        if not self.found:
+            self.bytes_read += len(chunk)
+            if self.normalize:
+                chunk = self._normalize(chunk)
+            window = self._tail + chunk
+            if self.needle in window:
+                self.found = True
+                self._tail = b''
+            elif len(self.needle) > 1:
+                self._tail = window[1 - len(self.needle):]
+        return self.found
+
+    def _normalize(self, chunk):
+        # bytes.split runs in C, unlike a regular expression substitution,
+        # so only the whitespace at the chunk edges needs handling here
+        words = chunk.lower().split()
+        normalized = b' '.join(words)
+        if chunk[:1].isspace() and not self._after_space:
+            normalized = b' ' + normalized
+        if chunk[-1:].isspace() and words:
+            normalized += b' '
+        if normalized:
+            self._after_space = normalized.endswith(b' ')
+        return normalized
+
+
+def response_contains(response, needle, chunk_size=16 * 1024, normalize=False):
+    """
+    Reads a streamed requests response until needle is found or the body
+    ends, then closes it. Compressed bodies are decompressed as they are
+    read.
+
+    Returns:
+        StreamMatcher, with found and the number of decoded bytes read.
+    """
+    matcher = StreamMatcher(needle, normalize)
+    try:
+        for chunk in response.iter_content(chunk_size):
+            if matcher.feed(chunk):
+                break
+    finally:
+        response.close()
+    return matcher
@@ -0,0 +1,146 @@
+"""
+Celery app and background tasks, run by the `worker` and `beat` processes in
+the Procfile.
+
+Slow side effects of a request are queued here rather than run on the
+request thread: SendGrid sends and attestation writes. Beat
+schedules the IPFS pin reconciliation from tools/ipfs_pinner.py, and the
+creation and retention of monthly attestation partitions.
+
+Unless BACKGROUND_TASKS is set, tasks run eagerly: .delay() runs the task
+on the calling thread and raises its exceptions, exactly like calling the
+function. Each run is timed in the task.<name> timer, and failures are
+counted in task.<name>.failure.
+"""
+import logging
+from datetime import timedelta
+
+from celery import Celery, Task
+from flask import has_app_context
+
+from config import settings
+from database import db
+from database.models import Attestation, AttestationTypes
+from logic.attestation_query_service import attestations_changed
+from util import email_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+celery = Celery('tasks', broker=settings.CELERY_BROKER_URL)
+celery.conf.update(
+    task_always_eager=not settings.BACKGROUND_TASKS,
+    task_eager_propagates=True,
+    task_serializer='json',
+    accept_content=['json'],
+    # Tasks talk to slow third parties, don't let one worker hoard a backlog
+    worker_prefetch_multiplier=1,
+    task_ignore_result=True,
+    beat_schedule={
+        'reconcile-ipfs-pins': {
+            'task': 'util.tasks.reconcile_ipfs_pins',
+            'schedule': timedelta(seconds=settings.IPFS_PIN_INTERVAL),
+        },
+        'maintain-attestation-partitions': {
+            'task': 'util.tasks.maintain_attestation_partitions',
+            'schedule': timedelta(days=1),
+        },
+    },
+)
+
+_flask_app = None
+
+
+def init_app(app):
+    """
+    Sets the Flask app tasks run in the app context of.
+    """
+    global _flask_app
+    _flask_app = app
+
+
+def flask_app():
+    if _flask_app is None:
+        # In the worker, configure the app as the web process does
+        from app import app
+        from app import app_config
+        app_config.init_prod_app(app)
+    return _flask_app
+
+
+class AppTask(Task):
+    """
+    Runs in a Flask app context, for the database session and settings, and
+    records task timing metrics.
+    """
+
+    def __call__(self, *args, **kwargs):
+        name = 'task.' + self.name.rsplit('.', 1)[-1]
+        try:
+            with metrics.timed(name):
+                if has_app_context():
+                    return super().__call__(*args, **kwargs)
+                with flask_app().app_context():
+                    return super().__call__(*args, **kwargs)
+        except Exception:
+            metrics.counter(name + '.failure').inc()
+            if not self.request.is_eager:
+                logger.exception("Task %s failed", self.name)
+            raise
+
+
+@celery.task(base=AppTask)
+def send_email(request_body):
+    """
+    Sends a mail, given as the body of a SendGrid mail send request.
+    """
+    email_queue.get_transport().send(request_body)
+
+
+@celery.task(base=AppTask)
+def store_attestation(method, eth_address, value, signature,
+                      remote_ip_address, signer=None):
+    """
+    Writes the row for a signed attestation, method being the name of its
+    AttestationTypes member and signer the address of the key that signed
+    it. Tasks queued before signer was added don't pass it.
+    """
+    db.session.add(Attestation(
+        method=AttestationTypes[method],
+        eth_address=eth_address,
+        value=value,
+        signature=signature,
+        remote_ip_address=remote_ip_address,
+        signer=signer
+    ))
+    with metrics.observed('db.commit', task='store_attestation'):
+        db.session.commit()
+    # Only once committed, or a page read in between would be cached without
+    # the attestation
+    attestations_changed(eth_address)
+
+
+@celery.task(base=AppTask)
+def reconcile_ipfs_pins(dry_run=False):
+    from tools import ipfs_pinner
+    ipfs_pinner.scan_listings(dry_run)
+
+
+@celery.task(base=AppTask)
+def maintain_attestation_partitions():
+    """
+    Creates the monthly attestation partitions of the next
+    ATTESTATION_PARTITIONS_AHEAD months, and drops those older than
+    ATTESTATION_RETENTION_MONTHS when it is set. Uses the functions created
+    by migration c4e8a1f0b9d2.
+    """
+    created = db.session.execute(
+        'SELECT attestation_create_partitions(:months)',
+        {'months': settings.ATTESTATION_PARTITIONS_AHEAD}).scalar()
+    dropped = 0
+    if settings.ATTESTATION_RETENTION_MONTHS:
+        dropped = db.session.execute(
+            'SELECT attestation_drop_partitions(:months)',
+            {'months': settings.ATTESTATION_RETENTION_MONTHS}).scalar()
+    db.session.commit()
+    logger.info("Created %d and dropped %d attestation partitions",
+                created, dropped)
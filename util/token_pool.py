@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from util import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenPool(object):
+    """
+    Single use tokens fetched ahead of time by a background thread, so a
+    request can take one without waiting on the round trip that creates it.
+
+    Up to size tokens are kept. A token older than max_age seconds is dropped
+    unused, and the pool is topped up whenever a token is taken or dropped.
+    Depth, hits, misses and the hit rate are reported as metrics under name.
+
+    Usage example:
+      pool = TokenPool(fetch_token, 10, 300, 'twitter.request_token_pool')
+      pool.start()
+      token = pool.get() or fetch_token()
+    """
+
+    def __init__(self, fetch, size, max_age, name, retry_delay=5):
+        self.fetch = fetch
+        self.size = size
+        self.max_age = max_age
+        self.name = name
+        self.retry_delay = retry_delay
+        self._tokens = deque()
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refill, name=self.name, daemon=True)
+                self._thread.start()
+        self._wanted.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wanted.set()
+
+    def get(self):
+        """
+        Returns the oldest unexpired token, or None when the pool is empty.
+        Never waits for a fetch.
+        """
+        with self._lock:
+            self._expire()
+            token = self._tokens.popleft()[1] if self._tokens else None
+            depth = len(self._tokens)
+        self._wanted.set()
+
+        hits = metrics.counter(self.name + '.hit')
+        misses = metrics.counter(self.name + '.miss')
+        (hits if token is not None else misses).inc()
+        metrics.gauge(self.name + '.hit_rate').set(
+            hits.value / (hits.value + misses.value))
+        metrics.gauge(self.name + '.depth').set(depth)
+        return token
+
+    def _expire(self):
+        oldest = time.monotonic() - self.max_age
+        while self._tokens and self._tokens[0][0] <= oldest:
+            self._tokens.popleft()
+            metrics.counter(self.name + '.expired').inc()
+
+    def _refill(self):
+        while not self._stopped.is_set():
+            # Also wake up in time to replace tokens before they expire
+            self._wanted.wait(timeout=self.max_age / 2)
+            self._wanted.clear()
+            while not self._stopped.is_set():
+                with self._lock:
+                    self._expire()
+                    depth = len(self._tokens)
+                metrics.gauge(self.name + '.depth').set(depth)
+                if depth >= self.size:
+                    break
+                try:
+                    token = self.fetch()
+                except Exception as exc:
+                    logger.warning("Could not fetch a token for %s: %s",
+                                   self.name, exc)
+                    metrics.counter(self.name + '.fetch_error').inc()
+                    self._stopped.wait(self.retry_delay)
+                    continue
+                with self._lock:
+                    self._tokens.append((time.monotonic(), token))
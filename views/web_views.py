@@ -1,6 +1,7 @@
-from flask import render_template
+from flask import Response, abort, render_template, request
 
 from app import app
+from util import metrics
 
 
 @app.route('/')
@@ -16,3 +17,12 @@ def facebook():
 @app.route('/redirects/twitter/')
 def twitter():
     return render_template('redirects/twitter.html')
+
+
+@app.route('/metrics')
+def metrics_exposition():
+    """Every metric in the Prometheus text format, for scraping."""
+    if not metrics.scrape_allowed(request.headers.get('Authorization')):
+        abort(401)
+    return Response(metrics.exposition(),
+                    content_type=metrics.EXPOSITION_CONTENT_TYPE)